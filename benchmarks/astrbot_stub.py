@@ -0,0 +1,114 @@
+"""压测和回放使用的最小 AstrBot 接口替身
+
+只实现插件用到的部分: 命令装饰器、消息事件、消息链、Context 和 Star 基类。
+install() 把替身注册为 astrbot.api.* 模块，之后才能导入插件的 main.py；
+真实的 AstrBot 已安装时不要调用。
+"""
+import sys
+import types
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+
+class PermissionType(Enum):
+    ADMIN = 'admin'
+    MEMBER = 'member'
+
+
+class _Filter:
+    """记录命令名和权限，不做任何路由"""
+
+    PermissionType = PermissionType
+
+    @staticmethod
+    def command(name: str):
+        def decorator(func):
+            func.__command__ = name
+            return func
+        return decorator
+
+    @staticmethod
+    def permission_type(permission: PermissionType):
+        def decorator(func):
+            func.__permission__ = permission
+            return func
+        return decorator
+
+
+filter = _Filter()
+
+
+class MessageChain:
+    def __init__(self):
+        self.parts: List[str] = []
+
+    def message(self, text: str) -> 'MessageChain':
+        self.parts.append(text)
+        return self
+
+    def __str__(self) -> str:
+        return ''.join(self.parts)
+
+
+class AstrMessageEvent:
+    """一条消息事件，plain_result 直接返回文本"""
+
+    def __init__(self, user_id: str, message_str: str, nickname: Optional[str] = None,
+                 platform: str = 'bench', group_id: Optional[str] = None):
+        self.user_id = user_id
+        self.message_str = message_str
+        self.nickname = nickname
+        self.platform = platform
+        self.group_id = group_id
+        self.unified_msg_origin = f"{platform}:{'GroupMessage' if group_id else 'FriendMessage'}:{group_id or user_id}"
+
+    def get_sender_id(self) -> str:
+        return self.user_id
+
+    def get_sender_name(self) -> Optional[str]:
+        return self.nickname
+
+    def get_platform_name(self) -> str:
+        return self.platform
+
+    def get_group_id(self) -> Optional[str]:
+        return self.group_id
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+
+class Context:
+    """记录主动推送的消息"""
+
+    def __init__(self):
+        self.sent: List[Tuple[str, str]] = []
+
+    async def send_message(self, origin: str, chain: MessageChain) -> bool:
+        self.sent.append((origin, str(chain)))
+        return True
+
+
+class Star:
+    def __init__(self, context: Context):
+        self.context = context
+
+
+def register(*args, **kwargs):
+    def decorator(cls):
+        return cls
+    return decorator
+
+
+def install() -> None:
+    """把替身注册为 astrbot.api.event 和 astrbot.api.star"""
+    modules: Dict[str, types.ModuleType] = {}
+    for name in ('astrbot', 'astrbot.api', 'astrbot.api.event', 'astrbot.api.star'):
+        modules[name] = sys.modules.get(name) or types.ModuleType(name)
+    event = modules['astrbot.api.event']
+    event.filter, event.AstrMessageEvent, event.MessageChain = filter, AstrMessageEvent, MessageChain
+    star = modules['astrbot.api.star']
+    star.Context, star.Star, star.register = Context, Star, register
+    modules['astrbot'].api = modules['astrbot.api']
+    modules['astrbot.api'].event, modules['astrbot.api'].star = event, star
+    sys.modules.update(modules)
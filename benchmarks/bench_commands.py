@@ -0,0 +1,239 @@
+"""命令级基准测试
+
+在插件目录下运行:
+    python benchmarks/bench_commands.py --users 10000 --engine sqlite
+    python benchmarks/bench_commands.py --users 10000 --engine sqlite --save-baseline
+
+在临时目录中生成合成用户，通过 AstrBot 替身逐条调用插件的命令处理函数，
+输出每个场景的吞吐、p50/p99延迟、每条命令的SQL语句数和写事务数，
+并与 benchmarks/baselines/ 中同引擎同规模的基线比较，超出容差时返回非0。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import sqlite3
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+import harness
+from astrbot_stub import AstrMessageEvent
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# 场景名 -> (插件处理函数, 消息文本, 每次是否换一个用户)
+# 钓鱼和签到有冷却/每日一次的限制，同一用户重复执行只会走到提前返回的分支
+COMMAND_SCENARIOS = {
+    '钓鱼签到': ('daily_check_in', '钓鱼签到', True),
+    '钓鱼': ('fishing', '钓鱼', True),
+    '鱼塘': ('fish_pond', '鱼塘', False),
+    '全部卖出': ('sell_all_fish', '全部卖出', True),
+}
+# 自动钓鱼最先执行，否则开启自动钓鱼的用户可能已在钓鱼场景中进入冷却
+SCENARIOS = ['自动钓鱼'] + list(COMMAND_SCENARIOS)
+
+
+class QueryCounter:
+    """通过SQLite的trace回调统计当前线程连接执行的语句数，触发器不计为单独的语句"""
+
+    def __init__(self):
+        self.queries = 0
+        self.last: Optional[str] = None
+        self.is_trigger_trace = harness.plugin_module('fishing.sql_profiler').is_trigger_trace
+
+    def __call__(self, statement: str) -> None:
+        if self.is_trigger_trace(self.last, statement):
+            return
+        self.last = statement
+        if not statement.lstrip().upper().startswith(('BEGIN', 'COMMIT', 'ROLLBACK')):
+            self.queries += 1
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+def write_count(db) -> int:
+    return sum(stats['count'] for stats in db.lock_stats.snapshot().values())
+
+
+async def measure(ops: List[Callable], db, counter: Optional[QueryCounter]) -> Dict:
+    """依次执行ops，统计延迟、语句数和写事务数"""
+    latencies = []
+    queries_before = counter.queries if counter else 0
+    writes_before = write_count(db)
+    started = time.perf_counter()
+    for op in ops:
+        op_started = time.perf_counter()
+        await op()
+        latencies.append(time.perf_counter() - op_started)
+    duration = time.perf_counter() - started
+    count = len(ops)
+    return {
+        'count': count,
+        'throughput': count / duration if duration else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries': (counter.queries - queries_before) / count if counter else None,
+        'commits': (write_count(db) - writes_before) / count,
+    }
+
+
+def command_op(plugin, handler: str, event: AstrMessageEvent) -> Callable:
+    async def op():
+        async for _ in getattr(plugin, handler)(event):
+            pass
+    return op
+
+
+def auto_tick_op(system, user_id: str) -> Callable:
+    async def op():
+        system._auto_fish_once(user_id)
+    return op
+
+
+async def run_scenarios(plugin, scenarios: List[str], users: int, iterations: int, seed: int) -> Dict[str, Dict]:
+    system = plugin.fishing_system
+    db = system.db
+    counter = None
+    if hasattr(db, '_get_cached_connection'):
+        # 命令在调用线程中同步执行，只需跟踪当前线程的连接
+        counter = QueryCounter()
+        db._get_cached_connection().set_trace_callback(counter)
+
+    rng = random.Random(seed)
+    results = {}
+    for name in scenarios:
+        if name == '自动钓鱼':
+            # 每个到期用户只执行一次，重复执行只会因冷却而顺延，最多执行自动钓鱼用户数次
+            auto_users = sorted(user_id for user_id, _ in db.get_auto_fishing_schedule())
+            picked = rng.sample(auto_users, min(iterations, len(auto_users)))
+            ops = [auto_tick_op(system, user_id) for user_id in picked]
+        else:
+            handler, message, distinct = COMMAND_SCENARIOS[name]
+            if distinct and iterations <= users:
+                picked = [harness.user_id(i) for i in rng.sample(range(users), iterations)]
+            else:
+                picked = [harness.user_id(rng.randrange(users)) for _ in range(iterations)]
+            ops = [command_op(plugin, handler, AstrMessageEvent(user_id, message, nickname=user_id))
+                   for user_id in picked]
+        if ops:
+            results[name] = await measure(ops, db, counter)
+    return results
+
+
+def format_results(results: Dict[str, Dict], baseline: Optional[Dict] = None) -> List[str]:
+    lines = [f"{'场景':<8}{'次数':>8}{'吞吐(次/秒)':>14}{'p50(ms)':>10}{'p99(ms)':>10}{'查询/次':>9}{'提交/次':>9}"]
+    for name, stats in results.items():
+        queries = '-' if stats['queries'] is None else f"{stats['queries']:.2f}"
+        lines.append(f"{name:<8}{stats['count']:>10}{stats['throughput']:>14.0f}{stats['p50_ms']:>10.3f}"
+                     f"{stats['p99_ms']:>10.3f}{queries:>11}{stats['commits']:>11.2f}")
+        base = (baseline or {}).get(name)
+        if base:
+            lines.append(f"{'  基线':<8}{'':>10}{base['throughput']:>14.0f}{base['p50_ms']:>10.3f}"
+                         f"{base['p99_ms']:>10.3f}"
+                         f"{'-' if base['queries'] is None else format(base['queries'], '.2f'):>11}"
+                         f"{base['commits']:>11.2f}")
+    return lines
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """延迟和吞吐超出容差、或每条命令的语句数/写事务数增加时视为退化"""
+    problems = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # p99受偶发停顿影响较大，容差加倍
+        for key, allowed in (('p50_ms', tolerance), ('p99_ms', tolerance * 2)):
+            if stats[key] > base[key] * (1 + allowed):
+                problems.append(f"{name} {key} {stats[key]:.3f} > 基线 {base[key]:.3f}")
+        if stats['throughput'] < base['throughput'] / (1 + tolerance):
+            problems.append(f"{name} 吞吐 {stats['throughput']:.0f} < 基线 {base['throughput']:.0f}")
+        for key in ('queries', 'commits'):
+            if stats[key] is not None and base[key] is not None and stats[key] > base[key] + 0.01:
+                problems.append(f"{name} {key}/次 {stats[key]:.2f} > 基线 {base[key]:.2f}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="钓鱼插件命令基准测试")
+    parser.add_argument('--users', type=int, default=1000, help="合成用户数(1千到1百万)")
+    parser.add_argument('--engine', choices=('sqlite', 'memory'), default='sqlite')
+    parser.add_argument('--iterations', type=int, default=1000, help="每个场景执行的命令数")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="逗号分隔的场景")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', help="基线文件，默认 baselines/<引擎>-<用户数>.json")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.3, help="p50和吞吐允许的相对退化，p99为两倍")
+    parser.add_argument('--keep', action='store_true', help="保留临时数据目录")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {'、'.join(unknown)}，可选 {'、'.join(SCENARIOS)}")
+    logging.basicConfig(level=logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='fishing-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        overrides = {'storage': {'engine': args.engine}, 'rng': {'seed': args.seed}}
+        started = time.perf_counter()
+        population = harness.populate(harness.plugin_config(overrides), args.users, args.seed)
+        print(f"生成 {population['users']} 个用户({population['auto_users']}个自动钓鱼)、"
+              f"{population['fish']} 条鱼，耗时{time.perf_counter() - started:.1f}秒，数据目录 {workdir}")
+
+        plugin = harness.create_plugin(overrides)
+        try:
+            results = asyncio.run(run_scenarios(plugin, scenarios, args.users, args.iterations, args.seed))
+        finally:
+            asyncio.run(plugin.terminate())
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.engine}-{args.users}.json")
+    baseline = None
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    print(f"引擎 {args.engine}，{args.users} 个用户，Python {platform.python_version()}，SQLite {sqlite3.sqlite_version}")
+    for line in format_results(results, baseline):
+        print(line)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'engine': args.engine, 'users': args.users, 'iterations': args.iterations,
+                'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存: {baseline_path}")
+        return 0
+    if baseline is None:
+        print(f"没有基线 {baseline_path}，使用 --save-baseline 保存")
+        return 0
+    problems = find_regressions(results, baseline, args.tolerance)
+    if problems:
+        print("❌ 相对基线退化:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print(f"✅ 未超出基线容差({args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
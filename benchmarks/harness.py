@@ -0,0 +1,155 @@
+"""在 AstrBot 之外加载插件，并生成合成用户数据
+
+插件目录以 fishing_plugin 包名导入，main.py 中的相对导入与在 AstrBot 中加载时相同；
+加载前会先注册 astrbot_stub 中的接口替身。插件的数据目录 data/ 相对于当前工作目录，
+调用方应先切换到临时目录。
+"""
+import os
+import sys
+import time
+import types
+import random
+import importlib
+from typing import Dict, List, Optional
+
+import astrbot_stub
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = 'fishing_plugin'
+
+# 压测时关闭后台任务和限流，命令在调用线程中同步执行，结果和耗时只取决于命令本身
+BENCH_CONFIG = {
+    'auto_fishing_enabled': False,
+    'admission': {'enabled': False},
+    'backup': {'enabled': False},
+    'warm_start': {'enabled': False},
+    'ledger': {'reconcile_interval': 0},
+    'auto_fishing_digest': {'push_interval': 0},
+    'rng': {'seed': 0},
+}
+
+
+def plugin_module(name: str) -> types.ModuleType:
+    """导入插件中的模块，例如 plugin_module('main')、plugin_module('fishing.db')"""
+    if PACKAGE not in sys.modules:
+        astrbot_stub.install()
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [PLUGIN_DIR]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def merge_config(base: Dict, overrides: Dict) -> Dict:
+    """递归合并配置，overrides中的值优先"""
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def create_plugin(overrides: Optional[Dict] = None):
+    """创建插件实例，配置为插件默认配置 + BENCH_CONFIG + overrides"""
+    main = plugin_module('main')
+    config = merge_config(BENCH_CONFIG, overrides or {})
+
+    class BenchPlugin(main.FishingPlugin):
+        def load_config(self) -> Dict:
+            return merge_config(super().load_config(), config)
+
+    return BenchPlugin(astrbot_stub.Context())
+
+
+def plugin_config(overrides: Optional[Dict] = None) -> Dict:
+    """插件在当前目录下会使用的完整配置，不创建插件"""
+    main = plugin_module('main')
+    plugin = main.FishingPlugin.__new__(main.FishingPlugin)
+    plugin.data_dir = "data/"
+    return merge_config(main.FishingPlugin.load_config(plugin), merge_config(BENCH_CONFIG, overrides or {}))
+
+
+def user_id(index: int) -> str:
+    return f"u{index:07d}"
+
+
+def populate(config: Dict, users: int, seed: int = 0, auto_ratio: float = 0.1) -> Dict:
+    """在插件启动前写入合成用户
+    Args:
+        config: 插件配置，决定存储引擎和文件位置
+        users: 用户数
+        seed: 随机种子，相同种子生成相同的数据
+        auto_ratio: 开启自动钓鱼的用户比例
+    Returns:
+        生成的数据规模统计
+    每个用户有200~5000金币和1~4种鱼，每种1~8条并带有逐条重量记录。
+    """
+    storage = plugin_module('fishing.storage')
+    catalog_module = plugin_module('fishing.catalog')
+    catches_module = plugin_module('fishing.catches')
+
+    os.makedirs(os.path.dirname(config['database']) or '.', exist_ok=True)
+    db = storage.create_storage(config)
+    catalog = catalog_module.FishCatalog(config['catalog'].get('path'), config['catalog']['cache'], 0)
+    db.initialize_fish_types(catalog.rows(), catalog.digest)
+    species = [fish for rarity in sorted(catalog.by_rarity) if rarity <= 3 for fish in catalog.by_rarity[rarity]]
+
+    rng = random.Random(seed)
+    now = time.time()
+    stats = {'users': users, 'auto_users': 0, 'species_rows': 0, 'fish': 0}
+    bulk = db.__class__.__name__ == 'FishingDB'
+    batch: Dict[str, List] = {'users': [], 'ledger': [], 'fish': [], 'catches': []}
+
+    for index in range(users):
+        uid = user_id(index)
+        coins = rng.randint(200, 5000)
+        auto = rng.random() < auto_ratio
+        stats['auto_users'] += auto
+        if bulk:
+            batch['users'].append((uid, coins, 1 if auto else 0))
+            batch['ledger'].append((uid, coins, 'initial', now))
+        else:
+            db.get_user_coins(uid)
+            db.update_user_coins(uid, coins - db.INITIAL_COINS, 'populate')
+            if auto:
+                db.set_auto_fishing_status(uid, True)
+
+        for fish in rng.sample(species, rng.randint(1, 4)):
+            quantity = rng.randint(1, 8)
+            stats['species_rows'] += 1
+            stats['fish'] += quantity
+            catches = catches_module.CatchSet()
+            for _ in range(quantity):
+                weight = rng.randint(fish['min_weight'], fish['max_weight'])
+                if bulk:
+                    catches.add(weight, now, db.max_specimens)
+                else:
+                    db.add_fish_to_pond(uid, fish['id'], weight, now)
+            if bulk:
+                batch['fish'].append((uid, fish['id'], quantity))
+                batch['catches'].append((uid, fish['id']) + catches.to_row())
+
+        if bulk and len(batch['users']) >= 10000:
+            _insert_batch(db, batch)
+    if bulk:
+        _insert_batch(db, batch)
+    db.close()
+    return stats
+
+
+def _insert_batch(db, batch: Dict[str, List]) -> None:
+    """SQLite引擎直接批量插入，百万用户时比逐条调用存储接口快两个数量级"""
+    with db._write('populate') as conn:
+        conn.executemany("INSERT INTO user_fishing (user_id, coins, auto_fishing) VALUES (?, ?, ?)",
+                         batch['users'])
+        conn.executemany("INSERT INTO coin_ledger (user_id, delta, reason, created_at) VALUES (?, ?, ?, ?)",
+                         batch['ledger'])
+        conn.executemany("INSERT INTO user_fish (user_id, fish_id, quantity, no_sell_until) VALUES (?, ?, ?, 0)",
+                         batch['fish'])
+        conn.executemany('''
+            INSERT INTO user_catches (user_id, fish_id, weights, times, bulk_count, bulk_weight)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', batch['catches'])
+    for rows in batch.values():
+        rows.clear()
@@ -0,0 +1,178 @@
+"""按记录的命令流量回放，重现线上的命令组合和峰值
+
+在插件目录下运行:
+    python benchmarks/replay.py data/traffic/traffic.log data/fishing.db --speed 1
+    python benchmarks/replay.py data/traffic/traffic.log data/fishing.db --speed 20 --admission
+
+先把数据库(内存引擎为 .snapshot 快照)复制到临时目录，再通过 AstrBot 替身按记录的时间间隔
+调用插件的命令处理函数，--speed 为加速倍数，0表示不等待、尽快执行。
+记录文件旁有 .salt 密钥时，匿名用户会对应回数据库副本中的用户，否则全部视为新用户。
+冷却和每日签到按真实时间计算，加速回放时同一用户的连续命令更容易落在冷却期内。
+输出每种命令的响应时间(从计划时间到完成，含排队)和执行时间分布。
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import sqlite3
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import harness
+from astrbot_stub import AstrMessageEvent
+
+
+def copy_database(source: str, config: Dict) -> str:
+    """复制数据库到插件在当前目录下使用的位置，SQLite用在线备份接口，不影响正在运行的插件"""
+    storage = harness.plugin_module('fishing.storage')
+    target = storage.storage_path(config)
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    if config['storage']['engine'] == 'memory':
+        shutil.copyfile(source, target)
+        return target
+    src = sqlite3.connect(f"file:{os.path.abspath(source)}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    return target
+
+
+def command_handlers(plugin) -> Dict[str, str]:
+    """命令名 -> 处理函数名，不回放管理员命令"""
+    handlers = {}
+    for name in dir(type(plugin)):
+        func = getattr(type(plugin), name)
+        command = getattr(func, '__command__', None)
+        if command and getattr(func, '__permission__', None) is None:
+            handlers[command] = name
+    return handlers
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+async def replay(plugin, records: List[Tuple[float, str, str, str]], speed: float,
+                 user_map: Dict[str, str]) -> Tuple[Dict[str, List[Tuple[float, float]]], Dict[str, int], float]:
+    """按时间间隔派发记录的命令
+    Returns:
+        (命令 -> [(响应时间, 执行时间)], 跳过的命令 -> 次数, 实际耗时)
+    """
+    handlers = command_handlers(plugin)
+    timings: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+    skipped: Dict[str, int] = defaultdict(int)
+    tasks = []
+
+    async def run(handler: str, event: AstrMessageEvent, command: str, scheduled: float) -> None:
+        started = time.perf_counter()
+        async for _ in getattr(plugin, handler)(event):
+            pass
+        finished = time.perf_counter()
+        timings[command].append((finished - scheduled, finished - started))
+
+    start = time.perf_counter()
+    first = records[0][0] if records else 0
+    for timestamp, user, command, args in records:
+        handler = handlers.get(command)
+        if handler is None:
+            skipped[command] += 1
+            continue
+        scheduled = start + (timestamp - first) / speed if speed > 0 else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        event = AstrMessageEvent(user_map.get(user, user), f"{command} {args}".strip())
+        tasks.append(asyncio.create_task(run(handler, event, command, scheduled)))
+        # 让出事件循环: 未启用准入控制时命令在这里同步执行完，启用时进入线程池并发执行
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return timings, skipped, time.perf_counter() - start
+
+
+def format_timings(timings: Dict[str, List[Tuple[float, float]]]) -> List[str]:
+    lines = [f"{'命令':<8}{'次数':>8}{'响应p50':>10}{'p90':>9}{'p99':>9}{'最大':>9}{'执行p50':>10}{'执行p99':>9}  (ms)"]
+    everything = [timing for values in timings.values() for timing in values]
+    rows = sorted(timings.items(), key=lambda item: -len(item[1])) + [('合计', everything)]
+    for command, values in rows:
+        response = [value[0] * 1000 for value in values]
+        service = [value[1] * 1000 for value in values]
+        lines.append(f"{command:<8}{len(values):>10}{percentile(response, 0.5):>12.2f}"
+                     f"{percentile(response, 0.9):>9.2f}{percentile(response, 0.99):>9.2f}{max(response):>9.2f}"
+                     f"{percentile(service, 0.5):>12.2f}{percentile(service, 0.99):>9.2f}")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="回放记录的命令流量")
+    parser.add_argument('traffic', help="命令记录文件，自动包含其轮转文件")
+    parser.add_argument('database', help="数据库文件(内存引擎为 .snapshot 快照)，回放在副本上进行")
+    parser.add_argument('--speed', type=float, default=1.0, help="加速倍数，0表示尽快执行")
+    parser.add_argument('--engine', choices=('sqlite', 'memory'),
+                        help="存储引擎，默认按数据库扩展名判断")
+    parser.add_argument('--limit', type=int, default=0, help="最多回放的命令数，0表示全部")
+    parser.add_argument('--admission', action='store_true', help="启用插件的准入控制，命令在线程池中并发执行")
+    parser.add_argument('--keep', action='store_true', help="保留临时数据目录")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    recorder = harness.plugin_module('fishing.recorder')
+    records = list(recorder.read_records(os.path.abspath(args.traffic)))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print(f"❌ {args.traffic} 中没有命令记录")
+        return 1
+    salt = recorder.load_salt(os.path.abspath(args.traffic))
+    engine = args.engine or ('memory' if args.database.endswith('.snapshot') else 'sqlite')
+    source = os.path.abspath(args.database)
+
+    workdir = tempfile.mkdtemp(prefix='fishing-replay-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        overrides = {'storage': {'engine': engine}, 'rng': {'seed': None},
+                     'admission': {'enabled': args.admission}}
+        copy_database(source, harness.plugin_config(overrides))
+        plugin = harness.create_plugin(overrides)
+        user_map = {}
+        if salt:
+            users = [row['user_id'] for row in plugin.db.get_top_users_by_coins(2 ** 62)]
+            user_map = recorder.deanonymize_map(salt, users)
+        try:
+            timings, skipped, duration = asyncio.run(replay(plugin, records, args.speed, user_map))
+        finally:
+            asyncio.run(plugin.terminate())
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    span = records[-1][0] - records[0][0]
+    replayed = sum(len(values) for values in timings.values())
+    recorded_users = {record[1] for record in records}
+    matched = sum(1 for user in recorded_users if user in user_map)
+    print(f"回放 {replayed} 条命令(记录跨度{span:.0f}秒)，耗时{duration:.1f}秒，"
+          f"{replayed / duration if duration else 0:.0f}条/秒，{args.speed or '不限'}倍速")
+    print(f"记录中 {len(recorded_users)} 个用户，{matched} 个对应到数据库副本中的用户"
+          + ("" if salt else "(缺少 .salt 密钥，全部视为新用户)"))
+    if skipped:
+        print("跳过: " + "、".join(f"{command} x{count}" for command, count in skipped.items()))
+    for line in format_timings(timings):
+        print(line)
+    if args.admission:
+        rejections = plugin.admission.get_stats()['rejections']
+        if rejections:
+            print("准入拒绝: " + "、".join(f"{key} x{count}" for key, count in rejections.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""多进程并发写同一个数据库文件的压力测试
+
+在插件目录下运行:
+    python benchmarks/stress_db.py --processes 8 --ops 500
+
+每个进程各自打开 FishingDB，对同一批用户随机执行加鱼、卖鱼、金币变动和签到，另有一个进程在写入期间
+反复增量对账。结束后核对金币余额、鱼塘数量和金币流水是否与各进程记录的变动一致，
+并发对账没有写入调整流水，并输出各操作的等锁统计。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fishing.db import FishingDB  # noqa: E402
+from fishing.contention import LockStats, WAIT_BUCKETS  # noqa: E402
+
+FISH_ID = 1
+FISH_WEIGHT = (100, 500)
+
+
+def worker(db_path: str, index: int, ops: int, users: int, retry: Dict) -> Tuple[Dict, Dict, Dict, int]:
+    """执行ops次随机操作，返回 (等锁统计, 用户 -> 金币变动, 用户 -> 鱼数变动, 失败次数)"""
+    db = FishingDB(db_path, {'db_retry': retry})
+    rng = random.Random(index)
+    coins: Dict[str, int] = {}
+    fish: Dict[str, int] = {}
+    errors = 0
+    for step in range(ops):
+        user_id = f"user{rng.randrange(users)}"
+        action = rng.random()
+        try:
+            if action < 0.4:
+                db.add_fish_to_pond(user_id, FISH_ID, rng.randint(*FISH_WEIGHT))
+                fish[user_id] = fish.get(user_id, 0) + 1
+            elif action < 0.6:
+                if db.remove_fish_from_pond(user_id, FISH_ID, 1) is not None:
+                    fish[user_id] = fish.get(user_id, 0) - 1
+            elif action < 0.9:
+                db.get_user_coins(user_id)
+                amount = rng.randint(-20, 50)
+                db.update_user_coins(user_id, amount, 'stress')
+                coins[user_id] = coins.get(user_id, 0) + amount
+            else:
+                db.set_check_in_bit(user_id, 2000 + index, step % 366)
+        except Exception:
+            errors += 1
+    return db.lock_stats.snapshot(), coins, fish, errors
+
+
+def reconciler(db_path: str, retry: Dict, ready, stop, rounds) -> None:
+    """写入进行期间反复对账，金币变动与流水在同一事务中提交，不应出现需要调整的用户"""
+    db = FishingDB(db_path, {'db_retry': retry})
+    ready.set()
+    while not stop.wait(0.005):
+        try:
+            db.reconcile_coins()
+        except Exception:
+            continue
+        rounds.value += 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="多进程写入 fishing.db 的压力测试")
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=500, help="每个进程执行的操作数")
+    parser.add_argument('--users', type=int, default=20, help="争用的用户数，越少冲突越多")
+    parser.add_argument('--db', help="数据库路径，默认使用临时目录")
+    parser.add_argument('--max-attempts', type=int, default=20)
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='fishing-stress-'), 'fishing.db')
+    setup = FishingDB(db_path)
+    with setup._write('setup') as conn:
+        conn.execute('''
+            INSERT OR IGNORE INTO fish_config (id, name, rarity, base_value, min_weight, max_weight, habitat)
+            VALUES (?, '压测鱼', 1, 10, ?, ?, '淡水')
+        ''', (FISH_ID,) + FISH_WEIGHT)
+    for index in range(args.users):
+        setup.get_user_coins(f"user{index}")
+    setup.reconcile_coins()
+
+    retry = {'max_attempts': args.max_attempts}
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Event(), context.Event()
+    rounds = context.Value('i', 0)
+    checker = context.Process(target=reconciler, args=(db_path, retry, ready, stop, rounds))
+    checker.start()
+    ready.wait()
+    started = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(worker, [(db_path, index, args.ops, args.users, retry)
+                                        for index in range(args.processes)])
+    duration = time.perf_counter() - started
+    stop.set()
+    checker.join()
+
+    expected_coins: Dict[str, int] = {}
+    expected_fish: Dict[str, int] = {}
+    errors = 0
+    for _, coins, fish, worker_errors in results:
+        errors += worker_errors
+        for user_id, amount in coins.items():
+            expected_coins[user_id] = expected_coins.get(user_id, 0) + amount
+        for user_id, amount in fish.items():
+            expected_fish[user_id] = expected_fish.get(user_id, 0) + amount
+
+    problems = []
+    conn = setup._get_connection()
+    for index in range(args.users):
+        user_id = f"user{index}"
+        coins = conn.execute("SELECT coins FROM user_fishing WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if coins != FishingDB.INITIAL_COINS + expected_coins.get(user_id, 0):
+            problems.append(f"{user_id} 金币 {coins}，预期 {FishingDB.INITIAL_COINS + expected_coins.get(user_id, 0)}")
+        row = conn.execute("SELECT quantity FROM user_fish WHERE user_id = ? AND fish_id = ?",
+                           (user_id, FISH_ID)).fetchone()
+        quantity = row[0] if row else 0
+        if quantity != expected_fish.get(user_id, 0):
+            problems.append(f"{user_id} 鱼数 {quantity}，预期 {expected_fish.get(user_id, 0)}")
+    adjustments = conn.execute("SELECT COUNT(*) FROM coin_ledger WHERE reason = 'reconcile'").fetchone()[0]
+    if adjustments:
+        problems.append(f"并发对账写入了{adjustments}条调整流水")
+    reconcile = setup.reconcile_coins(10 ** 9)
+    if reconcile['mismatches']:
+        problems.append(f"金币流水与余额不一致: {reconcile['mismatches']}")
+
+    total_ops = args.processes * args.ops
+    print(f"{args.processes}个进程 x {args.ops}次操作，耗时{duration:.2f}秒，"
+          f"{total_ops / duration:.0f}次/秒，失败{errors}次，期间对账{rounds.value}轮")
+    stats = LockStats.merge([snapshot for snapshot, _, _, _ in results])
+    for line in LockStats.format(stats):
+        print(f"  {line}")
+    labels = [f"<={bound * 1000:g}ms" for bound in WAIT_BUCKETS] + [f">{WAIT_BUCKETS[-1] * 1000:g}ms"]
+    histogram = [sum(column) for column in zip(*(op['histogram'] for op in stats.values()))]
+    print("  等锁分布: " + " ".join(f"{label}:{count}" for label, count in zip(labels, histogram) if count))
+
+    if problems:
+        print("❌ 一致性检查失败:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print("✅ 余额、鱼塘数量和金币流水一致")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,6 @@
 from .fish import Fish
 from .stats import FisherStats, BestCatch
 from .fishing import FishingSystem
+from .shard import ShardRouter
 
-__all__ = ['Fish', 'FisherStats', 'BestCatch', 'FishingSystem']
+__all__ = ['Fish', 'FisherStats', 'BestCatch', 'FishingSystem', 'ShardRouter']
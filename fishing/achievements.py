@@ -0,0 +1,251 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .storage import FishingStorage
+from .constants import TITLES, ACHIEVEMENTS, DAILY_TASKS
+
+# 规则来源: (类型, 规则表, 显示名称)
+RULE_SOURCES = (
+    ('title', TITLES, '称号'),
+    ('achievement', ACHIEVEMENTS, '成就'),
+    ('daily_task', DAILY_TASKS, '每日任务'),
+)
+
+# 传说(稀有度5)对应常量中的S级
+S_GRADE_RARITY = 5
+
+
+@dataclass
+class Rule:
+    kind: str
+    key: str
+    name: str
+    metric: str
+    threshold: int
+    reward: int
+    description: str
+
+
+@dataclass
+class UserProgress:
+    day: str
+    values: Dict[str, int] = field(default_factory=dict)       # 指标 -> 当前值
+    next_index: Dict[str, int] = field(default_factory=dict)   # 指标 -> 下一个未达成阈值的位置
+    species: Set[int] = field(default_factory=set)
+    awards: Set[Tuple[str, str]] = field(default_factory=set)  # (类型, 规则键)
+
+
+def is_daily_metric(metric: str) -> bool:
+    """每日指标以 daily_ 开头，按日期自动清零"""
+    return metric.startswith('daily_')
+
+
+def compile_rules(sources=RULE_SOURCES) -> Dict[str, List[Rule]]:
+    """把称号、成就、每日任务的条件编译为 指标 -> 按阈值升序的规则列表"""
+    rules: Dict[str, List[Rule]] = {}
+    for kind, table, _ in sources:
+        for key, data in table.items():
+            condition = data['condition']
+            if len(condition) != 1:
+                raise ValueError(f"{kind}.{key} 只支持单一条件，当前为 {condition}")
+            (metric, threshold), = condition.items()
+            rules.setdefault(metric, []).append(Rule(
+                kind=kind,
+                key=key,
+                name=data['name'],
+                metric=metric,
+                threshold=threshold,
+                reward=data.get('reward', 0),
+                description=data['description'],
+            ))
+    for metric_rules in rules.values():
+        metric_rules.sort(key=lambda rule: rule.threshold)
+    return rules
+
+
+class AchievementEngine:
+    """称号、成就与每日任务引擎
+
+    每个指标的规则按阈值排序，用户只需要和下一个未达成的阈值比较，
+    每个事件的处理开销是O(1)，不需要回放历史记录。
+    每日指标在用户下一次产生事件时按日期惰性清零。
+    """
+
+    def __init__(self, db: FishingStorage, max_cached_users: int = 10000):
+        """初始化成就引擎
+        Args:
+            db: 数据库
+            max_cached_users: 内存中缓存的用户进度数量上限
+        """
+        self.db = db
+        self.rules = compile_rules()
+        self.max_cached_users = max_cached_users
+        self.users: "OrderedDict[str, UserProgress]" = OrderedDict()
+        self.lock = threading.RLock()
+        self.LOG = logging.getLogger("FishingAchievement")
+
+    def on_cast(self, user_id: str, fish: Optional[Dict] = None) -> List[str]:
+        """钓鱼一次(无论是否钓到)"""
+        events = {'total_fishing': 1, 'daily_fishing': 1}
+        if fish and fish['rarity'] >= S_GRADE_RARITY:
+            events['s_grade_fish'] = 1
+            events['daily_s_fish'] = 1
+        return self.record(user_id, events, fish['id'] if fish else None)
+
+    def on_sell(self, user_id: str, coins: int) -> List[str]:
+        """卖鱼获得金币"""
+        return self.record(user_id, {'total_coins': coins, 'daily_sell': coins})
+
+    def on_check_in(self, user_id: str, coins: int) -> List[str]:
+        """签到获得金币"""
+        return self.record(user_id, {'total_coins': coins})
+
+    def on_bait_use(self, user_id: str) -> List[str]:
+        """使用鱼饵"""
+        return self.record(user_id, {'daily_bait_use': 1})
+
+    def record(self, user_id: str, events: Dict[str, int], species: Optional[int] = None) -> List[str]:
+        """累加指标并检查是否越过下一个阈值
+        Args:
+            user_id: 用户ID
+            events: 指标 -> 增量
+            species: 本次钓到的鱼种，第一次钓到时计入 unique_fish
+        Returns:
+            新达成的提示消息
+        """
+        now = time.time()
+        messages = []
+        changed: Dict[str, Tuple[str, int]] = {}
+        awards = []
+        total_reward = 0
+        new_species = None
+
+        with self.lock:
+            progress = self._get_progress(user_id)
+            pending = list(events.items())
+            if species is not None and species not in progress.species:
+                progress.species.add(species)
+                new_species = species
+                pending.append(('unique_fish', 1))
+
+            while pending:
+                metric, delta = pending.pop()
+                if not delta:
+                    continue
+                value = progress.values.get(metric, 0) + delta
+                progress.values[metric] = value
+                changed[metric] = (progress.day if is_daily_metric(metric) else '', value)
+
+                rules = self.rules.get(metric)
+                if not rules:
+                    continue
+                index = progress.next_index.get(metric, 0)
+                while index < len(rules) and value >= rules[index].threshold:
+                    rule = rules[index]
+                    index += 1
+                    if (rule.kind, rule.key) in progress.awards:
+                        continue
+                    progress.awards.add((rule.kind, rule.key))
+                    awards.append((rule.kind, rule.key, progress.day if rule.kind == 'daily_task' else '', now))
+                    messages.append(self._award_message(rule))
+                    if rule.reward:
+                        total_reward += rule.reward
+                        # 奖励金币同样计入累计获得金币
+                        pending.append(('total_coins', rule.reward))
+                progress.next_index[metric] = index
+
+        if total_reward:
+            self.db.update_user_coins(user_id, total_reward, 'achievement')
+        if changed or awards or new_species is not None:
+            stats = [(metric, day, value) for metric, (day, value) in changed.items()]
+            self.db.save_achievement_progress(user_id, stats, awards, new_species)
+        return messages
+
+    def export_state(self) -> List[Tuple]:
+        """导出缓存中的用户进度，用于热启动快照"""
+        with self.lock:
+            return [(user_id, progress.day, progress.values, progress.species, progress.awards)
+                    for user_id, progress in self.users.items()]
+
+    def load_state(self, entries: List[Tuple]) -> None:
+        """从热启动快照恢复用户进度，阈值位置按当前规则重新计算"""
+        with self.lock:
+            for user_id, day, values, species, awards in entries:
+                progress = UserProgress(day=day, values=dict(values), species=set(species),
+                                        awards={tuple(award) for award in awards})
+                for metric, rules in self.rules.items():
+                    progress.next_index[metric] = self._first_unawarded(rules, progress.awards)
+                self.users[user_id] = progress
+                if len(self.users) > self.max_cached_users:
+                    self.users.popitem(last=False)
+
+    def get_progress_text(self, user_id: str) -> str:
+        """显示用户的称号、成就和今日任务进度"""
+        with self.lock:
+            progress = self._get_progress(user_id)
+            awards = set(progress.awards)
+            values = dict(progress.values)
+
+        titles = [rule for rules in self.rules.values() for rule in rules
+                  if rule.kind == 'title' and (rule.kind, rule.key) in awards]
+        result = ["🏅 我的成就"]
+        result.append("-" * 20)
+        if titles:
+            result.append(f"🎖️ 称号: {'、'.join(rule.name for rule in titles)}")
+        else:
+            result.append("🎖️ 称号: 暂无")
+
+        for kind, table, display in RULE_SOURCES[1:]:
+            result.append("")
+            result.append(f"【{display}】")
+            for key, data in table.items():
+                (metric, threshold), = data['condition'].items()
+                current = min(values.get(metric, 0), threshold)
+                mark = "✅" if (kind, key) in awards else "⬜"
+                result.append(f"{mark} {data['name']} - {data['description']} ({current}/{threshold})")
+        return "\n".join(result)
+
+    def _get_progress(self, user_id: str) -> UserProgress:
+        """获取用户进度，不在缓存中时从数据库加载；跨天时清零每日指标"""
+        today = time.strftime('%Y-%m-%d')
+        progress = self.users.get(user_id)
+        if progress is None:
+            state = self.db.get_achievement_state(user_id, today)
+            progress = UserProgress(day=today, species=state['species'], awards=state['awards'])
+            for metric, (day, value) in state['stats'].items():
+                if is_daily_metric(metric) and day != today:
+                    continue
+                progress.values[metric] = value
+            for metric, rules in self.rules.items():
+                progress.next_index[metric] = self._first_unawarded(rules, progress.awards)
+            self.users[user_id] = progress
+            if len(self.users) > self.max_cached_users:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
+            if progress.day != today:
+                progress.day = today
+                for metric, rules in self.rules.items():
+                    if is_daily_metric(metric):
+                        progress.values.pop(metric, None)
+                        progress.awards -= {(rule.kind, rule.key) for rule in rules}
+                        progress.next_index[metric] = 0
+        return progress
+
+    @staticmethod
+    def _first_unawarded(rules: List[Rule], awards: Set[Tuple[str, str]]) -> int:
+        """第一个尚未达成的规则位置，新增的低阈值规则会在下一次事件时补发"""
+        for index, rule in enumerate(rules):
+            if (rule.kind, rule.key) not in awards:
+                return index
+        return len(rules)
+
+    @staticmethod
+    def _award_message(rule: Rule) -> str:
+        display = {kind: name for kind, _, name in RULE_SOURCES}[rule.kind]
+        reward = f"，奖励{rule.reward}金币" if rule.reward else ""
+        return f"🏆 达成{display}「{rule.name}」{reward}"
@@ -0,0 +1,237 @@
+import time
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from functools import partial
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import Metrics, Labels
+from .slow_profiler import SlowCommandProfiler
+
+
+class TokenBucket:
+    """令牌桶，按固定速率补充令牌，桶满后不再累积"""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def available(self, now: float, amount: float = 1.0) -> bool:
+        """补充令牌后检查是否有足够的令牌，不取出"""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return self.tokens >= amount
+
+    def take(self, amount: float = 1.0) -> None:
+        """取出令牌，调用前需用 available 确认令牌足够"""
+        self.tokens -= amount
+
+    def wait_time(self, amount: float = 1.0) -> float:
+        """距离下一次可取出令牌还需等待的秒数"""
+        if self.tokens >= amount or self.rate <= 0:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """命令准入控制
+
+    在命令进入数据库之前，用内存中的令牌桶拒绝刷屏请求，限制全局并发，
+    并把同一用户同时发起的相同只读请求合并为一次计算。
+    同一用户的命令按到达顺序逐条执行: 同步命令在线程池中执行，若不排队，同一用户并发的
+    /钓鱼 会在冷却时间写回之前都通过检查。关闭准入控制时同步命令直接在事件循环中执行，同样逐条执行。
+    """
+
+    def __init__(self, config: Dict, metrics: Optional[Metrics] = None,
+                 profiler: Optional[SlowCommandProfiler] = None):
+        """初始化准入控制
+        Args:
+            config: 插件配置，准入配置位于 config['admission']
+            metrics: 指标，启用时记录每条命令的耗时
+            profiler: 慢命令剖析，启用时对同步命令采样调用栈
+        """
+        admission = config.get('admission', {})
+        self.enabled = admission.get('enabled', True)
+        self.max_concurrency = admission.get('max_concurrency', 16)
+        self.user_rate = admission.get('user_rate', 0.5)
+        self.user_burst = admission.get('user_burst', 3)
+        self.command_limits: Dict[str, Dict] = admission.get('commands', {})
+        self.max_buckets = admission.get('max_buckets', 10000)
+        self.LOG = logging.getLogger("FishingAdmission")
+
+        now = time.monotonic()
+        self.global_bucket = TokenBucket(admission.get('global_burst', 400), admission.get('global_rate', 200), now)
+        self.buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()  # (user_id, command) -> bucket
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.user_tails: Dict[str, asyncio.Future] = {}  # user_id -> 该用户最后一条命令执行完成的信号
+        self.active = 0
+
+        # 统计计数
+        self.admitted = Counter()
+        self.coalesced = Counter()
+        self.rejections = Counter()  # (command, reason) -> count
+        self.metrics = metrics or Metrics()
+        self.metrics.add_collector(self.collect_metrics)
+        self.profiler = profiler or SlowCommandProfiler()
+
+    async def run(self, user_id: str, command: str, func: Callable, *args,
+                  coalesce_key: Optional[Hashable] = None) -> str:
+        """在准入控制下执行命令
+        Args:
+            user_id: 用户ID
+            command: 命令名称，用于匹配限流配置和统计
+            func: 实际执行命令的函数，同步函数在线程池中执行，协程函数直接等待
+            coalesce_key: 合并键，相同键的并发请求只计算一次，仅用于只读命令
+        Returns:
+            命令结果或拒绝提示
+        """
+        if self.profiler.enabled and not asyncio.iscoroutinefunction(func):
+            func = partial(self.profiler.run, command, func)
+        if not self.metrics.enabled:
+            return await self._run(user_id, command, func, *args, coalesce_key=coalesce_key)
+        
+        # 同步命令在执行线程中标记命令名，期间的写事务计入该命令
+        started = time.perf_counter()
+        if not asyncio.iscoroutinefunction(func):
+            func = partial(self.metrics.run_command, command, func)
+        try:
+            return await self._run(user_id, command, func, *args, coalesce_key=coalesce_key)
+        finally:
+            self.metrics.observe('fishing_command_seconds', (('command', command),), time.perf_counter() - started)
+
+    async def _run(self, user_id: str, command: str, func: Callable, *args,
+                   coalesce_key: Optional[Hashable] = None) -> str:
+        if not self.enabled:
+            if asyncio.iscoroutinefunction(func):
+                return await func(*args)
+            return func(*args)
+
+        # 已有相同请求在计算中，直接复用结果，不消耗令牌
+        if coalesce_key is not None and coalesce_key in self.inflight:
+            self.coalesced[command] += 1
+            return await asyncio.shield(self.inflight[coalesce_key])
+
+        now = time.monotonic()
+        rejected, buckets = self._check_rate(user_id, command, now)
+        if rejected:
+            return rejected
+
+        if self.active >= self.max_concurrency:
+            self._reject(command, 'concurrency')
+            return "🚧 钓鱼场太拥挤了，请稍后再试"
+
+        # 所有检查都通过后才扣除令牌，被任何一项拒绝的请求不占用其他桶的令牌
+        for bucket in buckets:
+            bucket.take()
+        self.admitted[command] += 1
+        self.active += 1
+        future = asyncio.ensure_future(self._run_in_order(user_id, func, *args))
+        if coalesce_key is not None:
+            self.inflight[coalesce_key] = future
+        try:
+            return await future
+        finally:
+            self.active -= 1
+            if coalesce_key is not None:
+                self.inflight.pop(coalesce_key, None)
+
+    async def _run_in_order(self, user_id: str, func: Callable, *args):
+        """等同一用户之前的命令执行完后再执行func
+
+        排队依据的是命令实际执行完成的时间而不是等待它的协程: 等待的请求被取消后，
+        线程池中的函数仍在执行，后面的命令要等它结束。
+        """
+        loop = asyncio.get_running_loop()
+        previous = self.user_tails.get(user_id)
+        finished = loop.create_future()
+        self.user_tails[user_id] = finished
+
+        def release(_=None):
+            if not finished.done():
+                finished.set_result(None)
+            if self.user_tails.get(user_id) is finished:
+                del self.user_tails[user_id]
+
+        if previous is not None:
+            try:
+                await asyncio.shield(previous)
+            except asyncio.CancelledError:
+                previous.add_done_callback(release)
+                raise
+        try:
+            if asyncio.iscoroutinefunction(func):
+                future = asyncio.ensure_future(func(*args))
+            else:
+                future = loop.run_in_executor(None, partial(func, *args))
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(release)
+        return await future
+
+    def get_stats(self) -> Dict:
+        """获取准入统计"""
+        return {
+            'active': self.active,
+            'admitted': dict(self.admitted),
+            'coalesced': dict(self.coalesced),
+            'rejections': {f"{command}:{reason}": count for (command, reason), count in self.rejections.items()},
+        }
+
+    def collect_metrics(self) -> List[Tuple[str, Labels, float]]:
+        """导出指标时读取放行和拒绝次数"""
+        samples = [('fishing_admission_admitted_total', (('command', command),), count)
+                   for command, count in self.admitted.items()]
+        samples.extend(('fishing_admission_rejections_total', (('command', command), ('reason', reason)), count)
+                       for (command, reason), count in self.rejections.items())
+        return samples
+
+    def _check_rate(self, user_id: str, command: str, now: float) -> Tuple[Optional[str], List[TokenBucket]]:
+        """依次检查命令、用户和全局令牌桶，只检查不扣除
+        Returns:
+            (被拒绝时的提示, 放行时需要扣除令牌的桶)
+        """
+        buckets = []
+        limit = self.command_limits.get(command)
+        if limit:
+            bucket = self._get_bucket((user_id, command), limit.get('burst', 1), limit.get('rate', 0.1), now)
+            if not bucket.available(now):
+                self._reject(command, 'command')
+                return f"⏳ 操作太频繁，请{int(bucket.wait_time()) + 1}秒后再试", []
+            buckets.append(bucket)
+
+        bucket = self._get_bucket((user_id, None), self.user_burst, self.user_rate, now)
+        if not bucket.available(now):
+            self._reject(command, 'user')
+            return f"⏳ 操作太频繁，请{int(bucket.wait_time()) + 1}秒后再试", []
+        buckets.append(bucket)
+
+        if not self.global_bucket.available(now):
+            self._reject(command, 'global')
+            return "🚧 钓鱼场太拥挤了，请稍后再试", []
+        buckets.append(self.global_bucket)
+        return None, buckets
+
+    def _get_bucket(self, key: Hashable, capacity: float, rate: float, now: float) -> TokenBucket:
+        """获取令牌桶，超过上限时淘汰最久未使用的桶"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(capacity, rate, now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def _reject(self, command: str, reason: str) -> None:
+        """记录一次拒绝"""
+        self.rejections[(command, reason)] += 1
+        total = sum(self.rejections.values())
+        if total % 1000 == 0:
+            self.LOG.info(f"准入控制已累计拒绝 {total} 次请求: {self.get_stats()['rejections']}")
@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+
+class BackupManager:
+    """在线备份
+
+    由存储引擎的 backup_to 复制数据：SQLite使用 sqlite3.Connection.backup 分批复制页面，每批之间短暂休眠，
+    源库的读锁在每批结束后即释放，备份期间自动钓鱼和命令仍可正常写入；批次之间有写入会让备份重新开始，
+    此时改为在一个读事务中一次复制完；内存引擎写出一份快照。
+    """
+
+    def __init__(self, storage, config: Dict):
+        """初始化备份管理器
+        Args:
+            storage: 需要备份的存储引擎
+            config: 插件配置，备份配置位于 config['backup']
+        """
+        backup = config.get('backup', {})
+        self.storage = storage
+        self.db_path = storage.db_path
+        self.suffix = os.path.splitext(self.db_path)[1] or '.db'  # 快照文件扩展名与源文件相同
+        self.enabled = backup.get('enabled', True)
+        self.interval = backup.get('interval', 6 * 3600)  # 定时备份间隔(秒)
+        self.pages_per_step = backup.get('pages_per_step', 64)  # 每批复制的页数
+        self.step_sleep = backup.get('step_sleep', 0.01)  # 每批之间休眠的秒数
+        self.keep = backup.get('keep', 5)  # 保留的快照数量
+        self.backup_dir = backup.get('dir') or os.path.join(os.path.dirname(self.db_path) or '.', 'backups')
+        self.LOG = logging.getLogger("FishingBackup")
+
+        self.lock = threading.Lock()  # 同一时间只允许一个备份
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_result: Optional[Dict] = None
+
+    def start(self) -> None:
+        """启动定时备份线程"""
+        if not self.enabled or self.interval <= 0:
+            return
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._backup_loop, daemon=True)
+        self.thread.start()
+        self.LOG.info(f"定时备份已启动，间隔{self.interval}秒: {self.db_path}")
+
+    def stop(self) -> None:
+        """停止定时备份线程"""
+        self.stop_event.set()
+
+    def backup_now(self) -> Dict:
+        """立即执行一次备份
+        Returns:
+            备份结果，包含快照路径、复制页数、批次数和耗时
+        """
+        with self.lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            target = self._snapshot_path()
+            temp_target = target + '.tmp'
+            start = time.perf_counter()
+            stats = self.storage.backup_to(temp_target, self.pages_per_step, self.step_sleep)
+            os.replace(temp_target, target)
+            duration = time.perf_counter() - start
+
+            removed = self._rotate()
+            result = {
+                'path': target,
+                'pages': stats['pages'],
+                'steps': stats['steps'],
+                'duration': duration,
+                'removed': removed,
+            }
+            self.last_result = result
+            self.LOG.info(f"备份完成: {target}，{stats['pages']}页/{stats['steps']}批，耗时{duration:.2f}秒")
+            return result
+
+    def list_snapshots(self) -> List[str]:
+        """按时间从旧到新列出快照文件"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        prefix = self._snapshot_prefix()
+        snapshots = [
+            os.path.join(self.backup_dir, filename)
+            for filename in os.listdir(self.backup_dir)
+            if filename.startswith(prefix) and filename.endswith(self.suffix)
+        ]
+        return sorted(snapshots, key=lambda path: (os.path.getmtime(path), path))
+
+    def _backup_loop(self) -> None:
+        """定时备份循环"""
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.backup_now()
+            except Exception as e:
+                self.LOG.error(f"定时备份失败: {e}", exc_info=True)
+
+    def _rotate(self) -> int:
+        """删除超出保留数量的旧快照"""
+        snapshots = self.list_snapshots()
+        expired = snapshots[:-self.keep] if self.keep > 0 else []
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.LOG.warning(f"删除旧备份失败 {path}: {e}")
+        return len(expired)
+
+    def _snapshot_prefix(self) -> str:
+        """快照文件名前缀，例如 fishing.db -> fishing-"""
+        return os.path.splitext(os.path.basename(self.db_path))[0] + '-'
+
+    def _snapshot_path(self) -> str:
+        """生成新的快照路径，文件名按时间排序"""
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.backup_dir, f"{self._snapshot_prefix()}{stamp}{self.suffix}")
+        index = 1
+        while os.path.exists(path):
+            path = os.path.join(self.backup_dir, f"{self._snapshot_prefix()}{stamp}-{index}{self.suffix}")
+            index += 1
+        return path
@@ -0,0 +1,197 @@
+import os
+import time
+import hashlib
+import marshal
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from .name_index import FishNameIndex
+
+CACHE_VERSION = 1
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'fish_catalog.yaml')
+
+# 鱼类字段及类型，编译缓存中按此顺序保存为元组
+FIELDS = ('id', 'name', 'rarity', 'base_value', 'min_weight', 'max_weight', 'habitat')
+HABITATS = ('淡水', '海水')
+
+
+def validate_species(species: List) -> List[Tuple]:
+    """校验鱼类数据并转换为按 FIELDS 排列的元组
+    Raises:
+        ValueError: 数据不合法，消息中指出出错的条目
+    """
+    if not isinstance(species, list) or not species:
+        raise ValueError("species 必须是非空列表")
+    rows = []
+    seen_ids = set()
+    seen_names = set()
+    for index, item in enumerate(species):
+        where = f"第{index + 1}条鱼类"
+        if not isinstance(item, dict):
+            raise ValueError(f"{where}必须是映射")
+        missing = [field for field in FIELDS if field not in item]
+        if missing:
+            raise ValueError(f"{where}缺少字段: {', '.join(missing)}")
+        fish_id, name, rarity, base_value, min_weight, max_weight, habitat = (item[field] for field in FIELDS)
+        where = f"鱼类「{name}」(ID:{fish_id})"
+        for field in ('id', 'rarity', 'base_value', 'min_weight', 'max_weight'):
+            if not isinstance(item[field], int) or isinstance(item[field], bool):
+                raise ValueError(f"{where}的 {field} 必须是整数")
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"{where}的名称不能为空")
+        if fish_id <= 0 or fish_id in seen_ids:
+            raise ValueError(f"{where}的ID必须为正数且不能重复")
+        if name in seen_names:
+            raise ValueError(f"{where}的名称重复")
+        if not 1 <= rarity <= 5:
+            raise ValueError(f"{where}的稀有度必须在1-5之间")
+        if base_value <= 0:
+            raise ValueError(f"{where}的基础价值必须大于0")
+        if not 0 < min_weight < max_weight:
+            raise ValueError(f"{where}的重量范围不合法: {min_weight}-{max_weight}")
+        if habitat not in HABITATS:
+            raise ValueError(f"{where}的栖息地必须是 {'/'.join(HABITATS)} 之一")
+        seen_ids.add(fish_id)
+        seen_names.add(name)
+        rows.append((fish_id, name, rarity, base_value, min_weight, max_weight, habitat))
+    return rows
+
+
+class FishCatalog:
+    """鱼类图鉴
+
+    图鉴数据保存在YAML文件中，解析并校验后编译为marshal缓存，缓存以文件的修改时间、大小和内容哈希为键，
+    文件未变化时启动直接读取缓存，不再解析YAML。运行中定期检查文件修改时间，变化后自动重新加载；
+    新文件校验失败时保留旧图鉴并记录错误。
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_path: Optional[str] = None,
+                 reload_interval: float = 5):
+        """初始化鱼类图鉴
+        Args:
+            path: YAML文件路径，默认为插件自带的 fish_catalog.yaml
+            cache_path: 编译缓存路径，为None时不使用缓存
+            reload_interval: 检查文件变化的最小间隔(秒)，0表示不自动重新加载
+        """
+        self.path = path or DEFAULT_CATALOG_PATH
+        self.cache_path = cache_path
+        self.reload_interval = reload_interval
+        self.LOG = logging.getLogger("FishingCatalog")
+        self.lock = threading.Lock()
+
+        self.digest = ''
+        self.version = 0  # 每次重新加载后加1
+        self.species: List[Dict] = []
+        self.by_id: Dict[int, Dict] = {}
+        self.by_name: Dict[str, Dict] = {}
+        self.by_rarity: Dict[int, List[Dict]] = {}
+        self.name_index = FishNameIndex(())
+        self.file_key: Optional[Tuple[int, int]] = None
+        self.next_check = 0.0
+
+        self.file_key, self.digest, rows = self._load()
+        self._install(rows)
+
+    def maybe_reload(self) -> bool:
+        """文件发生变化时重新加载，返回是否加载了新图鉴"""
+        if self.reload_interval <= 0:
+            return False
+        now = time.time()
+        if now < self.next_check:
+            return False
+        with self.lock:
+            if now < self.next_check:
+                return False
+            self.next_check = now + self.reload_interval
+            try:
+                file_key = self._file_key()
+                if file_key == self.file_key:
+                    return False
+                # 先记下新的文件键，加载失败时不会反复重试同一个错误的文件
+                self.file_key = file_key
+                self.file_key, digest, rows = self._load()
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                self.LOG.error(f"重新加载鱼类图鉴失败，继续使用旧图鉴: {e}")
+                return False
+            if digest == self.digest:
+                return False
+            self.digest = digest
+            self._install(rows)
+            self.LOG.info(f"鱼类图鉴已重新加载: {len(rows)}种鱼")
+            return True
+
+    def rows(self) -> List[Tuple]:
+        """按 FIELDS 排列的所有鱼类"""
+        return [tuple(fish[field] for field in FIELDS) for fish in self.species]
+
+    def _file_key(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> Tuple[Tuple[int, int], str, List[Tuple]]:
+        """读取图鉴，文件未变化时使用编译缓存"""
+        file_key = self._file_key()
+        cache = self._read_cache()
+        if cache and tuple(cache['file_key']) == file_key:
+            return file_key, cache['digest'], cache['rows']
+
+        with open(self.path, 'rb') as fp:
+            content = fp.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if cache and cache['digest'] == digest:
+            # 只是修改时间变了，内容相同，更新缓存键即可
+            rows = cache['rows']
+        else:
+            data = yaml.safe_load(content) or {}
+            rows = validate_species(data.get('species') if isinstance(data, dict) else None)
+            self.LOG.info(f"已解析鱼类图鉴 {self.path}: {len(rows)}种鱼")
+        self._write_cache(file_key, digest, rows)
+        return file_key, digest, rows
+
+    def _read_cache(self) -> Optional[Dict]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as fp:
+                cache = marshal.load(fp)
+            if cache.get('version') == CACHE_VERSION and cache.get('path') == os.path.abspath(self.path):
+                return cache
+        except (EOFError, ValueError, TypeError, OSError, AttributeError) as e:
+            self.LOG.warning(f"鱼类图鉴缓存无法读取，将重新解析: {e}")
+        return None
+
+    def _write_cache(self, file_key: Tuple[int, int], digest: str, rows: List[Tuple]) -> None:
+        if not self.cache_path:
+            return
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            temp_path = self.cache_path + '.tmp'
+            with open(temp_path, 'wb') as fp:
+                marshal.dump({
+                    'version': CACHE_VERSION,
+                    'path': os.path.abspath(self.path),
+                    'file_key': file_key,
+                    'digest': digest,
+                    'rows': rows,
+                }, fp)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            self.LOG.warning(f"写入鱼类图鉴缓存失败: {e}")
+
+    def _install(self, rows: List[Tuple]) -> None:
+        """构建查询索引，整体替换以保证读取方看到一致的图鉴"""
+        species = [dict(zip(FIELDS, row)) for row in rows]
+        by_rarity: Dict[int, List[Dict]] = {}
+        for fish in species:
+            by_rarity.setdefault(fish['rarity'], []).append(fish)
+        self.species = species
+        self.by_id = {fish['id']: fish for fish in species}
+        self.by_name = {fish['name']: fish for fish in species}
+        self.by_rarity = by_rarity
+        self.name_index = FishNameIndex(fish['name'] for fish in species)
+        self.version += 1
@@ -0,0 +1,133 @@
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# 每个用户每种鱼单独保存的标本数量上限，更轻的鱼合并为 (数量, 总重量)
+MAX_SPECIMENS = 64
+
+
+def catch_value(fish: Dict, weight: int) -> int:
+    """按重量(克)计算一条鱼的价值，最轻为基础价值，最重为1.5倍"""
+    span = fish['max_weight'] - fish['min_weight']
+    ratio = (weight - fish['min_weight']) / span if span > 0 else 0
+    return int(fish['base_value'] * (1 + min(max(ratio, 0), 1) * 0.5))
+
+
+def heaviest_weight(weights: Optional[bytes]) -> Optional[int]:
+    """从打包的重量BLOB中直接读出最重一条的重量，不需要解包整个数组"""
+    return int.from_bytes(weights[:4], 'little') if weights else None
+
+
+def _unpack(blob: Optional[bytes]) -> array:
+    values = array('I')
+    if blob:
+        values.frombytes(blob)
+        if sys.byteorder == 'big':
+            values.byteswap()
+    return values
+
+
+def _pack(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array('I', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class CatchSet:
+    """一个用户一种鱼的捕获记录
+
+    最重的若干条鱼按重量降序保存为两个uint32数组(重量克数、捕获时间)，以小端BLOB存储，
+    每条只占8字节；超出上限的较轻的鱼合并为 (数量, 总重量)。价值随重量线性变化，
+    合并后的鱼仍能按总重量算出准确的总价值，单个用户即使有上万条同种鱼，记录大小也是固定的。
+    鱼塘数量中多出记录的部分(旧版本钓到的、市场买入的)重量未知，按基础价值计算。
+    """
+
+    __slots__ = ('weights', 'times', 'bulk_count', 'bulk_weight', 'unknown')
+
+    def __init__(self, weights: Optional[array] = None, times: Optional[array] = None,
+                 bulk_count: int = 0, bulk_weight: int = 0, unknown: int = 0):
+        self.weights = weights if weights is not None else array('I')
+        self.times = times if times is not None else array('I')
+        self.bulk_count = bulk_count
+        self.bulk_weight = bulk_weight
+        self.unknown = unknown
+
+    @classmethod
+    def from_row(cls, row: Optional[Tuple]) -> 'CatchSet':
+        """从 (weights, times, bulk_count, bulk_weight) 行构建，行不存在时为空记录"""
+        if not row:
+            return cls()
+        return cls(_unpack(row[0]), _unpack(row[1]), row[2] or 0, row[3] or 0)
+
+    def to_row(self) -> Tuple[bytes, bytes, int, int]:
+        return _pack(self.weights), _pack(self.times), self.bulk_count, self.bulk_weight
+
+    @property
+    def count(self) -> int:
+        """记录中的鱼数(含重量未知的)"""
+        return len(self.weights) + self.bulk_count + self.unknown
+
+    @property
+    def heaviest(self) -> Optional[int]:
+        return self.weights[0] if self.weights else None
+
+    def add(self, weight: int, catch_time: float, limit: int = MAX_SPECIMENS) -> None:
+        """记录一条鱼，按重量插入，超出上限时把最轻的一条合并"""
+        index = len(self.weights)
+        while index > 0 and self.weights[index - 1] < weight:
+            index -= 1
+        self.weights.insert(index, weight)
+        self.times.insert(index, int(catch_time))
+        while len(self.weights) > limit:
+            self.bulk_count += 1
+            self.bulk_weight += self.weights.pop()
+            self.times.pop()
+
+    def merge(self, other: 'CatchSet', limit: int = MAX_SPECIMENS) -> None:
+        """并入另一份记录(偷鱼转移、撤销卖单退还)，重量未知的部分由鱼塘数量体现，不需要记录"""
+        for weight, catch_time in zip(other.weights, other.times):
+            self.add(weight, catch_time, limit)
+        self.bulk_count += other.bulk_count
+        self.bulk_weight += other.bulk_weight
+
+    def take(self, amount: int, quantity: int) -> 'CatchSet':
+        """取出amount条鱼，返回取出部分的记录
+        Args:
+            amount: 取出的数量
+            quantity: 取出前鱼塘中的数量，多于记录的部分视为重量未知的鱼
+        先取重量未知的鱼，再取合并的鱼(按平均重量)，最后从最轻的标本取，最重的标本留到最后。
+        """
+        taken = CatchSet()
+        untracked = max(quantity - len(self.weights) - self.bulk_count, 0)
+        taken.unknown = min(amount, untracked)
+        rest = amount - taken.unknown
+
+        if rest > 0 and self.bulk_count > 0:
+            count = min(rest, self.bulk_count)
+            weight = self.bulk_weight * count // self.bulk_count
+            taken.bulk_count, taken.bulk_weight = count, weight
+            self.bulk_count -= count
+            self.bulk_weight -= weight
+            rest -= count
+
+        while rest > 0 and self.weights:
+            taken.weights.insert(0, self.weights.pop())
+            taken.times.insert(0, self.times.pop())
+            rest -= 1
+        # 记录比鱼塘少时剩下的也按重量未知计算
+        taken.unknown += rest
+        return taken
+
+    def value(self, fish: Dict) -> int:
+        """按重量计算记录中所有鱼的总价值"""
+        total = fish['base_value'] * self.unknown
+        total += sum(catch_value(fish, weight) for weight in self.weights)
+        if self.bulk_count:
+            average = self.bulk_weight / self.bulk_count
+            total += catch_value(fish, average) * self.bulk_count
+        return total
+
+    def specimens(self) -> List[Tuple[int, int]]:
+        """(重量克数, 捕获时间)，按重量降序"""
+        return list(zip(self.weights, self.times))
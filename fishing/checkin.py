@@ -0,0 +1,114 @@
+import time
+import threading
+from typing import Dict, Optional
+
+from .storage import FishingStorage
+
+# 每个用户每年一个位图，第i位表示当年第i+1天是否签到，366位共46字节
+YEAR_BYTES = 46
+
+
+def set_bit(bits: Optional[bytes], index: int) -> bytes:
+    """设置第index位"""
+    value = int.from_bytes(bits or b'', 'little') | (1 << index)
+    return value.to_bytes(YEAR_BYTES, 'little')
+
+
+def test_bit(bits: Optional[bytes], index: int) -> bool:
+    """测试第index位"""
+    return bool(bits) and bool(int.from_bytes(bits, 'little') >> index & 1)
+
+
+def count_bits(bits: Optional[bytes], start: int, end: int) -> int:
+    """统计 [start, end) 区间内签到的天数"""
+    if not bits:
+        return 0
+    value = int.from_bytes(bits, 'little') >> start
+    return bin(value & ((1 << (end - start)) - 1)).count('1')
+
+
+def trailing_streak(bits: Optional[bytes], index: int) -> int:
+    """从第index位向前连续为1的位数"""
+    if not bits:
+        return 0
+    mask = (1 << (index + 1)) - 1
+    zeros = ~int.from_bytes(bits, 'little') & mask
+    if not zeros:
+        return index + 1
+    return index - (zeros.bit_length() - 1)
+
+
+def days_in_year(year: int) -> int:
+    return 366 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 365
+
+
+class CheckInBook:
+    """位图签到簿
+
+    今天的签到状态缓存在内存中，判断是否已签到为O(1)；
+    连续签到天数和本月签到天数直接对年度位图做位运算得到。
+    """
+
+    def __init__(self, db: FishingStorage):
+        self.db = db
+        self.lock = threading.Lock()
+        self.today: Optional[str] = None
+        self.status: Dict[str, bool] = {}  # 用户ID -> 今天是否已签到
+
+    def has_checked_in_today(self, user_id: str) -> bool:
+        """检查用户今天是否已经签到"""
+        now = time.localtime()
+        with self.lock:
+            self._roll_over(now)
+            status = self.status.get(user_id)
+        if status is None:
+            status = test_bit(self.db.get_check_in_bits(user_id, now.tm_year), now.tm_yday - 1)
+            with self.lock:
+                if self.today == time.strftime('%Y-%m-%d', now):
+                    self.status[user_id] = status
+        return status
+
+    def check_in(self, user_id: str) -> Optional[Dict]:
+        """签到
+        Returns:
+            今天已签到时返回None，否则返回连续签到天数和本月签到天数
+        """
+        now = time.localtime()
+        if self.has_checked_in_today(user_id):
+            return None
+
+        bits = self.db.set_check_in_bit(user_id, now.tm_year, now.tm_yday - 1)
+        with self.lock:
+            self._roll_over(now)
+            self.status[user_id] = True
+        if bits is None:
+            return None
+
+        month_start = time.localtime(time.mktime((now.tm_year, now.tm_mon, 1, 12, 0, 0, 0, 0, -1)))
+        return {
+            'streak': self._streak(user_id, bits, now),
+            'month_days': count_bits(bits, month_start.tm_yday - 1, now.tm_yday),
+        }
+
+    def _streak(self, user_id: str, bits: bytes, now: time.struct_time) -> int:
+        """连续签到天数，跨年时继续向前一年的位图累加"""
+        index = now.tm_yday - 1
+        streak = trailing_streak(bits, index)
+        year = now.tm_year
+        while streak and streak == index + 1:
+            # 今年从1月1日起全部签到，继续检查上一年年底
+            year -= 1
+            previous = self.db.get_check_in_bits(user_id, year)
+            index = days_in_year(year) - 1
+            extra = trailing_streak(previous, index)
+            streak += extra
+            if extra != index + 1:
+                break
+        return streak
+
+    def _roll_over(self, now: time.struct_time) -> None:
+        """跨天时清空今天的缓存"""
+        today = time.strftime('%Y-%m-%d', now)
+        if today != self.today:
+            self.today = today
+            self.status.clear()
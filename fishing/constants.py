@@ -4,35 +4,6 @@ WEATHER_TYPES = ['晴天', '阴天', '雨天', '暴雨', '极光', '潮汐']
 # 鱼类等级
 FISH_GRADES = ['S', 'A', 'B', 'C', 'D']
 
-# 鱼类数据
-FISH_DATA = {
-    'S': {
-        '金龙鱼': 2000,
-        '霓虹鲤': 1800,
-        '星辰鲈': 1500
-    },
-    'A': {
-        '银鲫鱼': 800,
-        '彩虹鱼': 700,
-        '月光鱼': 600
-    },
-    'B': {
-        '草鱼': 400,
-        '鲤鱼': 300,
-        '鲈鱼': 250
-    },
-    'C': {
-        '小鲫鱼': 150,
-        '泥鳅': 100,
-        '河虾': 80
-    },
-    'D': {
-        '蝌蚪': 30,
-        '小虾米': 20,
-        '水藻': 10
-    }
-}
-
 # 鱼类品质显示
 GRADE_DISPLAY = {
     'S': '【SSR】⭐⭐⭐⭐⭐',
@@ -42,15 +13,6 @@ GRADE_DISPLAY = {
     'D': '【C】⭐'
 }
 
-# 鱼类重量范围(kg)
-FISH_WEIGHT_RANGE = {
-    'S': (15.0, 30.0),
-    'A': (8.0, 15.0),
-    'B': (3.0, 8.0),
-    'C': (1.0, 3.0),
-    'D': (0.1, 1.0)
-}
-
 # 称号数据
 TITLES = {
     'fisher_newbie': {
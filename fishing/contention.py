@@ -0,0 +1,106 @@
+import random
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+# 等锁时间直方图的桶上限(秒)，最后一个桶收集超过上限的等待
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def is_busy_error(error: Exception) -> bool:
+    """是否为 SQLITE_BUSY/SQLITE_LOCKED 引起的错误"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class RetryPolicy:
+    """写事务的加锁重试策略
+
+    每次尝试先由SQLite自身的忙等待处理器短暂等待 busy_timeout 秒，仍拿不到写锁时
+    按指数退避的"完全抖动"随机休眠后重试，多个进程同时退避时不会再次同时撞上。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """初始化重试策略
+        Args:
+            config: 重试配置，即插件配置中的 config['db_retry']
+        """
+        config = config or {}
+        self.max_attempts = config.get('max_attempts', 10)  # 最多尝试次数
+        self.base_delay = config.get('base_delay', 0.005)   # 第一次退避的上限(秒)
+        self.max_delay = config.get('max_delay', 0.5)       # 单次退避的上限(秒)
+        self.busy_timeout = config.get('busy_timeout', 0.05)  # SQLite忙等待时间(秒)
+        self.rng = random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """第attempt次失败后的休眠时间"""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class LockStats:
+    """按操作统计写事务的加锁等待、重试和失败次数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops: Dict[str, Dict] = {}
+
+    def record(self, op: str, wait: float, retries: int, failed: bool = False) -> None:
+        """记录一次加锁
+        Args:
+            op: 操作名称
+            wait: 从开始加锁到拿到锁(或放弃)的时间(秒)
+            retries: 重试次数
+            failed: 是否最终放弃
+        """
+        bucket = len(WAIT_BUCKETS)
+        for index, bound in enumerate(WAIT_BUCKETS):
+            if wait <= bound:
+                bucket = index
+                break
+        with self.lock:
+            stats = self.ops.get(op)
+            if stats is None:
+                stats = self.ops[op] = {
+                    'count': 0, 'retries': 0, 'failures': 0,
+                    'wait_total': 0.0, 'wait_max': 0.0,
+                    'histogram': [0] * (len(WAIT_BUCKETS) + 1),
+                }
+            stats['count'] += 1
+            stats['retries'] += retries
+            stats['failures'] += 1 if failed else 0
+            stats['wait_total'] += wait
+            stats['wait_max'] = max(stats['wait_max'], wait)
+            stats['histogram'][bucket] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """当前统计的副本"""
+        with self.lock:
+            return {op: dict(stats, histogram=list(stats['histogram'])) for op, stats in self.ops.items()}
+
+    @staticmethod
+    def merge(snapshots: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+        """合并多个进程或分片的统计"""
+        merged: Dict[str, Dict] = {}
+        for snapshot in snapshots:
+            for op, stats in snapshot.items():
+                target = merged.get(op)
+                if target is None:
+                    merged[op] = dict(stats, histogram=list(stats['histogram']))
+                    continue
+                for key in ('count', 'retries', 'failures', 'wait_total'):
+                    target[key] += stats[key]
+                target['wait_max'] = max(target['wait_max'], stats['wait_max'])
+                target['histogram'] = [a + b for a, b in zip(target['histogram'], stats['histogram'])]
+        return merged
+
+    @staticmethod
+    def format(snapshot: Dict[str, Dict]) -> List[str]:
+        """每个操作一行: 次数、重试、失败、平均/最大等锁时间"""
+        lines = []
+        for op, stats in sorted(snapshot.items(), key=lambda item: -item[1]['wait_total']):
+            average = stats['wait_total'] / stats['count'] * 1000 if stats['count'] else 0
+            lines.append(f"{op}: {stats['count']}次 重试{stats['retries']} 失败{stats['failures']} "
+                         f"等锁平均{average:.1f}ms 最大{stats['wait_max'] * 1000:.1f}ms")
+        return lines
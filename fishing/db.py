@@ -1,17 +1,122 @@
 import threading
 import sqlite3
-from typing import Dict, List, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
 import time
 import os
 import logging
 
+from .catches import CatchSet, MAX_SPECIMENS, heaviest_weight
+from .contention import LockStats, RetryPolicy, is_busy_error
+from .sql_profiler import SqlProfiler
+
+# 维护全服统计的触发器: global_stats 保存用户数、金币总量和自动钓鱼人数，fish_totals 保存各鱼种的总数和持有人数
+GLOBAL_STATS_TRIGGERS = {
+    'global_stats_user_insert': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_user_insert AFTER INSERT ON user_fishing
+        BEGIN
+            UPDATE global_stats SET value = value + 1 WHERE name = 'users';
+            UPDATE global_stats SET value = value + COALESCE(NEW.coins, 0) WHERE name = 'coins';
+            UPDATE global_stats SET value = value + 1 WHERE name = 'auto_fishers' AND NEW.auto_fishing = 1;
+        END
+    ''',
+    'global_stats_user_delete': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_user_delete AFTER DELETE ON user_fishing
+        BEGIN
+            UPDATE global_stats SET value = value - 1 WHERE name = 'users';
+            UPDATE global_stats SET value = value - COALESCE(OLD.coins, 0) WHERE name = 'coins';
+            UPDATE global_stats SET value = value - 1 WHERE name = 'auto_fishers' AND OLD.auto_fishing = 1;
+        END
+    ''',
+    'global_stats_user_coins': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_user_coins AFTER UPDATE OF coins ON user_fishing
+        WHEN NEW.coins IS NOT OLD.coins
+        BEGIN
+            UPDATE global_stats SET value = value + COALESCE(NEW.coins, 0) - COALESCE(OLD.coins, 0)
+            WHERE name = 'coins';
+        END
+    ''',
+    'global_stats_user_auto': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_user_auto AFTER UPDATE OF auto_fishing ON user_fishing
+        WHEN NEW.auto_fishing IS NOT OLD.auto_fishing
+        BEGIN
+            UPDATE global_stats SET value = value + (COALESCE(NEW.auto_fishing, 0) = 1) - (COALESCE(OLD.auto_fishing, 0) = 1)
+            WHERE name = 'auto_fishers';
+        END
+    ''',
+    'global_stats_fish_insert': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_fish_insert AFTER INSERT ON user_fish
+        BEGIN
+            INSERT INTO fish_totals (fish_id, quantity, holders)
+            VALUES (NEW.fish_id, COALESCE(NEW.quantity, 0), COALESCE(NEW.quantity, 0) > 0)
+            ON CONFLICT(fish_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                               holders = holders + excluded.holders;
+        END
+    ''',
+    'global_stats_fish_delete': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_fish_delete AFTER DELETE ON user_fish
+        BEGIN
+            UPDATE fish_totals SET quantity = quantity - COALESCE(OLD.quantity, 0),
+                                   holders = holders - (COALESCE(OLD.quantity, 0) > 0)
+            WHERE fish_id = OLD.fish_id;
+        END
+    ''',
+    # 数量变化是热点路径(每次钓鱼、卖鱼)，只执行一条语句
+    'global_stats_fish_quantity': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_fish_quantity AFTER UPDATE OF quantity ON user_fish
+        WHEN NEW.quantity IS NOT OLD.quantity AND NEW.fish_id IS OLD.fish_id
+        BEGIN
+            INSERT INTO fish_totals (fish_id, quantity, holders)
+            VALUES (NEW.fish_id, COALESCE(NEW.quantity, 0) - COALESCE(OLD.quantity, 0),
+                    (COALESCE(NEW.quantity, 0) > 0) - (COALESCE(OLD.quantity, 0) > 0))
+            ON CONFLICT(fish_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                               holders = holders + excluded.holders;
+        END
+    ''',
+    'global_stats_fish_move': '''
+        CREATE TRIGGER IF NOT EXISTS global_stats_fish_move AFTER UPDATE OF fish_id ON user_fish
+        WHEN NEW.fish_id IS NOT OLD.fish_id
+        BEGIN
+            UPDATE fish_totals SET quantity = quantity - COALESCE(OLD.quantity, 0),
+                                   holders = holders - (COALESCE(OLD.quantity, 0) > 0)
+            WHERE fish_id = OLD.fish_id;
+            INSERT INTO fish_totals (fish_id, quantity, holders)
+            VALUES (NEW.fish_id, COALESCE(NEW.quantity, 0), COALESCE(NEW.quantity, 0) > 0)
+            ON CONFLICT(fish_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                               holders = holders + excluded.holders;
+        END
+    ''',
+}
+
+
+_NOW_SQL = "strftime('%s', 'now')"
+
+
+def _locked_sql(now: str, alias: str = '') -> str:
+    """禁售中的条数: no_sell_until 之前鱼塘中有 locked_quantity 条(偷来的鱼)不能出售，到期后为0"""
+    return (f"(CASE WHEN {alias}no_sell_until > {now} "
+            f"THEN MIN({alias}locked_quantity, {alias}quantity) ELSE 0 END)")
+
+
+class _BackupRestarted(Exception):
+    """分批备份期间源库被写入，备份已从头开始"""
+
+
 class FishingDB:
-    def __init__(self, db_path: str):
+    INITIAL_COINS = 100  # 新用户的初始金币
+    
+    def __init__(self, db_path: str, config: Optional[Dict] = None):
         """初始化数据库
         Args:
             db_path: 数据库文件路径
+            config: 插件配置，写事务重试配置位于 config['db_retry']，语句统计配置位于 config['sql_profiler']
         """
         self.db_path = db_path
+        self.retry_policy = RetryPolicy((config or {}).get('db_retry'))
+        self.lock_stats = LockStats()
+        self.sql_profiler = SqlProfiler(config, os.path.splitext(os.path.basename(db_path))[0])
+        self._local = threading.local()  # 每个线程复用的连接
+        self.max_specimens = MAX_SPECIMENS  # 每个用户每种鱼单独保存重量的条数
         
         # 确保数据目录存在
         db_dir = os.path.dirname(db_path)
@@ -24,6 +129,13 @@ class FishingDB:
     def init_db(self) -> None:
         """初始化数据库表"""
         with self._get_connection() as conn:
+            # WAL模式下读不阻塞写，写事务拿到锁后提交时也不会因为读者而失败
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+            except sqlite3.OperationalError as e:
+                logging.warning(f"切换WAL模式失败，继续使用当前日志模式: {e}")
+            # 多个进程同时启动时建表也在写事务中串行进行
+            self._begin_immediate(conn, 'init_db')
             cursor = conn.cursor()
             
             # 检查user_fishing表是否存在
@@ -70,10 +182,31 @@ class FishingDB:
                     rarity INTEGER,
                     base_value INTEGER,
                     min_weight INTEGER,
-                    max_weight INTEGER
+                    max_weight INTEGER,
+                    habitat TEXT
                 )
             ''')
             
+            # 旧版本的鱼类表没有栖息地字段
+            cursor.execute("PRAGMA table_info(fish_config)")
+            if 'habitat' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE fish_config ADD COLUMN habitat TEXT")
+            
+            # 记录最近一次同步到数据库的图鉴哈希
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS catalog_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    digest TEXT,
+                    updated_at REAL
+                )
+            ''')
+            
+            # 图鉴和鱼塘按 (稀有度, 价值, ID) 键集分页
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_fish_config_rank
+                ON fish_config(rarity, base_value, id)
+            ''')
+            
             # 创建用户鱼塘表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS user_fish (
@@ -81,6 +214,26 @@ class FishingDB:
                     fish_id INTEGER,
                     quantity INTEGER DEFAULT 0,
                     no_sell_until INTEGER,
+                    locked_quantity INTEGER DEFAULT 0,
+                    PRIMARY KEY (user_id, fish_id)
+                )
+            ''')
+            # 旧版本的禁售期作用于整行，迁移时把仍在禁售期内的整行数量记为禁售数量
+            cursor.execute("PRAGMA table_info(user_fish)")
+            if 'locked_quantity' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE user_fish ADD COLUMN locked_quantity INTEGER DEFAULT 0")
+                cursor.execute(
+                    "UPDATE user_fish SET locked_quantity = quantity WHERE no_sell_until > strftime('%s', 'now')")
+            
+            # 创建逐条捕获记录表，每个用户每种鱼一行，重量和捕获时间打包为BLOB
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_catches (
+                    user_id TEXT,
+                    fish_id INTEGER,
+                    weights BLOB,
+                    times BLOB,
+                    bulk_count INTEGER DEFAULT 0,
+                    bulk_weight INTEGER DEFAULT 0,
                     PRIMARY KEY (user_id, fish_id)
                 )
             ''')
@@ -95,7 +248,7 @@ class FishingDB:
                 )
             ''')
             
-            # 创建签到记录表
+            # 创建签到记录表(旧版逐日记录，现仅用于迁移到位图签到表)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS check_ins (
                     user_id TEXT,
@@ -104,6 +257,17 @@ class FishingDB:
                 )
             ''')
             
+            # 创建位图签到表，每个用户每年一行
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS check_in_bits (
+                    user_id TEXT,
+                    year INTEGER,
+                    bits BLOB,
+                    PRIMARY KEY (user_id, year)
+                )
+            ''')
+            self._migrate_check_ins(cursor)
+            
             # 创建钓鱼记录表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS fishing_records (
@@ -116,17 +280,163 @@ class FishingDB:
                 )
             ''')
             
+            # 创建市场挂单表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS market_orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT,
+                    fish_id INTEGER,
+                    side TEXT,
+                    price INTEGER,
+                    quantity INTEGER,
+                    remaining INTEGER,
+                    status TEXT DEFAULT 'open',
+                    created_at REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_market_orders_status
+                ON market_orders (status, fish_id)
+            ''')
+            
+            # 创建卖单托管的鱼的重量记录表，撤单时退还给卖家
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS market_escrow (
+                    order_id INTEGER PRIMARY KEY,
+                    weights BLOB,
+                    times BLOB,
+                    bulk_count INTEGER DEFAULT 0,
+                    bulk_weight INTEGER DEFAULT 0
+                )
+            ''')
+            
+            # 创建市场成交记录表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS market_fills (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fish_id INTEGER,
+                    price INTEGER,
+                    quantity INTEGER,
+                    buy_order_id INTEGER,
+                    sell_order_id INTEGER,
+                    buyer_id TEXT,
+                    seller_id TEXT,
+                    created_at REAL
+                )
+            ''')
+            
+            # 创建用户统计表(称号、成就、每日任务的计数器)，每日计数器的day为日期，累计计数器为空字符串
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id TEXT,
+                    metric TEXT,
+                    day TEXT DEFAULT '',
+                    value INTEGER DEFAULT 0,
+                    PRIMARY KEY (user_id, metric)
+                )
+            ''')
+            
+            # 创建用户已达成的称号/成就/每日任务表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_achievements (
+                    user_id TEXT,
+                    kind TEXT,
+                    rule_key TEXT,
+                    day TEXT DEFAULT '',
+                    achieved_at REAL,
+                    PRIMARY KEY (user_id, kind, rule_key, day)
+                )
+            ''')
+            
+            # 创建用户图鉴表(钓到过的鱼种)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_species (
+                    user_id TEXT,
+                    fish_id INTEGER,
+                    PRIMARY KEY (user_id, fish_id)
+                )
+            ''')
+            
+            # 创建金币流水表(只追加)和余额检查点表
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='coin_checkpoints'")
+            seed_checkpoints = cursor.fetchone() is None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS coin_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    delta INTEGER NOT NULL,
+                    reason TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_coin_ledger_user
+                ON coin_ledger(user_id, id)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS coin_checkpoints (
+                    user_id TEXT PRIMARY KEY,
+                    balance INTEGER NOT NULL,
+                    ledger_id INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS coin_ledger_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    reconciled_id INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute("INSERT OR IGNORE INTO coin_ledger_state (id, reconciled_id) VALUES (1, 0)")
+            if seed_checkpoints:
+                # 引入流水之前的余额没有流水记录，以当前余额作为初始检查点
+                cursor.execute('''
+                    INSERT INTO coin_checkpoints (user_id, balance, ledger_id, updated_at)
+                    SELECT user_id, coins, 0, ? FROM user_fishing
+                ''', (time.time(),))
+            
+            # 创建用户资料表(从消息中观察到的昵称)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_profile (
+                    user_id TEXT PRIMARY KEY,
+                    nickname TEXT,
+                    updated_at REAL
+                )
+            ''')
+            
+            # 创建由触发器维护的全服统计表，经济概况只读这几行，不扫描用户表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS global_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fish_totals (
+                    fish_id INTEGER PRIMARY KEY,
+                    quantity INTEGER NOT NULL DEFAULT 0,
+                    holders INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            for trigger in GLOBAL_STATS_TRIGGERS.values():
+                cursor.execute(trigger)
+            # 新建的统计表(或导入数据时清空的统计表)按现有数据扫描一次
+            cursor.execute("SELECT COUNT(*) FROM global_stats")
+            if cursor.fetchone()[0] == 0:
+                self._rebuild_global_stats(cursor)
+            
             conn.commit()
     
     def get_user_fish(self, user_id: str) -> List[Dict]:
         """获取用户的鱼塘信息"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT f.id, f.name, f.rarity, uf.quantity, f.base_value,
-                       CASE WHEN uf.no_sell_until > strftime('%s', 'now') 
+                       CASE WHEN uf.no_sell_until > strftime('%s', 'now') AND uf.locked_quantity > 0
                             THEN uf.no_sell_until - strftime('%s', 'now')
-                            ELSE 0 END as lock_time
+                            ELSE 0 END as lock_time,
+                       {_locked_sql(_NOW_SQL, 'uf.')} as locked
                 FROM user_fish uf
                 JOIN fish_config f ON uf.fish_id = f.id
                 WHERE uf.user_id = ? AND uf.quantity > 0
@@ -141,67 +451,194 @@ class FishingDB:
                     'rarity': row[2],
                     'quantity': row[3],
                     'base_value': row[4],
-                    'lock_time': row[5]
+                    'lock_time': row[5],
+                    'locked': row[6]
                 })
             return results
     
+    def iter_user_fish_page(self, user_id: str, after: Optional[Tuple] = None,
+                            limit: int = 20) -> Iterator[Dict]:
+        """按 稀有度、价值、ID 降序逐行返回用户鱼塘的一页
+        Args:
+            user_id: 用户ID
+            after: 上一页最后一行的 (稀有度, 价值, ID)，第一页为None
+            limit: 返回的行数
+        """
+        where, params = self._page_condition("uf.user_id = ? AND uf.quantity > 0", [user_id], None, after)
+        cursor = self._get_cached_connection().execute(f"""
+            SELECT f.id, f.name, f.rarity, uf.quantity, f.base_value,
+                   CASE WHEN uf.no_sell_until > strftime('%s', 'now') AND uf.locked_quantity > 0
+                        THEN uf.no_sell_until - strftime('%s', 'now')
+                        ELSE 0 END as lock_time,
+                   {_locked_sql(_NOW_SQL, 'uf.')} as locked,
+                   uc.weights
+            FROM user_fish uf
+            JOIN fish_config f ON uf.fish_id = f.id
+            LEFT JOIN user_catches uc ON uc.user_id = uf.user_id AND uc.fish_id = uf.fish_id
+            WHERE {where}
+            ORDER BY f.rarity DESC, f.base_value DESC, f.id DESC
+            LIMIT ?
+        """, params + [limit])
+        for row in cursor:
+            yield {
+                'id': row[0],
+                'name': row[1],
+                'rarity': row[2],
+                'quantity': row[3],
+                'base_value': row[4],
+                'lock_time': row[5],
+                'locked': row[6],
+                'heaviest': heaviest_weight(row[7])
+            }
+    
+    def seek_user_fish(self, user_id: str, after: Optional[Tuple], rows: int) -> Optional[Tuple]:
+        """从after之后跳过rows行，返回最后一行的分页键，行数不够时返回None"""
+        where, params = self._page_condition("uf.user_id = ? AND uf.quantity > 0", [user_id], None, after)
+        row = self._get_cached_connection().execute(f"""
+            SELECT f.rarity, f.base_value, f.id
+            FROM user_fish uf
+            JOIN fish_config f ON uf.fish_id = f.id
+            WHERE {where}
+            ORDER BY f.rarity DESC, f.base_value DESC, f.id DESC
+            LIMIT 1 OFFSET ?
+        """, params + [rows - 1]).fetchone()
+        return tuple(row) if row else None
+    
+    def iter_fish_types_page(self, rarity: Optional[int] = None, after: Optional[Tuple] = None,
+                             limit: int = 20) -> Iterator[Dict]:
+        """按 稀有度、价值、ID 降序逐行返回图鉴的一页，可只看某个稀有度"""
+        where, params = self._page_condition("1 = 1", [], rarity, after)
+        cursor = self._get_cached_connection().execute(f"""
+            SELECT id, name, rarity, base_value, habitat FROM fish_config f
+            WHERE {where}
+            ORDER BY f.rarity DESC, f.base_value DESC, f.id DESC
+            LIMIT ?
+        """, params + [limit])
+        for row in cursor:
+            yield {'id': row[0], 'name': row[1], 'rarity': row[2], 'base_value': row[3], 'habitat': row[4]}
+    
+    def seek_fish_types(self, rarity: Optional[int], after: Optional[Tuple], rows: int) -> Optional[Tuple]:
+        """从after之后跳过rows行，返回最后一行的分页键，行数不够时返回None"""
+        where, params = self._page_condition("1 = 1", [], rarity, after)
+        row = self._get_cached_connection().execute(f"""
+            SELECT rarity, base_value, id FROM fish_config f
+            WHERE {where}
+            ORDER BY f.rarity DESC, f.base_value DESC, f.id DESC
+            LIMIT 1 OFFSET ?
+        """, params + [rows - 1]).fetchone()
+        return tuple(row) if row else None
+    
+    @staticmethod
+    def _page_condition(where: str, params: List, rarity: Optional[int],
+                        after: Optional[Tuple]) -> Tuple[str, List]:
+        """拼接分页条件，使查询能沿 idx_fish_config_rank 索引定位"""
+        params = list(params)
+        if rarity is not None:
+            where += " AND f.rarity = ?"
+            params.append(rarity)
+            if after:
+                where += " AND (f.base_value, f.id) < (?, ?)"
+                params.extend(after[1:])
+        elif after:
+            where += " AND (f.rarity, f.base_value, f.id) < (?, ?, ?)"
+            params.extend(after)
+        return where, params
+    
     def get_user_coins(self, user_id: str) -> int:
         """获取用户金币数量，如果用户不存在则创建"""
         try:
-            with self._get_connection() as conn:
+            # 已有用户只需读取，不占用写锁
+            result = self._get_cached_connection().execute(
+                "SELECT coins FROM user_fishing WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+            if result:
+                return result[0]
+            
+            with self._write('get_user_coins') as conn:
                 cursor = conn.cursor()
-                # 先尝试创建用户
-                cursor.execute('''
-                    INSERT OR IGNORE INTO user_fishing (user_id, coins)
-                    VALUES (?, 100)
-                ''', (user_id,))
-                conn.commit()
-                
-                # 然后获取金币数量
+                self._ensure_user_exists(cursor, user_id)
                 cursor.execute(
                     "SELECT coins FROM user_fishing WHERE user_id = ?",
                     (user_id,)
                 )
                 result = cursor.fetchone()
-                return result[0] if result else 0
+                conn.commit()
+            return result[0] if result else 0
         except Exception as e:
             logging.error(f"获取用户金币失败: {e}")
             return 0
     
     def has_checked_in_today(self, user_id: str) -> bool:
         """检查用户今天是否已经签到"""
-        with sqlite3.connect(self.db_path) as conn:
+        now = time.localtime()
+        bits = self.get_check_in_bits(user_id, now.tm_year)
+        index = now.tm_yday - 1
+        return bool(bits) and bool(int.from_bytes(bits, 'little') >> index & 1)
+    
+    def record_check_in(self, user_id: str) -> bool:
+        """记录用户签到，今天已签到时返回False"""
+        now = time.localtime()
+        return self.set_check_in_bit(user_id, now.tm_year, now.tm_yday - 1) is not None
+    
+    def get_check_in_bits(self, user_id: str, year: int) -> Optional[bytes]:
+        """获取用户某一年的签到位图"""
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT COUNT(*) FROM check_ins 
-                WHERE user_id = ? AND check_in_date = date('now', 'localtime')
-            ''', (user_id,))
-            return cursor.fetchone()[0] > 0
+            cursor.execute(
+                "SELECT bits FROM check_in_bits WHERE user_id = ? AND year = ?",
+                (user_id, year)
+            )
+            result = cursor.fetchone()
+            return result[0] if result else None
     
-    def record_check_in(self, user_id: str) -> None:
-        """记录用户签到"""
-        with sqlite3.connect(self.db_path) as conn:
+    def set_check_in_bit(self, user_id: str, year: int, day_index: int) -> Optional[bytes]:
+        """设置签到位，该位已设置时返回None，否则返回新的位图"""
+        with self._write('set_check_in_bit') as conn:
             cursor = conn.cursor()
+            # 先写入空行，保证后续读改写时该行存在
             cursor.execute('''
-                INSERT INTO check_ins (user_id, check_in_date)
-                VALUES (?, date('now', 'localtime'))
-            ''', (user_id,))
+                INSERT OR IGNORE INTO check_in_bits (user_id, year, bits)
+                VALUES (?, ?, zeroblob(46))
+            ''', (user_id, year))
+            cursor.execute(
+                "SELECT bits FROM check_in_bits WHERE user_id = ? AND year = ?",
+                (user_id, year)
+            )
+            value = int.from_bytes(cursor.fetchone()[0], 'little')
+            if value >> day_index & 1:
+                conn.rollback()
+                return None
+            
+            bits = (value | (1 << day_index)).to_bytes(46, 'little')
+            cursor.execute(
+                "UPDATE check_in_bits SET bits = ? WHERE user_id = ? AND year = ?",
+                (bits, user_id, year)
+            )
             conn.commit()
+            return bits
     
-    def update_user_coins(self, user_id: str, amount: int) -> None:
-        """更新用户金币"""
-        with sqlite3.connect(self.db_path) as conn:
+    def update_user_coins(self, user_id: str, amount: int, reason: str = 'unknown') -> None:
+        """更新用户金币
+        Args:
+            user_id: 用户ID
+            amount: 金币变动，负数为扣除
+            reason: 变动原因，记入金币流水
+        """
+        with self._write('update_user_coins') as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE user_fishing 
                 SET coins = coins + ?
                 WHERE user_id = ?
             ''', (amount, user_id))
+            if cursor.rowcount:
+                self._log_coins(cursor, [(user_id, amount, reason)])
             conn.commit()
     
     def get_user_current_bait(self, user_id: str) -> Optional[str]:
         """获取用户当前使用的鱼饵"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT current_bait FROM user_fishing WHERE user_id = ?",
@@ -212,7 +649,7 @@ class FishingDB:
     
     def add_user_bait(self, user_id: str, bait_name: str) -> None:
         """添加用户鱼饵"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write('add_user_bait') as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO user_bait (user_id, bait_id, quantity)
@@ -224,7 +661,7 @@ class FishingDB:
     
     def show_my_baits(self, user_id: str) -> List[Dict]:
         """查看用户的鱼饵"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT bait_id, quantity FROM user_bait
@@ -233,9 +670,14 @@ class FishingDB:
             
             return [{"bait_id": row[0], "quantity": row[1]} for row in cursor.fetchall()]
     
-    def add_fish_to_pond(self, user_id: str, fish_id: int) -> None:
-        """添加鱼到用户鱼塘"""
-        with sqlite3.connect(self.db_path) as conn:
+    def add_fish_to_pond(self, user_id: str, fish_id: int, weight: Optional[int] = None,
+                         catch_time: Optional[float] = None) -> None:
+        """添加鱼到用户鱼塘
+        Args:
+            weight: 重量(克)，为None时只增加数量
+            catch_time: 捕获时间，默认为当前时间
+        """
+        with self._write('add_fish_to_pond') as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO user_fish (user_id, fish_id, quantity, no_sell_until)
@@ -243,11 +685,59 @@ class FishingDB:
                 ON CONFLICT(user_id, fish_id) DO UPDATE
                 SET quantity = quantity + 1
             ''', (user_id, fish_id))
+            if weight is not None:
+                catches = self._load_catches(cursor, user_id, fish_id)
+                catches.add(weight, catch_time or time.time(), self.max_specimens)
+                self._save_catches(cursor, user_id, fish_id, catches)
             conn.commit()
     
+    def get_user_catches(self, user_id: str, fish_id: int) -> CatchSet:
+        """获取用户某种鱼的捕获记录，重量未知的鱼计入 unknown"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            catches = self._load_catches(cursor, user_id, fish_id)
+            cursor.execute(
+                "SELECT quantity FROM user_fish WHERE user_id = ? AND fish_id = ?",
+                (user_id, fish_id))
+            row = cursor.fetchone()
+            quantity = row[0] if row else 0
+            catches.unknown = max(quantity - len(catches.weights) - catches.bulk_count, 0)
+            return catches
+    
+    @staticmethod
+    def _load_catches(cursor, user_id: str, fish_id: int) -> CatchSet:
+        cursor.execute('''
+            SELECT weights, times, bulk_count, bulk_weight FROM user_catches
+            WHERE user_id = ? AND fish_id = ?
+        ''', (user_id, fish_id))
+        return CatchSet.from_row(cursor.fetchone())
+    
+    @staticmethod
+    def _save_catches(cursor, user_id: str, fish_id: int, catches: CatchSet) -> None:
+        if not catches.weights and not catches.bulk_count:
+            cursor.execute("DELETE FROM user_catches WHERE user_id = ? AND fish_id = ?", (user_id, fish_id))
+            return
+        cursor.execute('''
+            INSERT OR REPLACE INTO user_catches (user_id, fish_id, weights, times, bulk_count, bulk_weight)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, fish_id) + catches.to_row())
+    
+    def _take_catches(self, cursor, user_id: str, fish_id: int, amount: int) -> CatchSet:
+        """在已扣减鱼塘数量的事务中取出对应的捕获记录"""
+        cursor.execute(
+            "SELECT quantity FROM user_fish WHERE user_id = ? AND fish_id = ?",
+            (user_id, fish_id))
+        row = cursor.fetchone()
+        quantity = (row[0] if row else 0) + amount
+        catches = self._load_catches(cursor, user_id, fish_id)
+        taken = catches.take(amount, quantity)
+        if taken.unknown < amount:
+            self._save_catches(cursor, user_id, fish_id, catches)
+        return taken
+    
     def get_bait_info(self, user_id: str) -> Optional[Dict]:
         """获取用户鱼饵信息"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT current_bait, bait_start_time 
@@ -265,7 +755,7 @@ class FishingDB:
     
     def get_auto_fishing_status(self, user_id: str) -> bool:
         """获取用户自动钓鱼状态"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT auto_fishing FROM user_fishing WHERE user_id = ?",
@@ -277,7 +767,7 @@ class FishingDB:
     def set_auto_fishing_status(self, user_id: str, status: bool) -> bool:
         """设置用户自动钓鱼状态"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write('set_auto_fishing_status') as conn:
                 cursor = conn.cursor()
                 self._ensure_user_exists(cursor, user_id)  # 确保用户存在
                 
@@ -294,16 +784,36 @@ class FishingDB:
     
     def get_auto_fishing_users(self) -> List[str]:
         """获取所有开启自动钓鱼的用户"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT user_id FROM user_fishing WHERE auto_fishing = 1"
             )
             return [row[0] for row in cursor.fetchall()]
     
+    def get_auto_fishing_schedule(self) -> List[Tuple[str, float]]:
+        """获取所有开启自动钓鱼的用户及其上次钓鱼时间"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT user_id, last_fishing_time FROM user_fishing WHERE auto_fishing = 1"
+            )
+            return [(row[0], float(row[1]) if row[1] else 0) for row in cursor.fetchall()]
+    
+    def get_top_users_by_coins(self, limit: int = 10) -> List[Dict]:
+        """获取金币最多的用户"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, coins FROM user_fishing
+                ORDER BY coins DESC
+                LIMIT ?
+            ''', (limit,))
+            return [{'user_id': row[0], 'coins': row[1]} for row in cursor.fetchall()]
+    
     def get_last_fishing_time(self, user_id: str) -> float:
         """获取用户上次钓鱼时间"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT last_fishing_time FROM user_fishing WHERE user_id = ?",
@@ -315,7 +825,7 @@ class FishingDB:
     def update_last_fishing_time(self, user_id: str) -> None:
         """更新用户上次钓鱼时间"""
         current_time = time.time()
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write('update_last_fishing_time') as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE user_fishing 
@@ -369,95 +879,328 @@ class FishingDB:
             logging.error(f"获取鱼类信息失败: {e}", exc_info=True)
             return f"获取鱼类信息失败: {e}"
     
-    def initialize_fish_types(self):
-        """初始化或更新鱼类数据"""
+    def initialize_fish_types(self, rows: List[Tuple], digest: str = ''):
+        """初始化或更新鱼类数据
+        Args:
+            rows: 鱼类数据 (id, name, rarity, base_value, min_weight, max_weight, habitat)
+            digest: 图鉴内容哈希，与上次同步的哈希相同时跳过写入
+        """
         try:
-            with self._get_connection() as conn:
+            with self._write('initialize_fish_types') as conn:
                 cursor = conn.cursor()
+                cursor.execute("SELECT digest FROM catalog_state WHERE id = 1")
+                row = cursor.fetchone()
+                if digest and row and row[0] == digest:
+                    return f"鱼类数据已是最新({len(rows)}种)"
                 
-                # 获取已有鱼类ID
-                cursor.execute("SELECT id FROM fish_config")
-                existing_ids = {row[0] for row in cursor.fetchall()}
-                
-                # 定义所有鱼类数据
-                fish_data = [
-                    # 河鱼（淡水鱼）
-                    (1, '小鲫鱼', 1, 10, 100, 500),
-                    (2, '草鱼', 2, 50, 500, 2000),
-                    (3, '鲤鱼', 2, 60, 600, 2500),
-                    (4, '鲈鱼', 3, 100, 800, 3000),
-                    (5, '黑鱼', 3, 150, 1000, 4000),
-                    (6, '金龙鱼', 4, 500, 2000, 8000),
-                    (7, '锦鲤', 5, 1000, 5000, 15000),
-                    (8, '泥鳅', 1, 15, 50, 200),
-                    (9, '小虾', 1, 20, 30, 100),
-                    (10, '鲢鱼', 2, 55, 500, 2000),
-                    (11, '鳊鱼', 2, 65, 600, 2500),
-                    (12, '鳜鱼', 3, 120, 1000, 5000),
-                    (13, '胭脂鱼', 3, 180, 1200, 6000),
-                    (14, '清道夫', 4, 600, 2000, 10000),
-                    (15, '娃娃鱼', 4, 800, 3000, 15000),
-                    
-                    # 海鱼（咸水鱼）
-                    (16, '沙丁鱼', 1, 12, 100, 300),
-                    (17, '小黄鱼', 1, 18, 150, 400),
-                    (18, '海虾', 1, 25, 50, 150),
-                    (19, '鲅鱼', 2, 70, 700, 3000),
-                    (20, '带鱼', 2, 75, 800, 3500),
-                    (21, '黄花鱼', 2, 80, 900, 4000),
-                    (22, '鲳鱼', 2, 85, 1000, 4500),
-                    (23, '鲨鱼', 3, 200, 5000, 20000),
-                    (24, '金枪鱼', 3, 250, 6000, 25000),
-                    (25, '石斑鱼', 3, 300, 7000, 30000),
-                    (26, '鲷鱼', 3, 350, 8000, 35000),
-                    (27, '蓝鳍金枪鱼', 4, 1000, 10000, 50000),
-                    (28, '剑鱼', 4, 1200, 12000, 60000),
-                    (29, '海豚', 4, 1500, 15000, 70000),
-                    (30, '鲸鱼', 4, 2000, 20000, 100000),
-                    (31, '龙王', 5, 5000, 50000, 200000),
-                    (32, '美人鱼', 5, 8000, 80000, 300000),
-                    (33, '深海巨妖', 5, 10000, 100000, 500000),
-                    (34, '海神三叉戟', 5, 15000, 150000, 1000000)
-                ]
-                
-                # 插入或更新鱼类数据
-                for fish in fish_data:
-                    fish_id = fish[0]
-                    
-                    if fish_id in existing_ids:
-                        # 更新现有鱼类
-                        cursor.execute("""
-                            UPDATE fish_config 
-                            SET name = ?, rarity = ?, base_value = ?, min_weight = ?, max_weight = ?
-                            WHERE id = ?
-                        """, (fish[1], fish[2], fish[3], fish[4], fish[5], fish_id))
-                    else:
-                        # 插入新鱼类
-                        cursor.execute("""
-                            INSERT INTO fish_config (id, name, rarity, base_value, min_weight, max_weight)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, fish)
+                # 插入或更新鱼类数据，图鉴中删除的鱼保留在数据库中，玩家鱼塘里的鱼仍可显示和出售
+                cursor.executemany("""
+                    INSERT INTO fish_config (id, name, rarity, base_value, min_weight, max_weight, habitat)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE
+                    SET name = excluded.name, rarity = excluded.rarity, base_value = excluded.base_value,
+                        min_weight = excluded.min_weight, max_weight = excluded.max_weight,
+                        habitat = excluded.habitat
+                """, rows)
+                cursor.execute("""
+                    INSERT INTO catalog_state (id, digest, updated_at) VALUES (1, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET digest = excluded.digest, updated_at = excluded.updated_at
+                """, (digest, time.time()))
                 
                 conn.commit()
-                return f"成功初始化/更新了 {len(fish_data)} 种鱼类数据"
+                return f"成功初始化/更新了 {len(rows)} 种鱼类数据"
         except Exception as e:
             logging.error(f"初始化鱼类数据失败: {e}", exc_info=True)
             return f"初始化鱼类数据失败: {e}"
     
+    def backup_to(self, target: str, pages_per_step: int = 64, step_sleep: float = 0) -> Dict:
+        """在线备份到target，分批复制页面，每批之间休眠step_sleep秒
+
+        其他连接在两批之间写入源库会让备份从第一页重新开始，写入频繁时分批复制可能永远完成不了；
+        发现重新开始后改为一次复制全部页面，复制期间持有一个读事务，WAL模式下不阻塞写入。
+        Returns:
+            {'pages': 总页数, 'steps': 批次数, 'restarted': 是否因源库写入改为一次复制}
+        """
+        stats = {'pages': 0, 'steps': 0, 'restarted': False}
+        last_remaining = [None]
+
+        def progress(status, remaining, total):
+            stats['pages'] = total
+            stats['steps'] += 1
+            # 正常情况下剩余页数逐批减少，不减反增说明源库被写入后备份重新开始了
+            if last_remaining[0] is not None and remaining >= last_remaining[0]:
+                raise _BackupRestarted()
+            last_remaining[0] = remaining
+            # 在两批之间让出时间，源库此时没有持有读锁
+            if remaining and step_sleep > 0:
+                time.sleep(step_sleep)
+
+        source = sqlite3.connect(self.db_path)
+        dest = sqlite3.connect(target)
+        try:
+            try:
+                source.backup(dest, pages=pages_per_step, progress=progress)
+            except _BackupRestarted:
+                stats['restarted'] = True
+                logging.info(f"备份期间数据库被写入，改为一次复制全部页面: {self.db_path}")
+                source.backup(dest, pages=-1)
+                stats['steps'] += 1
+        finally:
+            dest.close()
+            source.close()
+        return stats
+    
+    def get_global_stats(self) -> Dict:
+        """读取触发器维护的全服统计
+        Returns:
+            {'users', 'coins', 'auto_fishers', 'fish': {鱼ID: {'quantity', 'holders'}}}，不含已无人持有的鱼种
+        """
+        cursor = self._get_cached_connection().cursor()
+        # 一条语句读取两张表，结果来自同一个快照
+        cursor.execute('''
+            SELECT name, value, NULL FROM global_stats
+            UNION ALL
+            SELECT fish_id, quantity, holders FROM fish_totals WHERE quantity != 0 OR holders != 0
+        ''')
+        stats = {'users': 0, 'coins': 0, 'auto_fishers': 0, 'fish': {}}
+        for key, value, holders in cursor.fetchall():
+            if holders is None:
+                stats[key] = value
+            else:
+                stats['fish'][key] = {'quantity': value, 'holders': holders}
+        return stats
+    
+    def rebuild_global_stats(self) -> Dict:
+        """扫描用户表和鱼塘表重新计算全服统计，用于核对触发器维护的结果"""
+        with self._write('rebuild_global_stats') as conn:
+            self._rebuild_global_stats(conn.cursor())
+        return self.get_global_stats()
+    
+    def _rebuild_global_stats(self, cursor) -> None:
+        cursor.execute('''
+            SELECT COUNT(*), COALESCE(SUM(coins), 0), COALESCE(SUM(auto_fishing = 1), 0) FROM user_fishing
+        ''')
+        users, coins, auto_fishers = cursor.fetchone()
+        cursor.execute("DELETE FROM global_stats")
+        cursor.executemany("INSERT INTO global_stats (name, value) VALUES (?, ?)",
+                           [('users', users), ('coins', coins), ('auto_fishers', auto_fishers)])
+        cursor.execute("DELETE FROM fish_totals")
+        cursor.execute('''
+            INSERT INTO fish_totals (fish_id, quantity, holders)
+            SELECT fish_id, SUM(COALESCE(quantity, 0)), SUM(COALESCE(quantity, 0) > 0)
+            FROM user_fish GROUP BY fish_id
+        ''')
+    
+    def close(self) -> None:
+        """把WAL合并回数据库文件并关闭当前线程的连接
+        
+        合并后数据库文件不会再因为最后一个连接关闭时的自动合并而改变，热启动快照的文件指纹保持有效。
+        """
+        conn = self._get_cached_connection()
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError as e:
+            logging.warning(f"合并WAL失败: {e}")
+        conn.close()
+        self._local.conn = None
+    
     def _get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """获取数据库连接，语句统计开启时安装统计回调"""
+        conn = sqlite3.connect(self.db_path, timeout=self.retry_policy.busy_timeout)
+        if self.sql_profiler.enabled:
+            self.sql_profiler.sync(conn)
+        return conn
+    
+    def _get_cached_connection(self):
+        """获取当前线程复用的数据库连接，热点路径上避免重复建立连接和编译语句
+        
+        语句统计在运行中开关后，连接在这里按新的开关安装或移除回调。
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            generation = self.sql_profiler.generation
+            conn = self._get_connection()
+            self._local.conn = conn
+            self._local.profiler_generation = generation
+        elif self._local.profiler_generation != self.sql_profiler.generation:
+            self.sql_profiler.sync(conn)
+            self._local.profiler_generation = self.sql_profiler.generation
+        return conn
+    
+    @contextmanager
+    def _write(self, op: str):
+        """写事务，用 BEGIN IMMEDIATE 在开始时就拿到写锁
+        
+        延迟事务在读后升级为写时可能直接返回 SQLITE_BUSY 且无法重试，立即事务只会在 BEGIN 时等锁，
+        等锁失败可以安全地退避重试。事务体中可以自行提交或回滚，异常时自动回滚。
+        Args:
+            op: 操作名称，用于统计等锁时间和重试次数
+        """
+        conn = self._get_cached_connection()
+        self._begin_immediate(conn, op)
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        if conn.in_transaction:
+            conn.commit()
+    
+    def _begin_immediate(self, conn, op: str) -> None:
+        """开始立即写事务，数据库被其他连接锁定时按重试策略抖动退避"""
+        policy = self.retry_policy
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                attempt += 1
+                if not is_busy_error(e) or attempt >= policy.max_attempts:
+                    self.lock_stats.record(op, time.perf_counter() - started, attempt - 1, failed=True)
+                    logging.error(f"数据库写事务 {op} 在{attempt}次尝试后仍无法加锁: {e}")
+                    raise
+                time.sleep(policy.delay(attempt))
+        self.lock_stats.record(op, time.perf_counter() - started, attempt)
     
-    def _ensure_user_exists(self, cursor, user_id):
-        """确保用户存在于数据库中"""
+    def _migrate_check_ins(self, cursor) -> None:
+        """把旧的逐日签到记录迁移为位图，只在位图表为空时执行一次"""
+        cursor.execute("SELECT 1 FROM check_in_bits LIMIT 1")
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'check_ins'")
+        if cursor.fetchone() is None:
+            return
+        
+        bitmaps: Dict[tuple, int] = {}
+        cursor.execute("SELECT user_id, check_in_date FROM check_ins")
+        for user_id, check_in_date in cursor.fetchall():
+            try:
+                day = time.strptime(check_in_date, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                continue
+            key = (user_id, day.tm_year)
+            bitmaps[key] = bitmaps.get(key, 0) | (1 << (day.tm_yday - 1))
+        
+        if bitmaps:
+            cursor.executemany(
+                "INSERT INTO check_in_bits (user_id, year, bits) VALUES (?, ?, ?)",
+                [(user_id, year, value.to_bytes(46, 'little')) for (user_id, year), value in bitmaps.items()]
+            )
+            logging.info(f"已将签到记录迁移为位图: {len(bitmaps)}个用户年度")
+    
+    def _ensure_user_exists(self, cursor, user_id) -> bool:
+        """确保用户存在于数据库中，新建用户时返回True
+        
+        新用户的初始金币在同一事务中记入流水
+        """
         cursor.execute('''
             INSERT OR IGNORE INTO user_fishing (user_id, coins)
-            VALUES (?, 100)
-        ''', (user_id,))
+            VALUES (?, ?)
+        ''', (user_id, self.INITIAL_COINS))
+        created = cursor.rowcount == 1
+        if created:
+            self._log_coins(cursor, [(user_id, self.INITIAL_COINS, 'initial')])
+        return created
+    
+    @staticmethod
+    def _log_coins(cursor, entries: List[tuple]) -> None:
+        """在金币变动所在的写事务中记录流水，流水与余额一同提交或回滚
+        Args:
+            entries: (user_id, delta, reason)
+        """
+        now = time.time()
+        cursor.executemany('''
+            INSERT INTO coin_ledger (user_id, delta, reason, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', [(user_id, delta, reason, now) for user_id, delta, reason in entries if delta])
+    
+    def reconcile_coins(self, batch_size: int = 5000) -> Dict:
+        """从上次对账位置开始增量核对余额
+        
+        取出上次对账之后新增的流水涉及的用户，核对 检查点余额 + 检查点之后的流水 = 当前余额，
+        一致则把检查点推进到最新流水。核对和推进在同一个写事务中进行；金币变动与流水总在同一事务中提交，
+        其他连接或进程的变动不会出现只有余额没有流水的中间状态。仍不一致的用户写入一条 reconcile 调整流水并记录警告。
+        Returns:
+            {'users', 'mismatches', 'reconciled_id', 'done'}
+        """
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT reconciled_id FROM coin_ledger_state WHERE id = 1")
+            start_id = cursor.fetchone()[0]
+            cursor.execute('''
+                SELECT id, user_id FROM coin_ledger WHERE id > ? ORDER BY id LIMIT ?
+            ''', (start_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return {'users': 0, 'mismatches': [], 'reconciled_id': start_id, 'done': True}
+            end_id = rows[-1][0]
+            user_ids = list(dict.fromkeys(row[1] for row in rows))
+            
+            # 先在事务外粗查，缩小需要在写事务中复核的范围
+            suspects = list(self._check_balances(cursor, user_ids))
+            
+            now = time.time()
+            self._begin_immediate(conn, 'reconcile_coins')
+            try:
+                adjustments = []
+                for user_id, (expected, actual) in self._check_balances(cursor, suspects).items():
+                    adjustments.append((user_id, actual - expected, 'reconcile', now))
+                    logging.warning(f"金币对账不一致: 用户 {user_id} 流水推算 {expected}，实际 {actual}")
+                cursor.executemany('''
+                    INSERT INTO coin_ledger (user_id, delta, reason, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', adjustments)
+                # 检查点推进到用户的最新流水，余额取当前值
+                cursor.executemany('''
+                    INSERT INTO coin_checkpoints (user_id, balance, ledger_id, updated_at)
+                    SELECT u.user_id, u.coins,
+                           (SELECT MAX(id) FROM coin_ledger WHERE user_id = u.user_id), ?
+                    FROM user_fishing u WHERE u.user_id = ?
+                    ON CONFLICT(user_id) DO UPDATE
+                    SET balance = excluded.balance, ledger_id = excluded.ledger_id,
+                        updated_at = excluded.updated_at
+                ''', [(now, user_id) for user_id in user_ids])
+                cursor.execute("UPDATE coin_ledger_state SET reconciled_id = ? WHERE id = 1", (end_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return {
+                'users': len(user_ids),
+                'mismatches': [(user_id, delta) for user_id, delta, _, _ in adjustments],
+                'reconciled_id': end_id,
+                'done': len(rows) < batch_size,
+            }
+    
+    @staticmethod
+    def _check_balances(cursor, user_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        """核对用户余额，返回不一致的用户 -> (流水推算余额, 实际余额)"""
+        mismatched = {}
+        for user_id in user_ids:
+            cursor.execute('''
+                SELECT u.coins, COALESCE(c.balance, 0), COALESCE(c.ledger_id, 0)
+                FROM user_fishing u
+                LEFT JOIN coin_checkpoints c ON c.user_id = u.user_id
+                WHERE u.user_id = ?
+            ''', (user_id,))
+            row = cursor.fetchone()
+            if row is None:
+                continue
+            actual, balance, ledger_id = row
+            cursor.execute('''
+                SELECT COALESCE(SUM(delta), 0) FROM coin_ledger WHERE user_id = ? AND id > ?
+            ''', (user_id, ledger_id))
+            expected = balance + cursor.fetchone()[0]
+            if expected != actual:
+                mismatched[user_id] = (expected, actual)
+        return mismatched
     
     def get_user_fish_quantity(self, user_id: str, fish_id: str) -> int:
         """获取用户特定鱼的数量"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT quantity FROM user_fish
@@ -466,34 +1209,51 @@ class FishingDB:
             result = cursor.fetchone()
             return result[0] if result else 0
     
-    def remove_fish_from_pond(self, user_id: str, fish_id: str, amount: int) -> None:
-        """从鱼塘中移除鱼"""
-        with sqlite3.connect(self.db_path) as conn:
+    def get_fish_lock_time(self, user_id: str, fish_id: int) -> int:
+        """用户某种鱼剩余的禁售时间(秒)，不在禁售期时为0"""
+        row = self._get_cached_connection().execute('''
+            SELECT no_sell_until FROM user_fish
+            WHERE user_id = ? AND fish_id = ? AND no_sell_until > strftime('%s', 'now') AND locked_quantity > 0
+        ''', (user_id, fish_id)).fetchone()
+        return max(int(row[0]) - int(time.time()), 0) if row else 0
+    
+    def remove_fish_from_pond(self, user_id: str, fish_id: int, amount: int) -> Optional[CatchSet]:
+        """从鱼塘中移除鱼，返回被移除的鱼的捕获记录；可出售的数量(不含禁售中的)不足时不做修改并返回None"""
+        with self._write('remove_fish_from_pond') as conn:
             cursor = conn.cursor()
-            cursor.execute('''
+            cursor.execute(f'''
                 UPDATE user_fish
                 SET quantity = quantity - ?
-                WHERE user_id = ? AND fish_id = ?
-            ''', (amount, user_id, fish_id))
+                WHERE user_id = ? AND fish_id = ? AND quantity - {_locked_sql('?')} >= ?
+            ''', (amount, user_id, fish_id, int(time.time()), amount))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return None
+            taken = self._take_catches(cursor, user_id, fish_id, amount)
             conn.commit()
+            return taken
     
     def clear_user_fish(self, user_id: str) -> None:
         """清空用户鱼塘（但保留锁定的鱼）"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write('clear_user_fish') as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                DELETE FROM user_fish
-                WHERE user_id = ? AND (no_sell_until IS NULL OR no_sell_until <= strftime('%s', 'now'))
-            ''', (user_id,))
+            cursor.execute(f'''
+                DELETE FROM user_catches
+                WHERE user_id = ? AND fish_id IN (
+                    SELECT fish_id FROM user_fish WHERE user_id = ? AND {_locked_sql(_NOW_SQL)} = 0
+                )
+            ''', (user_id, user_id))
+            cursor.execute(f"DELETE FROM user_fish WHERE user_id = ? AND {_locked_sql(_NOW_SQL)} = 0", (user_id,))
+            cursor.execute(f"UPDATE user_fish SET quantity = {_locked_sql(_NOW_SQL)} WHERE user_id = ?", (user_id,))
             conn.commit()
     
     def get_valuable_fish_list(self, user_id: str) -> List[Dict]:
         """获取用户鱼塘中的高价值鱼"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_cached_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT f.id, f.name, f.rarity, uf.quantity, f.base_value,
-                       CASE WHEN uf.no_sell_until > strftime('%s', 'now') 
+                       CASE WHEN uf.no_sell_until > strftime('%s', 'now') AND uf.locked_quantity > 0
                             THEN uf.no_sell_until - strftime('%s', 'now')
                             ELSE 0 END as lock_time
                 FROM user_fish uf
@@ -514,9 +1274,107 @@ class FishingDB:
                 })
             return results
     
+    def get_stealable_weights(self, user_id: Optional[str] = None, min_rarity: int = 3) -> List[Dict]:
+        """统计用户可被偷的鱼的总价值以及最早解除禁售的时间
+        Args:
+            user_id: 只统计指定用户，为None时统计所有用户
+            min_rarity: 可被偷的最低稀有度
+        """
+        now = int(time.time())
+        user_filter = "AND uf.user_id = ?" if user_id is not None else ""
+        params = (now, now, min_rarity) + ((user_id,) if user_id is not None else ())
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT uf.user_id,
+                       SUM((uf.quantity - {_locked_sql('?', 'uf.')}) * f.base_value) as weight,
+                       MIN(CASE WHEN uf.no_sell_until > ? AND uf.locked_quantity > 0
+                                THEN uf.no_sell_until END) as unlock_time
+                FROM user_fish uf
+                JOIN fish_config f ON uf.fish_id = f.id
+                WHERE f.rarity >= ? AND uf.quantity > 0 {user_filter}
+                GROUP BY uf.user_id
+            """, params)
+            return [{'user_id': row[0], 'weight': row[1] or 0, 'unlock_time': row[2]}
+                    for row in cursor.fetchall()]
+    
+    def steal_fish(self, thief_id: str, victim_id: str, r: float, now: float,
+                   cooldown: int, lock_duration: int, min_rarity: int = 3) -> Dict:
+        """偷鱼，检查冷却、挑选鱼、转移鱼在同一个事务中完成
+        Args:
+            thief_id: 偷鱼者
+            victim_id: 受害者
+            r: [0, 1) 之间的随机数，用于按价值挑选被偷的鱼
+            now: 当前时间
+            cooldown: 偷鱼冷却时间(秒)
+            lock_duration: 偷来的鱼的禁售时长(秒)
+            min_rarity: 可被偷的最低稀有度
+        Returns:
+            {'status': 'ok' | 'cooldown' | 'empty', ...}，成功时 locked 表示偷来的鱼是否进入禁售期
+        """
+        now_int = int(now)
+        with self._write('steal_fish') as conn:
+            cursor = conn.cursor()
+            self._ensure_user_exists(cursor, thief_id)
+            cursor.execute('''
+                UPDATE user_fishing
+                SET last_steal_time = ?
+                WHERE user_id = ? AND (last_steal_time IS NULL OR last_steal_time <= ?)
+            ''', (now_int, thief_id, now_int - cooldown))
+            if cursor.rowcount != 1:
+                cursor.execute("SELECT last_steal_time FROM user_fishing WHERE user_id = ?", (thief_id,))
+                last_steal_time = cursor.fetchone()[0] or 0
+                conn.rollback()
+                return {'status': 'cooldown', 'last_steal_time': last_steal_time}
+            
+            # 只能偷走可出售的鱼，禁售中的鱼(受害者偷来的)不计入
+            cursor.execute(f'''
+                SELECT f.id, f.name, f.rarity, f.base_value, uf.quantity - {_locked_sql('?', 'uf.')} as sellable
+                FROM user_fish uf
+                JOIN fish_config f ON uf.fish_id = f.id
+                WHERE uf.user_id = ? AND f.rarity >= ? AND uf.quantity > 0
+                ORDER BY f.id
+            ''', (now_int, victim_id, min_rarity))
+            candidates = [row for row in cursor.fetchall() if row[4] > 0]
+            if not candidates:
+                conn.rollback()
+                return {'status': 'empty'}
+            
+            # 按价值加权挑选一条鱼
+            target = r * sum(row[3] * row[4] for row in candidates)
+            for fish_id, name, rarity, base_value, quantity in candidates:
+                target -= base_value * quantity
+                if target < 0:
+                    break
+            
+            cursor.execute('''
+                UPDATE user_fish SET quantity = quantity - 1
+                WHERE user_id = ? AND fish_id = ? AND quantity > 0
+            ''', (victim_id, fish_id))
+            # 被偷的鱼连同重量记录一起转移
+            stolen = self._take_catches(cursor, victim_id, fish_id, 1)
+            if stolen.weights or stolen.bulk_count:
+                catches = self._load_catches(cursor, thief_id, fish_id)
+                catches.merge(stolen, self.max_specimens)
+                self._save_catches(cursor, thief_id, fish_id, catches)
+            # 只锁住偷来的这一条，偷鱼者原有的可出售的鱼不受影响。每行只有一个截止时间，
+            # 仍在禁售期内的偷来的鱼随新偷到的一条延长，已到期的禁售数量重新从1开始
+            locked = lock_duration > 0
+            cursor.execute(f'''
+                INSERT INTO user_fish (user_id, fish_id, quantity, no_sell_until, locked_quantity)
+                VALUES (?, ?, 1, ?, 1)
+                ON CONFLICT(user_id, fish_id) DO UPDATE
+                SET quantity = quantity + 1,
+                    locked_quantity = {_locked_sql('?')} + 1,
+                    no_sell_until = MAX(COALESCE(no_sell_until, 0), excluded.no_sell_until)
+            ''', (thief_id, fish_id, now_int + lock_duration, now_int))
+            conn.commit()
+            return {'status': 'ok', 'id': fish_id, 'name': name, 'rarity': rarity, 'base_value': base_value,
+                    'catch': stolen, 'locked': locked}
+    
     def set_current_bait(self, user_id: str, bait_name: str) -> None:
         """设置用户当前使用的鱼饵"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write('set_current_bait') as conn:
             cursor = conn.cursor()
             self._ensure_user_exists(cursor, user_id)
             
@@ -536,7 +1394,7 @@ class FishingDB:
     
     def use_bait(self, user_id: str, bait_name: str, current_time: float) -> None:
         """使用鱼饵(消耗一个鱼饵并设置为当前使用的鱼饵)"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write('use_bait') as conn:
             cursor = conn.cursor()
             # 首先消耗一个鱼饵
             cursor.execute('''
@@ -552,3 +1410,241 @@ class FishingDB:
                 WHERE user_id = ?
             ''', (bait_name, current_time, user_id))
             conn.commit()
+    
+    def get_fish_by_name(self, name: str) -> Optional[Dict]:
+        """根据名称获取鱼类配置"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, name, rarity, base_value FROM fish_config WHERE name = ?",
+                (name,)
+            )
+            row = cursor.fetchone()
+            if row:
+                return {'id': row[0], 'name': row[1], 'rarity': row[2], 'base_value': row[3]}
+            return None
+    
+    def get_fish_names(self) -> Dict[int, str]:
+        """获取鱼类ID到名称的映射"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name FROM fish_config")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    def create_market_order(self, user_id: str, fish_id: int, side: str, price: int,
+                            quantity: int, created_at: float) -> Optional[int]:
+        """创建市场挂单并托管资产(卖单托管鱼，买单托管金币)，资产不足时返回None"""
+        with self._write('create_market_order') as conn:
+            cursor = conn.cursor()
+            if side == 'sell':
+                cursor.execute(f'''
+                    UPDATE user_fish
+                    SET quantity = quantity - ?
+                    WHERE user_id = ? AND fish_id = ? AND quantity - {_locked_sql('?')} >= ?
+                ''', (quantity, user_id, fish_id, int(created_at), quantity))
+            else:
+                self._ensure_user_exists(cursor, user_id)
+                cursor.execute('''
+                    UPDATE user_fishing
+                    SET coins = coins - ?
+                    WHERE user_id = ? AND coins >= ?
+                ''', (price * quantity, user_id, price * quantity))
+            
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return None
+            taken = None
+            if side == 'sell':
+                # 市场按挂单价成交，托管的鱼的重量记录随挂单保存，撤单时退还
+                taken = self._take_catches(cursor, user_id, fish_id, quantity)
+            else:
+                self._log_coins(cursor, [(user_id, -price * quantity, 'market_escrow')])
+            
+            cursor.execute('''
+                INSERT INTO market_orders (user_id, fish_id, side, price, quantity, remaining, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'open', ?)
+            ''', (user_id, fish_id, side, price, quantity, quantity, created_at))
+            order_id = cursor.lastrowid
+            if taken and (taken.weights or taken.bulk_count):
+                cursor.execute('''
+                    INSERT INTO market_escrow (order_id, weights, times, bulk_count, bulk_weight)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (order_id,) + taken.to_row())
+            conn.commit()
+            return order_id
+    
+    def get_open_market_orders(self) -> List[Dict]:
+        """获取所有未完成的市场挂单"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, fish_id, side, price, remaining, created_at
+                FROM market_orders
+                WHERE status = 'open' AND remaining > 0
+                ORDER BY id
+            ''')
+            return [{
+                'id': row[0],
+                'user_id': row[1],
+                'fish_id': row[2],
+                'side': row[3],
+                'price': row[4],
+                'remaining': row[5],
+                'created_at': row[6]
+            } for row in cursor.fetchall()]
+    
+    def settle_market_fills(self, fills: List[tuple], order_updates: List[tuple],
+                            coin_credits: Dict[str, int], fish_credits: Dict[tuple, int]) -> None:
+        """批量结算成交，所有变更在同一事务中提交
+        Args:
+            fills: 成交记录 (fish_id, price, quantity, buy_order_id, sell_order_id, buyer_id, seller_id, created_at)
+            order_updates: 挂单状态 (remaining, status, order_id)
+            coin_credits: 用户ID -> 入账金币(卖家货款和买家差价退款)
+            fish_credits: (用户ID, 鱼ID) -> 入账数量
+        """
+        with self._write('settle_market_fills') as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO market_fills (fish_id, price, quantity, buy_order_id, sell_order_id,
+                                          buyer_id, seller_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', fills)
+            cursor.executemany('''
+                UPDATE market_orders SET remaining = ?, status = ? WHERE id = ?
+            ''', order_updates)
+            # 成交完的卖单托管的鱼已全部卖出，重量记录不再需要
+            cursor.executemany("DELETE FROM market_escrow WHERE order_id = ?",
+                               [(order_id,) for remaining, status, order_id in order_updates if status != 'open'])
+            cursor.executemany('''
+                UPDATE user_fishing SET coins = coins + ? WHERE user_id = ?
+            ''', [(amount, user_id) for user_id, amount in coin_credits.items()])
+            cursor.executemany('''
+                INSERT INTO user_fish (user_id, fish_id, quantity, no_sell_until)
+                VALUES (?, ?, ?, 0)
+                ON CONFLICT(user_id, fish_id) DO UPDATE
+                SET quantity = quantity + excluded.quantity
+            ''', [(user_id, fish_id, amount) for (user_id, fish_id), amount in fish_credits.items()])
+            self._log_coins(cursor, [(user_id, amount, 'market_settle') for user_id, amount in coin_credits.items()])
+            conn.commit()
+    
+    def cancel_market_order(self, order_id: int, user_id: str) -> Optional[Dict]:
+        """撤销挂单并退还托管的资产，返回被撤销的挂单信息"""
+        with self._write('cancel_market_order') as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT fish_id, side, price, quantity, remaining FROM market_orders
+                WHERE id = ? AND user_id = ? AND status = 'open'
+            ''', (order_id, user_id))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            fish_id, side, price, quantity, remaining = row
+            cursor.execute('''
+                UPDATE market_orders SET remaining = 0, status = 'cancelled' WHERE id = ?
+            ''', (order_id,))
+            if side == 'sell':
+                cursor.execute('''
+                    INSERT INTO user_fish (user_id, fish_id, quantity, no_sell_until)
+                    VALUES (?, ?, ?, 0)
+                    ON CONFLICT(user_id, fish_id) DO UPDATE
+                    SET quantity = quantity + excluded.quantity
+                ''', (user_id, fish_id, remaining))
+                cursor.execute(
+                    "SELECT weights, times, bulk_count, bulk_weight FROM market_escrow WHERE order_id = ?",
+                    (order_id,))
+                escrow = cursor.fetchone()
+                if escrow:
+                    cursor.execute("DELETE FROM market_escrow WHERE order_id = ?", (order_id,))
+                    # 已成交的部分和上架时一样先从最轻的取出，较重的标本退还给卖家
+                    refund = CatchSet.from_row(escrow)
+                    refund.take(quantity - remaining, quantity)
+                    catches = self._load_catches(cursor, user_id, fish_id)
+                    catches.merge(refund, self.max_specimens)
+                    self._save_catches(cursor, user_id, fish_id, catches)
+            else:
+                cursor.execute('''
+                    UPDATE user_fishing SET coins = coins + ? WHERE user_id = ?
+                ''', (price * remaining, user_id))
+                self._log_coins(cursor, [(user_id, price * remaining, 'market_refund')])
+            conn.commit()
+            return {'fish_id': fish_id, 'side': side, 'price': price, 'remaining': remaining}
+    
+    def get_achievement_state(self, user_id: str, today: str) -> Dict:
+        """获取用户的统计计数、今日及长期的达成记录和已钓到的鱼种"""
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT metric, day, value FROM user_stats WHERE user_id = ?",
+                (user_id,)
+            )
+            stats = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+            cursor.execute('''
+                SELECT kind, rule_key FROM user_achievements
+                WHERE user_id = ? AND day IN ('', ?)
+            ''', (user_id, today))
+            awards = {(row[0], row[1]) for row in cursor.fetchall()}
+            cursor.execute("SELECT fish_id FROM user_species WHERE user_id = ?", (user_id,))
+            species = {row[0] for row in cursor.fetchall()}
+            return {'stats': stats, 'awards': awards, 'species': species}
+    
+    def save_achievement_progress(self, user_id: str, stats: List[tuple], awards: List[tuple],
+                                  new_species: Optional[int] = None) -> None:
+        """在一个事务中保存计数器、达成记录和新鱼种
+        Args:
+            stats: (metric, day, value)
+            awards: (kind, rule_key, day, achieved_at)
+            new_species: 第一次钓到的鱼种ID
+        """
+        with self._write('save_achievement_progress') as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO user_stats (user_id, metric, day, value)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id, metric) DO UPDATE
+                SET value = CASE WHEN day = excluded.day THEN MAX(value, excluded.value)
+                                 ELSE excluded.value END,
+                    day = excluded.day
+            ''', [(user_id, metric, day, value) for metric, day, value in stats])
+            cursor.executemany('''
+                INSERT OR IGNORE INTO user_achievements (user_id, kind, rule_key, day, achieved_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(user_id,) + award for award in awards])
+            if new_species is not None:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO user_species (user_id, fish_id) VALUES (?, ?)",
+                    (user_id, new_species)
+                )
+            conn.commit()
+    
+    def get_nicknames(self, user_ids: List[str]) -> Dict[str, str]:
+        """批量获取用户昵称"""
+        result = {}
+        with self._get_cached_connection() as conn:
+            cursor = conn.cursor()
+            # 分批查询，避免超过SQLite的参数数量上限
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(
+                    f"SELECT user_id, nickname FROM user_profile WHERE user_id IN ({placeholders})",
+                    chunk
+                )
+                result.update({row[0]: row[1] for row in cursor.fetchall() if row[1]})
+        return result
+    
+    def save_nicknames(self, nicknames: List[tuple]) -> None:
+        """批量保存用户昵称
+        Args:
+            nicknames: (user_id, nickname)
+        """
+        now = time.time()
+        with self._write('save_nicknames') as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO user_profile (user_id, nickname, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE
+                SET nickname = excluded.nickname, updated_at = excluded.updated_at
+            ''', [(user_id, nickname, now) for user_id, nickname in nicknames])
+            conn.commit()
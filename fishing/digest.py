@@ -0,0 +1,101 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class AutoFishingDigest:
+    """单个用户的自动钓鱼汇总，只保存计数，不保存每一竿的结果"""
+    casts: int = 0
+    misses: int = 0
+    coins_spent: int = 0
+    total_value: int = 0
+    species: Dict[str, int] = field(default_factory=dict)
+    other_count: int = 0  # 超出品种上限的渔获只计数
+    best: Optional[Dict] = None
+    stopped_reason: str = ''
+    since: float = 0.0
+
+
+class DigestBook:
+    """自动钓鱼结果汇总
+
+    每次自动钓鱼只更新用户的汇总计数，品种数有上限，
+    所以无论自动钓了多少竿，每个用户占用的内存都是常数。
+    用户下次发消息或定时推送时，一次性取出整份汇总。
+    """
+
+    def __init__(self, max_species: int = 20):
+        self.max_species = max_species
+        self.digests: Dict[str, AutoFishingDigest] = {}
+        self.origins: Dict[str, str] = {}  # 用户 -> 最近一次消息来源，用于定时推送
+        self.lock = threading.Lock()
+
+    def record(self, user_id: str, cost: int, fish: Optional[Dict] = None, now: float = 0.0):
+        """记录一次自动钓鱼结果"""
+        with self.lock:
+            digest = self.digests.get(user_id)
+            if digest is None:
+                digest = self.digests[user_id] = AutoFishingDigest(since=now)
+            digest.casts += 1
+            digest.coins_spent += cost
+            if fish is None:
+                digest.misses += 1
+                return
+            digest.total_value += fish['value']
+            if fish['name'] in digest.species:
+                digest.species[fish['name']] += 1
+            elif len(digest.species) < self.max_species:
+                digest.species[fish['name']] = 1
+            else:
+                digest.other_count += 1
+            if digest.best is None or fish['value'] > digest.best['value']:
+                digest.best = {'name': fish['name'], 'weight': fish['weight'], 'value': fish['value']}
+
+    def record_stop(self, user_id: str, reason: str, now: float = 0.0):
+        """记录自动钓鱼被系统关闭的原因"""
+        with self.lock:
+            digest = self.digests.get(user_id)
+            if digest is None:
+                digest = self.digests[user_id] = AutoFishingDigest(since=now)
+            digest.stopped_reason = reason
+
+    def remember_origin(self, user_id: str, origin: str):
+        """记录用户最近的消息来源"""
+        if origin:
+            self.origins[user_id] = origin
+
+    def has_pending(self, user_id: str) -> bool:
+        return user_id in self.digests
+
+    def pending_users(self) -> List[str]:
+        with self.lock:
+            return list(self.digests)
+
+    def take(self, user_id: str) -> Optional[AutoFishingDigest]:
+        """取出并清空用户的汇总"""
+        with self.lock:
+            return self.digests.pop(user_id, None)
+
+    def take_text(self, user_id: str) -> str:
+        """取出汇总并渲染为消息，没有汇总时返回空字符串"""
+        digest = self.take(user_id)
+        return self.format(digest) if digest else ''
+
+    @staticmethod
+    def format(digest: AutoFishingDigest) -> str:
+        """渲染自动钓鱼汇总"""
+        lines = [f"🤖 自动钓鱼汇总：共{digest.casts}竿，空竿{digest.misses}次"]
+        if digest.species or digest.other_count:
+            catches = [f"{name}×{count}" for name, count in
+                       sorted(digest.species.items(), key=lambda item: -item[1])]
+            if digest.other_count:
+                catches.append(f"其他×{digest.other_count}")
+            lines.append(f"🐟 渔获：{'、'.join(catches)}")
+        if digest.best:
+            best = digest.best
+            lines.append(f"🏆 最佳：{best['name']} {best['weight']}kg（{best['value']}金币）")
+        lines.append(f"💰 渔获价值：{digest.total_value}金币  💨 消耗金币：{digest.coins_spent}")
+        if digest.stopped_reason:
+            lines.append(f"⚠️ 自动钓鱼已关闭：{digest.stopped_reason}")
+        return "\n".join(lines)
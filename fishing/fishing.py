@@ -1,19 +1,49 @@
 from typing import Dict, Tuple, Optional, List
-import random
 import time
 import threading
+import os
 import logging
-from .db import FishingDB
+from collections import OrderedDict
+from functools import partial
+from .storage import create_storage, STORAGE_METHODS
+from .backup import BackupManager
+from .market import FishMarket
+from .steal import StealIndex
+from .achievements import AchievementEngine
+from .checkin import CheckInBook
+from .digest import DigestBook
+from .scheduler import AutoFishingScheduler
+from .lifecycle import WarmStartSnapshot
+from .paging import PageCursorCache, RARITY_NAMES
+from .catalog import FishCatalog
+from .ledger import CoinLedger
+from .catches import CatchSet, catch_value
+from .rng import RandomStreams
+from .metrics import Metrics, Labels, LAG_BUCKETS
+from .slow_profiler import SlowCommandProfiler
 from .constants import *
 from .fish import Fish
 from .stats import FisherStats, BestCatch
 
 class FishingSystem:
-    def __init__(self, config: Dict, get_nickname_func):
+    def __init__(self, config: Dict, get_nickname_func, metrics: Optional[Metrics] = None,
+                 profiler: Optional[SlowCommandProfiler] = None):
         self.config = config
-        self.db = FishingDB(config['database'])
+        self.db = create_storage(config)
         self.get_nickname = get_nickname_func
         self.LOG = logging.getLogger("Fishing")
+        self.shard_name = os.path.splitext(os.path.basename(config['database']))[0]
+        # 可设定种子的随机数流，分片之间以数据库名区分
+        self.rng = RandomStreams(config, self.shard_name)
+        
+        # 指标未启用时不包装存储接口，没有额外开销
+        self.metrics = metrics or Metrics()
+        if self.metrics.enabled:
+            self.metrics.instrument_storage(self.db, self.shard_name, STORAGE_METHODS)
+        self.metrics.add_collector(self.collect_metrics)
+        self.profiler = profiler or SlowCommandProfiler()
+        self.cache_hits = {'bait': 0, 'leaderboard': 0}
+        self.cache_misses = {'bait': 0, 'leaderboard': 0}
         self.current_weather = None
         self.last_weather_update = 0
         self.update_weather()
@@ -26,25 +56,174 @@ class FishingSystem:
         self.auto_fishing_enabled = config.get('auto_fishing_enabled', True)
         self.LOG.info(f"自动钓鱼功能: {'已启用' if self.auto_fishing_enabled else '已禁用'}")
         
-        # 初始化自动钓鱼线程
+        # 初始化自动钓鱼调度
         self.auto_fishing_thread = None
+        self.auto_fishing_cd = 300  # 自动钓鱼间隔(秒)
+        self.scheduler = AutoFishingScheduler()
+        self.stop_event = threading.Event()
+        
+        # 正在生效的鱼饵缓存: user_id -> (鱼饵名, 开始时间)，None表示没有生效的鱼饵
+        self.active_baits: "OrderedDict[str, Optional[Tuple[str, float]]]" = OrderedDict()
+        self.max_cached_baits = 10000
+        self.bait_lock = threading.Lock()
+        
+        # 鱼塘和图鉴的分页边界缓存
+        pagination = config.get('pagination', {})
+        self.page_size = pagination.get('page_size', 20)
+        self.page_cursors = PageCursorCache(pagination.get('cache_ttl', 300))
+        
+        # 金币排行榜缓存
+        self.leaderboard_ttl = config.get('leaderboard_ttl', 60)
+        self.leaderboard: Optional[Dict] = None
+            
+        # 启动金币流水落盘与对账任务
+        self.ledger = CoinLedger(self.db, config)
+        self.ledger.start()
+        
+        # 逐条捕获记录中单独保存重量的条数
+        self.db.max_specimens = config.get('catches', {}).get('max_specimens', self.db.max_specimens)
+            
+        # 加载鱼类图鉴并同步到数据库
+        catalog = config.get('catalog', {})
+        self.catalog = FishCatalog(
+            catalog.get('path'),
+            catalog.get('cache', os.path.join(os.path.dirname(self.db.db_path), 'fish_catalog.cache')),
+            catalog.get('reload_interval', 5)
+        )
+        if config.get('initialize_fish_types', True):
+            self.LOG.info("初始化鱼类数据库...")
+            self.db.initialize_fish_types(self.catalog.rows(), self.catalog.digest)
+        
+        # 初始化位图签到簿
+        check_in = config.get('check_in', {})
+        self.streak_bonus = check_in.get('streak_bonus', 10)  # 连续签到每天额外奖励
+        self.max_streak_bonus = check_in.get('max_streak_bonus', 100)
+        self.check_ins = CheckInBook(self.db)
+        
+        # 初始化称号、成就与每日任务引擎
+        self.achievements = AchievementEngine(self.db)
+        
+        # 自动钓鱼结果汇总，用户下次互动或定时推送时发送
+        digest_config = config.get('auto_fishing_digest', {})
+        self.digests = DigestBook(digest_config.get('max_species', 20))
+        
+        # 初始化偷鱼候选索引
+        steal = config.get('steal', {})
+        self.steal_cooldown = steal.get('cooldown', 3600)  # 偷鱼冷却(秒)
+        self.steal_lock_duration = steal.get('lock_duration', 1800)  # 偷来的鱼禁售时长(秒)
+        self.steal_min_rarity = steal.get('min_rarity', 3)
+        self.steal_index = StealIndex()
+        
+        # 优先从热启动快照恢复内存状态，快照不可用时扫描数据库重建
+        self.warm_start = WarmStartSnapshot(self.db.db_path, config)
+        state = self.warm_start.load()
+        if state:
+            self._load_warm_state(state)
+            self.LOG.info("已从热启动快照恢复内存状态")
+        else:
+            self._build_warm_state()
+        
+        # 初始化鱼市场
+        self.market = FishMarket(self.db, config, on_fish_credited=self.refresh_steal_weights)
+        
+        # 启动定时在线备份
+        self.backup = BackupManager(self.db, config)
+        self.backup.start()
         
         # 启动自动钓鱼任务
         if self.auto_fishing_enabled:
             self.start_auto_fishing_task()
         else:
             self.LOG.info("自动钓鱼功能已禁用，不启动自动钓鱼任务")
-            
-        # 初始化鱼类数据库
-        if config.get('initialize_fish_types', True):
-            self.LOG.info("初始化鱼类数据库...")
-            self.db.initialize_fish_types()
+    
+    def _build_warm_state(self) -> None:
+        """从数据库重建调度堆和偷鱼索引"""
+        if self.auto_fishing_enabled:
+            for user_id, last_time in self.db.get_auto_fishing_schedule():
+                self.scheduler.schedule(user_id, last_time + self.auto_fishing_cd)
+        for row in self.db.get_stealable_weights(min_rarity=self.steal_min_rarity):
+            self.steal_index.update(row['user_id'], row['weight'], row['unlock_time'])
+    
+    def _load_warm_state(self, state: Dict) -> None:
+        """从热启动快照恢复内存状态"""
+        if self.auto_fishing_enabled:
+            for due_time, user_id in state['schedule']:
+                self.scheduler.schedule(user_id, due_time)
+        for user_id, bait in state['active_baits'].items():
+            self.active_baits[user_id] = bait
+        self.achievements.load_state(state['achievements'])
+        self.steal_index.load_state(*state['steal_index'])
+        self.leaderboard = state['leaderboard']
+    
+    def export_warm_state(self) -> Dict:
+        """导出内存中的热数据，用于热启动快照"""
+        with self.bait_lock:
+            active_baits = {user_id: bait for user_id, bait in self.active_baits.items() if bait}
+        return {
+            'schedule': self.scheduler.entries(),
+            'active_baits': active_baits,
+            'achievements': self.achievements.export_state(),
+            'steal_index': self.steal_index.export_state(),
+            'leaderboard': self.leaderboard,
+        }
+    
+    def shutdown(self, timeout: float = 30) -> None:
+        """停止后台任务，写入未落盘的数据并保存热启动快照"""
+        self.stop_event.set()
+        if self.auto_fishing_thread and self.auto_fishing_thread.is_alive():
+            self.auto_fishing_thread.join(timeout)
+            if self.auto_fishing_thread.is_alive():
+                # 调度线程仍可能写库，此时保存的快照会与数据库不一致
+                self.LOG.warning("自动钓鱼线程未能及时停止，不保存热启动快照")
+                self.market.stop()
+                self.ledger.stop()
+                self.backup.stop()
+                self.db.close()
+                return
+        self.market.stop()
+        self.ledger.stop()
+        self.backup.stop()
+        # 先关闭存储(内存引擎在此保存快照)，热启动快照记录的是最终的文件指纹
+        self.db.close()
+        try:
+            self.warm_start.save(self.export_warm_state())
+        except Exception as e:
+            self.LOG.error(f"保存热启动快照失败: {e}", exc_info=True)
+    
+    def get_top_users(self, limit: int = 10) -> List[Dict]:
+        """获取金币排行榜，结果缓存 leaderboard_ttl 秒"""
+        cached = self.leaderboard
+        if cached and cached['limit'] >= limit and time.time() - cached['fetched_at'] < self.leaderboard_ttl:
+            self.cache_hits['leaderboard'] += 1
+            return cached['rows'][:limit]
+        self.cache_misses['leaderboard'] += 1
+        rows = self.db.get_top_users_by_coins(limit)
+        self.leaderboard = {'fetched_at': time.time(), 'limit': limit, 'rows': rows}
+        return rows
+    
+    def get_cache_stats(self) -> Dict[str, Dict]:
+        """鱼饵、排行榜和分页边界缓存的命中统计"""
+        stats = {name: {'hits': self.cache_hits[name], 'misses': self.cache_misses[name]} for name in self.cache_hits}
+        stats['page_cursor'] = self.page_cursors.get_stats()
+        return stats
+    
+    def collect_metrics(self) -> List[Tuple[str, Labels, float]]:
+        """导出指标时读取缓存命中和写事务等锁统计"""
+        samples = []
+        for name, stats in self.get_cache_stats().items():
+            samples.append(('fishing_cache_hits_total', (('cache', name),), stats['hits']))
+            samples.append(('fishing_cache_misses_total', (('cache', name),), stats['misses']))
+        for op, stats in self.db.lock_stats.snapshot().items():
+            labels = (('op', op), ('shard', self.shard_name))
+            samples.append(('fishing_db_lock_wait_seconds_total', labels, stats['wait_total']))
+            samples.append(('fishing_db_lock_retries_total', labels, stats['retries']))
+        return samples
     
     def update_weather(self) -> None:
         """更新天气"""
         current_time = time.time()
         if current_time - self.last_weather_update >= self.config.get('weather_update_interval', 3600):
-            self.current_weather = random.choice(WEATHER_TYPES)
+            self.current_weather = self.rng.stream().choice(WEATHER_TYPES)
             self.last_weather_update = current_time
     
     def show_help(self) -> str:
@@ -53,13 +232,21 @@ class FishingSystem:
 
 基础命令：
 🎯 /钓鱼：开始钓鱼（消耗50金币）
-🌊 /鱼塘：查看已捕获的鱼
+🌊 /鱼塘 [页码]：查看已捕获的鱼
+📖 /鱼类图鉴 [稀有度] [页码]：查看鱼类图鉴
 🎯 /自动钓鱼：开启/关闭自动钓鱼
 ✨ /钓鱼签到：每日领取金币
+🏆 /钓鱼排行：查看全服金币排行榜
+🏅 /我的成就：查看称号、成就和每日任务
 
 交易系统：
 💰 /卖鱼 <鱼名> <数量>：出售指定鱼获得金币
 📦 /全部卖出：一次性卖出所有鱼
+🕵️ /偷鱼：随机偷走别人鱼塘里的一条稀有鱼
+📋 /挂单 <鱼名> <数量> <单价>：在市场挂卖单
+🛒 /购买 <鱼名> <数量> <单价>：在市场挂买单
+📈 /市场 [鱼名]：查看市场行情和盘口
+↩️ /撤单 <订单号>：撤销挂单并退还托管的鱼或金币
 
 鱼饵系统：
 🏪 /鱼饵商城：查看可购买的鱼饵
@@ -119,22 +306,29 @@ class FishingSystem:
         self.db.update_last_fishing_time(user_id)
         
         # 扣除金币
-        self.db.update_user_coins(user_id, -cost)
+        self.db.update_user_coins(user_id, -cost, 'fishing_cost')
         
-        # 计算成功率并尝试钓鱼
+        # 计算成功率并尝试钓鱼，一次取出判定成功和选鱼所需的全部随机数
         success_rate = self.calculate_success_rate(user_id)
-        if random.random() < success_rate:
-            fish = self.get_random_fish()
+        draws = self.rng.stream(user_id).uniforms(4)
+        if draws[0] < success_rate:
+            fish = self.get_random_fish(draws[1:])
             if fish:
-                self.db.add_fish_to_pond(user_id, fish['id'])
+                self.db.add_fish_to_pond(user_id, fish['id'], fish['grams'], current_time)
+                if fish['rarity'] >= self.steal_min_rarity:
+                    self.refresh_steal_weights([user_id])
+                if is_auto:
+                    self.digests.record(user_id, cost, fish, current_time)
                 message = f"""🎣 {fish['grade_display']} 恭喜钓到了
 【{fish['name']}】{self.get_rarity_stars(fish['rarity'])}
 ⚖️ 重量：{fish['weight']}kg
 💰 价值：{fish['value']}金币
 💨 消耗金币：{cost}"""
-                return message
+                return self._with_awards(message, self.achievements.on_cast(user_id, fish))
         
-        return "💨 什么都没钓到..."
+        if is_auto:
+            self.digests.record(user_id, cost, None, current_time)
+        return self._with_awards("💨 什么都没钓到...", self.achievements.on_cast(user_id))
 
     def calculate_success_rate(self, user_id: str) -> float:
         """计算钓鱼成功率"""
@@ -148,31 +342,37 @@ class FishingSystem:
 
     def daily_check_in(self, user_id: str) -> str:
         """每日签到"""
-        # 检查是否已经签到
-        if self.db.has_checked_in_today(user_id):
+        # 先写入签到位，保证并发签到时只有一次成功
+        result = self.check_ins.check_in(user_id)
+        if result is None:
             return "❌ 今天已经签到过了，明天再来吧！"
             
-        # 随机奖励金币 (50-200)
-        coins = random.randint(50, 200)
-        self.db.update_user_coins(user_id, coins)
-        self.db.record_check_in(user_id)
+        # 随机奖励金币 (50-200)，连续签到额外奖励
+        coins = self.rng.stream(user_id).randint(50, 200)
+        streak_bonus = min((result['streak'] - 1) * self.streak_bonus, self.max_streak_bonus)
+        self.db.get_user_coins(user_id)  # 确保新用户已创建，否则奖励会丢失
+        self.db.update_user_coins(user_id, coins + streak_bonus, 'check_in')
         
         # 获取用户当前金币
         total_coins = self.db.get_user_coins(user_id)
         
-        return f"""✨ 签到成功！
-获得金币：{coins}
+        message = f"""✨ 签到成功！
+获得金币：{coins}"""
+        if streak_bonus:
+            message += f"\n🔥 连续签到奖励：{streak_bonus}"
+        message += f"""
+📅 连续签到{result['streak']}天，本月已签到{result['month_days']}天
 当前金币：{total_coins}"""
+        return self._with_awards(message, self.achievements.on_check_in(user_id, coins + streak_bonus))
 
     def get_bait_effect(self, user_id: str) -> float:
         """获取用户当前使用的鱼饵效果"""
-        bait_info = self.db.get_bait_info(user_id)
+        bait_info = self._get_active_bait(user_id)
         if not bait_info:
             return 0.0
         
         # 检查是否过期
-        bait_name = bait_info['name']
-        start_time = bait_info['start_time']
+        bait_name, start_time = bait_info
         
         # 计算鱼饵是否在有效期内
         current_time = time.time()
@@ -183,12 +383,63 @@ class FishingSystem:
         if current_time - float(start_time) > duration:
             # 清除过期的鱼饵
             self.db.set_current_bait(user_id, None)
+            self._cache_bait(user_id, None)
             return 0.0
         
         return BAIT_DATA[bait_name]['effect']
 
-    def get_random_fish(self) -> Dict:
-        """获取随机鱼"""
+    def _get_active_bait(self, user_id: str) -> Optional[Tuple[str, float]]:
+        """获取用户当前的鱼饵，优先读缓存"""
+        with self.bait_lock:
+            if user_id in self.active_baits:
+                self.active_baits.move_to_end(user_id)
+                self.cache_hits['bait'] += 1
+                return self.active_baits[user_id]
+            self.cache_misses['bait'] += 1
+        bait_info = self.db.get_bait_info(user_id)
+        bait = (bait_info['name'], bait_info['start_time']) if bait_info else None
+        self._cache_bait(user_id, bait)
+        return bait
+
+    def _cache_bait(self, user_id: str, bait: Optional[Tuple[str, float]]) -> None:
+        with self.bait_lock:
+            self.active_baits[user_id] = bait
+            self.active_baits.move_to_end(user_id)
+            if len(self.active_baits) > self.max_cached_baits:
+                self.active_baits.popitem(last=False)
+
+    def refresh_catalog(self) -> None:
+        """图鉴文件变化时重新加载并同步到数据库"""
+        if self.catalog.maybe_reload() and self.config.get('initialize_fish_types', True):
+            self.db.initialize_fish_types(self.catalog.rows(), self.catalog.digest)
+
+    def resolve_fish_name(self, query: str) -> Tuple[Optional[Dict], str]:
+        """通过图鉴的名称索引查找鱼
+        Returns:
+            (鱼类信息, 找不到或有歧义时的提示)
+        """
+        self.refresh_catalog()
+        name, candidates, ambiguous = self.catalog.name_index.lookup(query)
+        if name:
+            return self.catalog.by_name[name], ""
+        
+        # 已从图鉴移除但玩家仍持有的鱼只能按完整名称查找
+        fish = self.db.get_fish_by_name(query)
+        if fish:
+            return fish, ""
+        if ambiguous:
+            return None, f"❓「{query}」匹配到多种鱼：{'、'.join(candidates)}，请输入更完整的名称"
+        if candidates:
+            return None, f"❓ 没有找到「{query}」，你是不是要找：{'、'.join(candidates)}"
+        return None, f"❌ 没有找到名为「{query}」的鱼"
+
+    def get_random_fish(self, draws: Optional[List[float]] = None) -> Dict:
+        """获取随机鱼
+        Args:
+            draws: 预先取出的3个均匀随机数(稀有度、鱼种、重量)，默认从分片公共流中取
+        """
+        if draws is None:
+            draws = self.rng.stream().uniforms(3)
         # 随机选择鱼类等级，基于稀有度概率
         rarity_probs = {
             1: 0.40,  # 垃圾 40%
@@ -199,37 +450,25 @@ class FishingSystem:
         }
         
         # 根据概率随机选择稀有度
-        rarity = self._weighted_choice(list(rarity_probs.items()))
+        rarity = self._weighted_choice(list(rarity_probs.items()), draws[0])
         
         # 获取该稀有度的所有鱼
-        fish_with_rarity = {}
-        with self.db._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, base_value, min_weight, max_weight FROM fish_config WHERE rarity = ?", (rarity,))
-            for row in cursor.fetchall():
-                fish_id, name, base_value, min_weight, max_weight = row
-                fish_with_rarity[fish_id] = {
-                    'id': fish_id,
-                    'name': name,
-                    'rarity': rarity,
-                    'base_value': base_value,
-                    'min_weight': min_weight,
-                    'max_weight': max_weight
-                }
+        self.refresh_catalog()
+        fish_with_rarity = self.catalog.by_rarity.get(rarity)
         
         if not fish_with_rarity:
             return None
             
         # 随机选择一条鱼
-        fish_id = random.choice(list(fish_with_rarity.keys()))
-        fish = fish_with_rarity[fish_id]
+        fish = fish_with_rarity[int(len(fish_with_rarity) * draws[1])]
         
         # 随机生成重量
-        weight = random.uniform(fish['min_weight'] / 1000, fish['max_weight'] / 1000)
+        weight = (fish['min_weight'] + (fish['max_weight'] - fish['min_weight']) * draws[2]) / 1000
         weight = round(weight, 2)  # 保留两位小数
+        grams = int(round(weight * 1000))
         
-        # 计算价值（基础价值 * 重量修正）
-        value = int(fish['base_value'] * (1 + (weight - fish['min_weight']/1000) / (fish['max_weight']/1000 - fish['min_weight']/1000) * 0.5))
+        # 计算价值（基础价值 * 重量修正），卖出时按同样的公式结算
+        value = catch_value(fish, grams)
         
         # 获取品级显示
         grade_display = self.get_grade_display(rarity)
@@ -239,6 +478,7 @@ class FishingSystem:
             'name': fish['name'],
             'rarity': rarity,
             'weight': weight,
+            'grams': grams,
             'value': value,
             'grade_display': grade_display
         }
@@ -276,7 +516,7 @@ class FishingSystem:
             return f"❌ 金币不足，需要{price}金币，当前持有{user_coins}金币"
         
         # 扣除金币并添加鱼饵
-        self.db.update_user_coins(user_id, -price)
+        self.db.update_user_coins(user_id, -price, 'buy_bait')
         self.db.add_user_bait(user_id, bait_name)
         
         return f"""✅ 成功购买鱼饵「{bait_name}」
@@ -285,44 +525,100 @@ class FishingSystem:
 
 使用方法: /使用鱼饵 {bait_name}"""
 
-    def get_user_fish_pond(self, user_id: str) -> str:
-        """获取用户鱼塘信息"""
-        fish_list = self.db.get_user_fish(user_id)
-        
-        if not fish_list:
-            return "🌊 你的鱼塘空空如也，快去钓鱼吧！"
+    def get_user_fish_pond(self, user_id: str, page: int = 1) -> str:
+        """获取用户鱼塘信息，按稀有度和价值分页显示"""
+        page_size = self.page_size
+        try:
+            after = self.page_cursors.get_start(
+                ('pond', user_id), page,
+                lambda key, pages: self.db.seek_user_fish(user_id, key, pages * page_size))
+        except IndexError:
+            return f"❌ 鱼塘没有第{page}页"
+        
+        # 多取一行用于判断是否还有下一页
+        rows = self.db.iter_user_fish_page(user_id, after, page_size + 1)
+        lines, last_key, has_more = self._render_fish_rows(rows, page_size, self._format_pond_row)
+        if not lines:
+            return "🌊 你的鱼塘空空如也，快去钓鱼吧！" if page == 1 else f"❌ 鱼塘没有第{page}页"
+        if has_more:
+            self.page_cursors.remember(('pond', user_id), page + 1, last_key)
         
         # 获取用户金币
         coins = self.db.get_user_coins(user_id)
         
-        result = [f"🌊 {self.get_nickname(user_id)}的鱼塘 | 💰{coins}金币"]
+        result = [f"🌊 {self.get_nickname(user_id)}的鱼塘 | 💰{coins}金币 | 第{page}页"]
         result.append("-" * 20)
-        
-        # 按稀有度分组
-        fish_by_rarity = {}
-        for fish in fish_list:
-            rarity = fish['rarity']
-            if rarity not in fish_by_rarity:
-                fish_by_rarity[rarity] = []
-            fish_by_rarity[rarity].append(fish)
-        
-        # 按稀有度从高到低显示
-        for rarity in sorted(fish_by_rarity.keys(), reverse=True):
-            rarity_text = {1: "垃圾", 2: "普通", 3: "稀有", 4: "史诗", 5: "传说"}.get(rarity, "未知")
-            result.append(f"【{rarity_text}】{self.get_rarity_stars(rarity)}")
-            
-            for fish in fish_by_rarity[rarity]:
-                lock_time = fish.get('lock_time', 0)
-                lock_status = f" 🔒{int(lock_time//60)}分钟" if lock_time > 0 else ""
-                result.append(f"• {fish['name']} x{fish['quantity']} 💰{fish['base_value']}金币{lock_status}")
-            
-            result.append("")
-        
+        result.extend(lines)
+        result.append("")
+        if has_more:
+            result.append(f"📄 下一页: /鱼塘 {page + 1}")
         result.append("💡 卖鱼指令: /卖鱼 <鱼名> <数量>")
         result.append("💡 一键卖出: /全部卖出")
         
         return "\n".join(result)
 
+    def show_fish_guide(self, rarity: Optional[int] = None, page: int = 1) -> str:
+        """查看鱼类图鉴，可按稀有度筛选，分页显示"""
+        self.refresh_catalog()
+        page_size = self.page_size
+        view = ('guide', rarity)
+        try:
+            after = self.page_cursors.get_start(
+                view, page, lambda key, pages: self.db.seek_fish_types(rarity, key, pages * page_size))
+        except IndexError:
+            return f"❌ 图鉴没有第{page}页"
+        
+        rows = self.db.iter_fish_types_page(rarity, after, page_size + 1)
+        lines, last_key, has_more = self._render_fish_rows(rows, page_size, self._format_guide_row)
+        if not lines:
+            return "数据库中没有鱼类信息，请先初始化鱼类数据。" if page == 1 else f"❌ 图鉴没有第{page}页"
+        if has_more:
+            self.page_cursors.remember(view, page + 1, last_key)
+        
+        title = f"📖 鱼类图鉴 · {RARITY_NAMES[rarity]}" if rarity else "📖 鱼类图鉴"
+        result = [f"{title} | 第{page}页", "-" * 20]
+        result.extend(lines)
+        if has_more:
+            filter_arg = f"{RARITY_NAMES[rarity]} " if rarity else ""
+            result.append("")
+            result.append(f"📄 下一页: /鱼类图鉴 {filter_arg}{page + 1}")
+        return "\n".join(result)
+
+    def _render_fish_rows(self, rows, page_size: int, format_row) -> Tuple[List[str], Optional[Tuple], bool]:
+        """逐行渲染一页鱼，稀有度变化时插入分组标题
+        Returns:
+            (渲染的行, 本页最后一行的分页键, 是否还有下一页)
+        """
+        lines = []
+        last_key = None
+        current_rarity = None
+        for index, fish in enumerate(rows):
+            if index == page_size:
+                return lines, last_key, True
+            if fish['rarity'] != current_rarity:
+                if current_rarity is not None:
+                    lines.append("")
+                current_rarity = fish['rarity']
+                rarity_text = RARITY_NAMES.get(current_rarity, "未知")
+                lines.append(f"【{rarity_text}】{self.get_rarity_stars(current_rarity)}")
+            lines.append(format_row(fish))
+            last_key = (fish['rarity'], fish['base_value'], fish['id'])
+        return lines, last_key, False
+
+    @staticmethod
+    def _format_pond_row(fish: Dict) -> str:
+        lock_time = fish.get('lock_time', 0)
+        locked = fish.get('locked', 0)
+        count = f"{locked}条" if 0 < locked < fish['quantity'] else ""
+        lock_status = f" 🔒{count}{int(lock_time//60)}分钟" if lock_time > 0 else ""
+        heaviest = f" 🏆{fish['heaviest'] / 1000:.2f}kg" if fish.get('heaviest') else ""
+        return f"• {fish['name']} x{fish['quantity']} 💰{fish['base_value']}金币{heaviest}{lock_status}"
+
+    @staticmethod
+    def _format_guide_row(fish: Dict) -> str:
+        habitat = f" · {fish['habitat']}" if fish.get('habitat') else ""
+        return f"• {fish['name']} (ID:{fish['id']}) - 价值: {fish['base_value']}金币{habitat}"
+
     def show_my_baits(self, user_id: str) -> str:
         """查看用户拥有的鱼饵"""
         baits = self.db.show_my_baits(user_id)
@@ -372,62 +668,59 @@ class FishingSystem:
         # 使用鱼饵
         current_time = time.time()
         self.db.use_bait(user_id, bait_name, current_time)
+        self._cache_bait(user_id, (bait_name, current_time))
         
         effect = BAIT_DATA[bait_name]['effect']
         duration_mins = BAIT_DATA[bait_name]['duration'] // 60
         
-        return f"""🎣 成功使用「{bait_name}」
+        message = f"""🎣 成功使用「{bait_name}」
 ⬆️ 效果: 提升钓鱼成功率{int(effect*100)}%
 ⏱️ 持续时间: {duration_mins}分钟"""
+        return self._with_awards(message, self.achievements.on_bait_use(user_id))
 
     def sell_fish(self, user_id: str, fish_name: str, amount: int) -> str:
         """卖鱼获得金币"""
         if amount <= 0:
             return "❌ 请输入正确的数量"
         
-        # 查找鱼的ID
-        fish_id = None
-        fish_value = 0
-        with self.db._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, base_value FROM fish_config WHERE name = ?", (fish_name,))
-            result = cursor.fetchone()
-            if result:
-                fish_id, fish_value = result
-            else:
-                return f"❌ 没有找到名为「{fish_name}」的鱼"
+        # 查找鱼的ID，支持前缀、拼音和相似名称
+        fish, message = self.resolve_fish_name(fish_name)
+        if not fish:
+            return message
+        fish_id, fish_value, fish_name = fish['id'], fish['base_value'], fish['name']
         
         # 获取用户的这种鱼的数量
         owned_amount = self.db.get_user_fish_quantity(user_id, fish_id)
         if owned_amount < amount:
             return f"❌ 你只有{owned_amount}条「{fish_name}」，不够卖{amount}条"
         
-        # 检查是否有锁定的鱼
-        with self.db._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT no_sell_until FROM user_fish
-                WHERE user_id = ? AND fish_id = ? AND no_sell_until > strftime('%s', 'now')
-            """, (user_id, fish_id))
-            locked = cursor.fetchone()
-            if locked:
-                lock_time = int(locked[0]) - int(time.time())
+        # 按每条鱼的实际重量计算总价值，最重的鱼留到最后卖；禁售中的鱼(偷来的)不能卖
+        taken = self.db.remove_fish_from_pond(user_id, fish_id, amount)
+        if taken is None:
+            lock_time = self.db.get_fish_lock_time(user_id, fish_id)
+            if lock_time > 0:
                 minutes = lock_time // 60
                 seconds = lock_time % 60
-                return f"❌ 「{fish_name}」处于禁售期，还有{minutes}分{seconds}秒解除"
-        
-        # 计算总价值
-        total_value = fish_value * amount
-        
-        # 更新数据库
-        self.db.remove_fish_from_pond(user_id, fish_id, amount)
-        self.db.update_user_coins(user_id, total_value)
+                return f"❌ 「{fish_name}」中有偷来的鱼处于禁售期，可出售的不足{amount}条，还有{minutes}分{seconds}秒解除"
+            return f"❌ 「{fish_name}」数量不足，不够卖{amount}条"
+        total_value = self._catch_value(fish_id, fish_value, taken)
+        self.db.update_user_coins(user_id, total_value, 'sell_fish')
+        self.refresh_steal_weights([user_id])
+        awards = self.achievements.on_sell(user_id, total_value)
         
         user_coins = self.db.get_user_coins(user_id)
         
-        return f"""💰 成功出售 {amount}条「{fish_name}」
+        message = f"""💰 成功出售 {amount}条「{fish_name}」
 💰 获得: {total_value}金币
 💰 当前金币: {user_coins}"""
+        return self._with_awards(message, awards)
+
+    def _catch_value(self, fish_id: int, base_value: int, catches: CatchSet) -> int:
+        """按重量计算一批鱼的价值，已从图鉴移除的鱼按基础价值计算"""
+        fish = self.catalog.by_id.get(fish_id)
+        if fish is None:
+            return base_value * catches.count
+        return catches.value(fish)
 
     def sell_all_fish(self, user_id: str) -> str:
         """卖出所有非锁定的鱼"""
@@ -441,18 +734,20 @@ class FishingSystem:
         sold_fish = []
         
         for fish in fish_list:
-            # 跳过锁定的鱼
-            if fish.get('lock_time', 0) > 0:
+            # 跳过禁售中的鱼
+            quantity = fish['quantity'] - fish.get('locked', 0)
+            if quantity <= 0:
                 continue
                 
             fish_id = fish['id']
-            quantity = fish['quantity']
             name = fish['name']
-            value = fish['base_value'] * quantity
             
-            # 从鱼塘中移除并增加金币
-            self.db.remove_fish_from_pond(user_id, fish_id, quantity)
-            self.db.update_user_coins(user_id, value)
+            # 从鱼塘中移除并按实际重量增加金币
+            taken = self.db.remove_fish_from_pond(user_id, fish_id, quantity)
+            if taken is None:
+                continue
+            value = self._catch_value(fish_id, fish['base_value'], taken)
+            self.db.update_user_coins(user_id, value, 'sell_all')
             
             total_sold += quantity
             total_value += value
@@ -461,6 +756,9 @@ class FishingSystem:
         if total_sold == 0:
             return "❌ 没有可卖出的鱼，可能都处于禁售期"
         
+        self.refresh_steal_weights([user_id])
+        awards = self.achievements.on_sell(user_id, total_value)
+        
         user_coins = self.db.get_user_coins(user_id)
         
         result = [f"💰 成功出售 {total_sold}条鱼，获得{total_value}金币"]
@@ -468,8 +766,153 @@ class FishingSystem:
         result.append("\n出售明细:")
         result.extend(sold_fish)
         
-        return "\n".join(result)
+        return self._with_awards("\n".join(result), awards)
 
+    def place_market_order(self, user_id: str, side: str, fish_name: str, quantity: int, price: int) -> str:
+        """在市场挂卖单或买单"""
+        if not self.market.is_valid_order(quantity, price):
+            return "❌ 请输入正确的数量和单价"
+        
+        # 查找鱼的ID，支持前缀、拼音和相似名称
+        fish, message = self.resolve_fish_name(fish_name)
+        if not fish:
+            return message
+        fish_name = fish['name']
+        
+        if self.market.get_open_order_count(user_id) >= self.market.max_orders_per_user:
+            return f"❌ 最多同时挂{self.market.max_orders_per_user}个单，请先撤销部分挂单"
+        
+        result = self.market.place_order(user_id, fish['id'], side, price, quantity)
+        if result is not None and side == 'sell':
+            self.refresh_steal_weights([user_id])
+        if result is None:
+            if side == 'sell':
+                return f"❌ 可出售的「{fish_name}」不足{quantity}条（禁售期内的鱼不能挂单）"
+            return f"❌ 金币不足，需要托管{price * quantity}金币"
+        
+        action = "卖出" if side == 'sell' else "买入"
+        message = [f"📋 挂单成功 #{result['order_id']}"]
+        message.append(f"{action}「{fish_name}」x{quantity} 单价{price}金币")
+        if result['filled']:
+            message.append(f"✅ 已成交{result['filled']}条，成交额{result['amount']}金币")
+        if result['remaining']:
+            message.append(f"⏳ 剩余{result['remaining']}条等待成交，撤单: /撤单 {result['order_id']}")
+        return "\n".join(message)
+    
+    def cancel_market_order(self, user_id: str, order_id: int) -> str:
+        """撤销市场挂单"""
+        order = self.market.cancel_order(user_id, order_id)
+        if order is None:
+            return f"❌ 没有找到你的未完成挂单 #{order_id}"
+        
+        if order['side'] == 'sell':
+            self.refresh_steal_weights([user_id])
+            return f"✅ 已撤单 #{order_id}，退还{order['remaining']}条鱼"
+        return f"✅ 已撤单 #{order_id}，退还{order['price'] * order['remaining']}金币"
+    
+    def show_market(self, user_id: str, fish_name: Optional[str] = None) -> str:
+        """查看市场行情"""
+        if fish_name:
+            fish, message = self.resolve_fish_name(fish_name)
+            if not fish:
+                return message
+            fish_name = fish['name']
+            depth = self.market.get_depth(fish['id'])
+            result = [f"📈 「{fish_name}」盘口 | 系统收购价{fish['base_value']}金币"]
+            result.append("-" * 20)
+            result.append("卖盘:")
+            result.extend(f"  {price}金币 x{quantity}" for price, quantity in reversed(depth['sell']))
+            if not depth['sell']:
+                result.append("  暂无")
+            result.append("买盘:")
+            result.extend(f"  {price}金币 x{quantity}" for price, quantity in depth['buy'])
+            if not depth['buy']:
+                result.append("  暂无")
+            return "\n".join(result)
+        
+        fish_names = self.db.get_fish_names()
+        result = ["📈 鱼市场行情"]
+        result.append("-" * 20)
+        quotes = self.market.get_quotes()
+        if not quotes:
+            result.append("市场上暂时没有挂单")
+        for quote in sorted(quotes, key=lambda quote: quote['fish_id']):
+            ask = quote['ask'] if quote['ask'] is not None else "-"
+            bid = quote['bid'] if quote['bid'] is not None else "-"
+            result.append(f"• {fish_names.get(quote['fish_id'], quote['fish_id'])} 卖{ask} / 买{bid}")
+        
+        orders = self.market.get_user_orders(user_id)
+        if orders:
+            result.append("")
+            result.append("📋 我的挂单:")
+            for order in orders:
+                action = "卖" if order.side == 'sell' else "买"
+                result.append(f"#{order.id} {action} {fish_names.get(order.fish_id, order.fish_id)} "
+                              f"x{order.remaining} 单价{order.price}")
+        
+        result.append("")
+        result.append("💡 挂卖单: /挂单 <鱼名> <数量> <单价>")
+        result.append("💡 挂买单: /购买 <鱼名> <数量> <单价>")
+        return "\n".join(result)
+    
+    def steal_fish(self, user_id: str) -> str:
+        """偷鱼：按可偷价值加权随机挑选一个鱼塘，偷走一条稀有鱼"""
+        current_time = time.time()
+        
+        # 先用内存中的冷却记录快速拒绝
+        last_time = self.last_steal_time.get(user_id, 0)
+        if current_time - last_time < self.steal_cooldown:
+            return self._steal_cooldown_message(current_time - last_time)
+        
+        # 禁售期到期的用户重新计算权重
+        self.refresh_steal_weights(self.steal_index.pop_unlocked(current_time))
+        
+        result = None
+        victim_id = None
+        draws = self.rng.stream(user_id).uniforms(6)
+        for attempt in range(3):
+            victim_id = self.steal_index.sample(draws[attempt * 2], exclude=user_id)
+            if victim_id is None:
+                break
+            result = self.db.steal_fish(user_id, victim_id, draws[attempt * 2 + 1], current_time,
+                                        self.steal_cooldown, self.steal_lock_duration, self.steal_min_rarity)
+            if result['status'] == 'cooldown':
+                self.last_steal_time[user_id] = result['last_steal_time']
+                return self._steal_cooldown_message(current_time - result['last_steal_time'])
+            # 无论成功与否都刷新受害者权重，索引过期时下一次抽取会得到修正
+            self.refresh_steal_weights([victim_id])
+            if result['status'] == 'ok':
+                break
+        
+        if not result or result['status'] != 'ok':
+            return "🌊 附近的鱼塘里没有可以偷的稀有鱼"
+        
+        self.last_steal_time[user_id] = current_time
+        self.refresh_steal_weights([user_id])
+        message = f"""🕵️ 你从 {self.get_nickname(victim_id)} 的鱼塘偷走了
+【{result['name']}】{self.get_rarity_stars(result['rarity'])}
+💰 价值：{self._catch_value(result['id'], result['base_value'], result['catch'])}金币"""
+        if result['locked']:
+            message += f"\n🔒 偷来的鱼进入{self.steal_lock_duration // 60}分钟禁售期"
+        return message
+    
+    def refresh_steal_weights(self, user_ids) -> None:
+        """重新计算用户在偷鱼索引中的权重"""
+        for user_id in user_ids:
+            rows = self.db.get_stealable_weights(user_id, self.steal_min_rarity)
+            if rows:
+                self.steal_index.update(user_id, rows[0]['weight'], rows[0]['unlock_time'])
+            else:
+                self.steal_index.update(user_id, 0)
+    
+    def _steal_cooldown_message(self, elapsed: float) -> str:
+        """偷鱼冷却提示"""
+        remaining = int(self.steal_cooldown - elapsed)
+        minutes = remaining // 60
+        seconds = remaining % 60
+        cd_msg = f"{minutes}分{seconds}秒" if minutes > 0 else f"{seconds}秒"
+        return f"⏳ 偷鱼CD中，还需等待{cd_msg}"
+    
     def toggle_auto_fishing(self, user_id: str) -> str:
         """开启/关闭自动钓鱼"""
         if not self.auto_fishing_enabled:
@@ -485,6 +928,10 @@ class FishingSystem:
                 return f"❌ 金币不足，无法开启自动钓鱼，最少需要{self.get_fishing_cost()}金币"
         
         self.db.set_auto_fishing_status(user_id, new_status)
+        if new_status:
+            self.scheduler.schedule(user_id, self.db.get_last_fishing_time(user_id) + self.auto_fishing_cd)
+        else:
+            self.scheduler.cancel(user_id)
         
         if new_status:
             return """✅ 自动钓鱼已开启
@@ -500,51 +947,94 @@ class FishingSystem:
             self.LOG.info("自动钓鱼线程已在运行中")
             return
             
-        self.auto_fishing_thread = threading.Thread(target=self._auto_fishing_loop, daemon=True)
+        self.stop_event.clear()
+        # 调度线程中的写事务在指标中计入 auto_tick
+        self.auto_fishing_thread = threading.Thread(
+            target=partial(self.metrics.run_command, 'auto_tick', self._auto_fishing_loop), daemon=True)
         self.auto_fishing_thread.start()
         self.LOG.info("自动钓鱼线程已启动")
 
     def _auto_fishing_loop(self):
-        """自动钓鱼循环任务"""
-        while True:
+        """自动钓鱼循环任务，只处理调度堆中已到期的用户"""
+        while not self.stop_event.is_set():
             try:
-                # 获取所有开启自动钓鱼的用户
-                auto_fishing_users = self.db.get_auto_fishing_users()
+                tick_started = time.time()
+                earliest_due = self.scheduler.next_due() if self.metrics.enabled else None
+                due_users = self.scheduler.pop_due(tick_started)
+                if due_users:
+                    self.LOG.info(f"执行自动钓鱼任务，{len(due_users)}个用户")
+                
+                if due_users:
+                    self.profiler.run('auto_tick', self._auto_fish_due, due_users, users=len(due_users))
                 
-                if auto_fishing_users:
-                    self.LOG.info(f"执行自动钓鱼任务，{len(auto_fishing_users)}个用户")
-                    
-                    for user_id in auto_fishing_users:
-                        try:
-                            # 检查CD时间
-                            current_time = time.time()
-                            last_time = self.db.get_last_fishing_time(user_id)
-                            
-                            if current_time - last_time < 300:  # 5分钟CD
-                                continue
-                                
-                            # 检查金币是否足够
-                            user_coins = self.db.get_user_coins(user_id)
-                            if user_coins < self.get_fishing_cost():
-                                # 金币不足，关闭自动钓鱼
-                                self.db.set_auto_fishing_status(user_id, False)
-                                self.LOG.info(f"用户 {user_id} 金币不足，已关闭自动钓鱼")
-                                continue
-                            
-                            # 执行钓鱼
-                            result = self.fish(user_id, is_auto=True)
-                            self.LOG.info(f"用户 {user_id} 自动钓鱼结果: {result[:30]}...")
-                            
-                        except Exception as e:
-                            self.LOG.error(f"用户 {user_id} 自动钓鱼出错: {e}")
+                if due_users and self.metrics.enabled:
+                    labels = (('shard', self.shard_name),)
+                    self.metrics.observe('fishing_auto_tick_seconds', labels, time.time() - tick_started)
+                    if earliest_due is not None:
+                        self.metrics.observe('fishing_auto_tick_lag_seconds', labels,
+                                             max(tick_started - earliest_due, 0), LAG_BUCKETS)
+                    self.metrics.inc('fishing_auto_tick_users_total', labels, len(due_users))
                 
-                # 每分钟检查一次
-                time.sleep(60)
+                # 等到下一个用户到期，最长1分钟，以便及时处理新开启自动钓鱼的用户
+                next_due = self.scheduler.next_due()
+                wait = 60 if next_due is None else min(max(next_due - time.time(), 0), 60)
+                self.stop_event.wait(wait)
                 
             except Exception as e:
                 self.LOG.error(f"自动钓鱼任务出错: {e}", exc_info=True)
-                time.sleep(60)  # 出错后等待1分钟再重试
+                self.stop_event.wait(60)  # 出错后等待1分钟再重试
+    
+    def _auto_fish_due(self, due_users: List[str]) -> None:
+        """处理一轮到期的用户"""
+        for index, user_id in enumerate(due_users):
+            if self.stop_event.is_set():
+                # 停止时把未处理的用户放回调度堆，随快照保存
+                for pending in due_users[index:]:
+                    self.scheduler.schedule(pending, time.time())
+                break
+            self._auto_fish_once(user_id)
+    
+    def _auto_fish_once(self, user_id: str) -> None:
+        """为一个到期用户执行自动钓鱼并安排下一次"""
+        try:
+            # 检查CD时间，期间手动钓过鱼则顺延
+            current_time = time.time()
+            last_time = self.db.get_last_fishing_time(user_id)
+            if current_time - last_time < self.auto_fishing_cd:
+                self.scheduler.schedule(user_id, last_time + self.auto_fishing_cd)
+                return
+                
+            # 检查金币是否足够
+            user_coins = self.db.get_user_coins(user_id)
+            if user_coins < self.get_fishing_cost():
+                # 金币不足，关闭自动钓鱼
+                self.db.set_auto_fishing_status(user_id, False)
+                self.digests.record_stop(user_id, "金币不足", current_time)
+                self.LOG.info(f"用户 {user_id} 金币不足，已关闭自动钓鱼")
+                return
+            
+            # 执行钓鱼，结果计入用户的自动钓鱼汇总
+            result = self.fish(user_id, is_auto=True)
+            self.LOG.debug(f"用户 {user_id} 自动钓鱼结果: {result[:30]}...")
+            
+        except Exception as e:
+            self.LOG.error(f"用户 {user_id} 自动钓鱼出错: {e}")
+        self.scheduler.schedule(user_id, time.time() + self.auto_fishing_cd)
+
+    def take_auto_fishing_digest(self, user_id: str) -> str:
+        """取出用户的自动钓鱼汇总，没有新结果时返回空字符串"""
+        return self.digests.take_text(user_id)
 
+    def show_achievements(self, user_id: str) -> str:
+        """查看称号、成就和每日任务"""
+        return self.achievements.get_progress_text(user_id)
+    
+    def _with_awards(self, message: str, awards: List[str]) -> str:
+        """在命令结果后附加新达成的称号/成就/任务"""
+        if not awards:
+            return message
+        return message + "\n\n" + "\n".join(awards)
+    
     def get_rarity_stars(self, rarity: int) -> str:
         """获取稀有度星星显示"""
         return "⭐" * rarity
@@ -560,11 +1050,11 @@ class FishingSystem:
         }
         return displays.get(rarity, f"【?】{'⭐' * rarity}")
         
-    def _weighted_choice(self, choices):
-        """基于权重的随机选择"""
+    def _weighted_choice(self, choices, u: float):
+        """基于权重的随机选择，u为 [0, 1) 的均匀随机数"""
         # choices是一个(选项, 权重)的列表
         total = sum(weight for _, weight in choices)
-        r = random.uniform(0, total)
+        r = u * total
         upto = 0
         for item, weight in choices:
             if upto + weight >= r:
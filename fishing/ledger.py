@@ -0,0 +1,74 @@
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from .storage import FishingStorage
+
+
+class CoinLedger:
+    """金币流水对账任务
+
+    金币变动直接更新 user_fishing.coins，并在同一个写事务中把 (用户, 变动, 原因, 时间) 追加到
+    coin_ledger 表，只多一条插入语句，不增加提交次数；多个连接或进程同时写入时余额与流水也总是一致。
+    对账从上次的位置开始，只核对新流水涉及的用户，并把他们的余额检查点推进到最新流水。
+    """
+
+    def __init__(self, db: FishingStorage, config: Dict):
+        """初始化金币流水任务
+        Args:
+            db: 数据库
+            config: 插件配置，流水配置位于 config['ledger']
+        """
+        ledger = config.get('ledger', {})
+        self.db = db
+        self.reconcile_interval = ledger.get('reconcile_interval', 600)  # 对账间隔(秒)，0表示不定时对账
+        self.reconcile_batch = ledger.get('reconcile_batch', 5000)  # 每次对账处理的流水条数
+        self.LOG = logging.getLogger("FishingLedger")
+
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_reconcile: Optional[Dict] = None
+        self.next_reconcile = time.time() + self.reconcile_interval
+
+    def start(self) -> None:
+        """启动定时对账"""
+        if self.reconcile_interval <= 0 or (self.thread and self.thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._ledger_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """停止定时对账，正在进行的对账在当前批次结束后退出"""
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(10)
+
+    def reconcile(self) -> Dict:
+        """核对到最新的流水为止，返回汇总结果"""
+        started = time.time()
+        summary = {'users': 0, 'mismatches': [], 'batches': 0}
+        while True:
+            result = self.db.reconcile_coins(self.reconcile_batch)
+            summary['users'] += result['users']
+            summary['mismatches'].extend(result['mismatches'])
+            summary['batches'] += 1
+            summary['reconciled_id'] = result['reconciled_id']
+            if result['done'] or self.stop_event.is_set():
+                break
+        summary['duration'] = time.time() - started
+        self.last_reconcile = summary
+        if summary['mismatches']:
+            self.LOG.warning(f"金币对账发现{len(summary['mismatches'])}个不一致的用户，已写入调整流水")
+        else:
+            self.LOG.info(f"金币对账完成: {summary['users']}个用户，耗时{summary['duration']:.2f}秒")
+        return summary
+
+    def _ledger_loop(self) -> None:
+        while not self.stop_event.wait(max(self.next_reconcile - time.time(), 0)):
+            try:
+                self.next_reconcile = time.time() + self.reconcile_interval
+                self.reconcile()
+            except Exception as e:
+                self.LOG.error(f"金币流水任务出错: {e}", exc_info=True)
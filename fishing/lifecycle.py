@@ -0,0 +1,88 @@
+import os
+import time
+import marshal
+import logging
+from typing import Dict, Optional, Tuple
+
+SNAPSHOT_VERSION = 1
+
+
+def db_fingerprint(db_path: str) -> Tuple:
+    """数据库文件的指纹(大小和修改时间)，快照保存后数据库被改动过则指纹不同
+
+    空的WAL文件与不存在视为相同，连接打开和关闭时会创建或删除空WAL文件，不代表数据有变化。
+    """
+    fingerprint = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+            fingerprint.append((stat.st_size, stat.st_mtime_ns) if stat.st_size or path == db_path else None)
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+class WarmStartSnapshot:
+    """热启动快照
+
+    插件停用时把内存中的热数据(调度堆、鱼饵、用户缓存、排行榜等)写入数据库旁的快照文件，
+    下次初始化时直接加载，省去全表扫描重建。快照读取后立即删除，只能使用一次；
+    版本不符、超过有效期或数据库在快照之后被改动过时放弃快照，回退到从数据库重建。
+    """
+
+    def __init__(self, db_path: str, config: Dict):
+        warm_start = config.get('warm_start', {})
+        self.enabled = warm_start.get('enabled', True)
+        self.max_age = warm_start.get('max_age', 600)  # 快照有效期(秒)
+        self.db_path = db_path
+        self.path = db_path + '.warm'
+        self.LOG = logging.getLogger("FishingLifecycle")
+
+    def save(self, state: Dict) -> Optional[str]:
+        """写入快照，必须在所有数据库写入完成之后调用"""
+        if not self.enabled:
+            return None
+        payload = {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': time.time(),
+            'fingerprint': db_fingerprint(self.db_path),
+            'state': state,
+        }
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as fp:
+            marshal.dump(payload, fp)
+        os.replace(temp_path, self.path)
+        self.LOG.info(f"热启动快照已保存: {self.path} ({os.path.getsize(self.path)}字节)")
+        return self.path
+
+    def load(self) -> Optional[Dict]:
+        """读取并删除快照，快照不可用时返回None"""
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as fp:
+                payload = marshal.load(fp)
+        except (EOFError, ValueError, TypeError, OSError) as e:
+            self.LOG.warning(f"热启动快照无法读取，改为从数据库重建: {e}")
+            return None
+        finally:
+            self.discard()
+
+        if not isinstance(payload, dict) or payload.get('version') != SNAPSHOT_VERSION:
+            self.LOG.info("热启动快照版本不符，改为从数据库重建")
+            return None
+        age = time.time() - payload['saved_at']
+        if age > self.max_age:
+            self.LOG.info(f"热启动快照已过期({int(age)}秒)，改为从数据库重建")
+            return None
+        if payload['fingerprint'] != db_fingerprint(self.db_path):
+            self.LOG.info("数据库在快照之后被修改过，改为从数据库重建")
+            return None
+        return payload['state']
+
+    def discard(self) -> None:
+        """删除快照文件"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
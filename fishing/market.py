@@ -0,0 +1,317 @@
+import time
+import heapq
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .storage import FishingStorage
+
+
+@dataclass
+class Order:
+    id: int
+    user_id: str
+    fish_id: int
+    side: str       # 'sell' 卖单 / 'buy' 买单
+    price: int      # 单价(金币)
+    remaining: int  # 未成交数量
+    created_at: float
+    cancelled: int = 0  # 撤单时未成交的数量，撤单退还之前落盘时仍按未完成写入
+
+
+class OrderBook:
+    """单个鱼种的订单簿，按价格优先、时间优先撮合
+
+    卖单堆按 (价格, 订单号) 排序，买单堆按 (-价格, 订单号) 排序，
+    撤单时只把剩余数量置零，在堆顶遇到时再惰性删除。
+    """
+
+    def __init__(self, fish_id: int):
+        self.fish_id = fish_id
+        self.asks: List[Tuple[int, int, Order]] = []
+        self.bids: List[Tuple[int, int, Order]] = []
+
+    def add(self, order: Order) -> None:
+        """挂入订单簿"""
+        if order.side == 'sell':
+            heapq.heappush(self.asks, (order.price, order.id, order))
+        else:
+            heapq.heappush(self.bids, (-order.price, order.id, order))
+
+    def best(self, side: str) -> Optional[Order]:
+        """获取某一方向的最优挂单"""
+        heap = self.asks if side == 'sell' else self.bids
+        while heap and heap[0][2].remaining <= 0:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def match(self, order: Order) -> List[Tuple[Order, int, int]]:
+        """用新订单吃掉对手方挂单
+        Returns:
+            成交列表 (对手方订单, 成交价, 成交数量)，成交价为对手方挂单价
+        """
+        fills = []
+        contra_side = 'buy' if order.side == 'sell' else 'sell'
+        while order.remaining > 0:
+            contra = self.best(contra_side)
+            if contra is None:
+                break
+            if order.side == 'buy' and contra.price > order.price:
+                break
+            if order.side == 'sell' and contra.price < order.price:
+                break
+            quantity = min(order.remaining, contra.remaining)
+            order.remaining -= quantity
+            contra.remaining -= quantity
+            fills.append((contra, contra.price, quantity))
+        return fills
+
+    def depth(self, side: str, levels: int = 5) -> List[Tuple[int, int]]:
+        """按价格聚合的盘口 (价格, 数量)"""
+        heap = self.asks if side == 'sell' else self.bids
+        totals: Dict[int, int] = {}
+        for _, _, order in heap:
+            if order.remaining > 0:
+                totals[order.price] = totals.get(order.price, 0) + order.remaining
+        return sorted(totals.items(), reverse=(side == 'buy'))[:levels]
+
+
+class FishMarket:
+    """玩家之间的鱼类交易市场
+
+    挂单时在一个事务中托管资产并写入挂单；撮合在内存订单簿中完成，
+    成交记录、挂单剩余数量以及双方的入账批量写入数据库。
+    进程意外退出时未落盘的成交会丢失，但挂单和托管资产保持一致，重启后重新撮合。
+    """
+
+    def __init__(self, db: FishingStorage, config: Dict,
+                 on_fish_credited: Optional[Callable[[Set[str]], None]] = None):
+        """初始化市场
+        Args:
+            db: 数据库
+            config: 插件配置，市场配置位于 config['market']
+            on_fish_credited: 成交落盘后的回调，参数为收到鱼的用户ID集合
+        """
+        market = config.get('market', {})
+        self.db = db
+        self.on_fish_credited = on_fish_credited
+        self.batch_size = market.get('batch_size', 500)  # 累计多少笔成交后立即落盘
+        self.flush_interval = market.get('flush_interval', 1.0)  # 定时落盘间隔(秒)
+        self.max_orders_per_user = market.get('max_orders_per_user', 20)
+        # 单笔挂单的上限，总额需要放得进SQLite的64位整数，也避免托管金币时溢出
+        self.max_quantity = market.get('max_quantity', 10000)
+        self.max_price = market.get('max_price', 10 ** 9)
+        self.max_amount = market.get('max_amount', 10 ** 12)
+        self.LOG = logging.getLogger("FishingMarket")
+
+        self.lock = threading.RLock()  # 保护订单簿
+        self.flush_lock = threading.Lock()  # 保证批量结算按顺序写入
+        self.books: Dict[int, OrderBook] = {}
+        self.orders: Dict[int, Order] = {}  # 订单号 -> 未完成订单
+        self.user_orders: Dict[str, Set[int]] = {}  # 用户ID -> 未完成订单号
+
+        # 待落盘的变更
+        self.pending_fills: List[tuple] = []
+        self.pending_orders: Dict[int, Order] = {}
+        self.pending_coins: Dict[str, int] = {}
+        self.pending_fish: Dict[Tuple[str, int], int] = {}
+
+        self._load_open_orders()
+
+        self.stop_event = threading.Event()
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+
+    def is_valid_order(self, quantity: int, price: int) -> bool:
+        """数量和单价为正且不超过上限，总额不超过 max_amount"""
+        return (0 < quantity <= self.max_quantity and 0 < price <= self.max_price
+                and price * quantity <= self.max_amount)
+
+    def place_order(self, user_id: str, fish_id: int, side: str, price: int, quantity: int) -> Optional[Dict]:
+        """挂单并立即撮合
+        Returns:
+            挂单结果，资产不足时返回None
+        """
+        created_at = time.time()
+        order_id = self.db.create_market_order(user_id, fish_id, side, price, quantity, created_at)
+        if order_id is None:
+            return None
+
+        order = Order(order_id, user_id, fish_id, side, price, quantity, created_at)
+        with self.lock:
+            book = self.books.get(fish_id)
+            if book is None:
+                book = self.books[fish_id] = OrderBook(fish_id)
+            fills = book.match(order)
+            for contra, fill_price, fill_quantity in fills:
+                self._record_fill(order, contra, fill_price, fill_quantity, created_at)
+            if order.remaining > 0:
+                book.add(order)
+                self.orders[order.id] = order
+                self.user_orders.setdefault(user_id, set()).add(order.id)
+            if fills:
+                self.pending_orders[order.id] = order
+            should_flush = len(self.pending_fills) >= self.batch_size
+
+        if should_flush:
+            self.flush()
+
+        filled = quantity - order.remaining
+        return {
+            'order_id': order.id,
+            'filled': filled,
+            'remaining': order.remaining,
+            'amount': sum(fill_price * fill_quantity for _, fill_price, fill_quantity in fills),
+        }
+
+    def cancel_order(self, user_id: str, order_id: int) -> Optional[Dict]:
+        """撤单，退还剩余的托管资产"""
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order.user_id != user_id:
+                return None
+            order.cancelled = order.remaining
+            order.remaining = 0
+            self._forget(order)
+
+        # 先落盘该订单之前的成交(此时仍按未完成写入撤单时的剩余数量)，再按数据库中的剩余数量退还
+        self.flush()
+        return self.db.cancel_market_order(order_id, user_id)
+
+    def get_user_orders(self, user_id: str) -> List[Order]:
+        """获取用户未完成的挂单"""
+        with self.lock:
+            return sorted((self.orders[order_id] for order_id in self.user_orders.get(user_id, ())),
+                          key=lambda order: order.id)
+
+    def get_open_order_count(self, user_id: str) -> int:
+        """获取用户未完成的挂单数量"""
+        with self.lock:
+            return len(self.user_orders.get(user_id, ()))
+
+    def get_quotes(self) -> List[Dict]:
+        """获取各鱼种的最优买卖价"""
+        quotes = []
+        with self.lock:
+            for fish_id, book in self.books.items():
+                best_ask = book.best('sell')
+                best_bid = book.best('buy')
+                if best_ask or best_bid:
+                    quotes.append({
+                        'fish_id': fish_id,
+                        'ask': best_ask.price if best_ask else None,
+                        'bid': best_bid.price if best_bid else None,
+                    })
+        return quotes
+
+    def get_depth(self, fish_id: int, levels: int = 5) -> Dict[str, List[Tuple[int, int]]]:
+        """获取某鱼种的盘口"""
+        with self.lock:
+            book = self.books.get(fish_id)
+            if book is None:
+                return {'sell': [], 'buy': []}
+            return {'sell': book.depth('sell', levels), 'buy': book.depth('buy', levels)}
+
+    def flush(self) -> int:
+        """把待落盘的成交批量写入数据库，返回写入的成交笔数"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending_fills and not self.pending_orders:
+                    return 0
+                fills = self.pending_fills
+                orders = self.pending_orders
+                order_updates = [
+                    (order.cancelled, 'open', order.id) if order.cancelled else
+                    (order.remaining, 'open' if order.remaining > 0 else 'filled', order.id)
+                    for order in orders.values()
+                ]
+                coins = self.pending_coins
+                fish = self.pending_fish
+                self.pending_fills = []
+                self.pending_orders = {}
+                self.pending_coins = {}
+                self.pending_fish = {}
+
+            try:
+                self.db.settle_market_fills(fills, order_updates, coins, fish)
+            except Exception:
+                # 写入失败时放回队列，等待下次重试
+                with self.lock:
+                    self.pending_fills = fills + self.pending_fills
+                    for user_id, amount in coins.items():
+                        self.pending_coins[user_id] = self.pending_coins.get(user_id, 0) + amount
+                    for key, amount in fish.items():
+                        self.pending_fish[key] = self.pending_fish.get(key, 0) + amount
+                    for order_id, order in orders.items():
+                        self.pending_orders.setdefault(order_id, order)
+                raise
+
+        if fish and self.on_fish_credited:
+            self.on_fish_credited({user_id for user_id, _ in fish})
+        return len(fills)
+
+    def stop(self) -> None:
+        """停止定时落盘并写入剩余的成交"""
+        self.stop_event.set()
+        self.flush()
+
+    def _record_fill(self, taker: Order, maker: Order, price: int, quantity: int, created_at: float) -> None:
+        """记录一笔成交及双方的入账"""
+        buy, sell = (taker, maker) if taker.side == 'buy' else (maker, taker)
+        self.pending_fills.append(
+            (buy.fish_id, price, quantity, buy.id, sell.id, buy.user_id, sell.user_id, created_at)
+        )
+        self.pending_coins[sell.user_id] = self.pending_coins.get(sell.user_id, 0) + price * quantity
+        if buy.price > price:
+            # 买单按挂单价托管，以更低价格成交时退还差价
+            refund = (buy.price - price) * quantity
+            self.pending_coins[buy.user_id] = self.pending_coins.get(buy.user_id, 0) + refund
+        key = (buy.user_id, buy.fish_id)
+        self.pending_fish[key] = self.pending_fish.get(key, 0) + quantity
+
+        self.pending_orders[maker.id] = maker
+        if maker.remaining <= 0:
+            self._forget(maker)
+
+    def _forget(self, order: Order) -> None:
+        """从未完成订单索引中移除"""
+        self.orders.pop(order.id, None)
+        user_orders = self.user_orders.get(order.user_id)
+        if user_orders is not None:
+            user_orders.discard(order.id)
+            if not user_orders:
+                del self.user_orders[order.user_id]
+
+    def _load_open_orders(self) -> None:
+        """从数据库恢复未完成的挂单
+
+        按订单号顺序重新撮合，上次退出前未落盘的成交会在这里重新产生。
+        """
+        for row in self.db.get_open_market_orders():
+            order = Order(row['id'], row['user_id'], row['fish_id'], row['side'],
+                          row['price'], row['remaining'], row['created_at'])
+            book = self.books.get(order.fish_id)
+            if book is None:
+                book = self.books[order.fish_id] = OrderBook(order.fish_id)
+            fills = book.match(order)
+            for contra, fill_price, fill_quantity in fills:
+                self._record_fill(order, contra, fill_price, fill_quantity, time.time())
+            if fills:
+                self.pending_orders[order.id] = order
+            if order.remaining > 0:
+                book.add(order)
+                self.orders[order.id] = order
+                self.user_orders.setdefault(order.user_id, set()).add(order.id)
+        if self.pending_fills:
+            self.flush()
+        if self.orders:
+            self.LOG.info(f"已恢复{len(self.orders)}个未完成的市场挂单")
+
+    def _flush_loop(self) -> None:
+        """定时落盘循环"""
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.LOG.error(f"市场成交落盘失败: {e}", exc_info=True)
@@ -0,0 +1,777 @@
+import os
+import time
+import heapq
+import marshal
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .catches import CatchSet, MAX_SPECIMENS
+from .contention import LockStats
+
+SNAPSHOT_VERSION = 1
+
+# 用户行各字段的下标
+COINS, CURRENT_BAIT, BAIT_START_TIME, LAST_STEAL_TIME, AUTO_FISHING, LAST_FISHING_TIME = range(6)
+# 鱼塘每种鱼的字段下标: [数量, 禁售截止时间, 截止前不能出售的条数(偷来的鱼)]
+QUANTITY, NO_SELL_UNTIL, LOCKED = range(3)
+# 市场挂单字段下标
+(ORDER_USER, ORDER_FISH, ORDER_SIDE, ORDER_PRICE, ORDER_QUANTITY, ORDER_REMAINING,
+ ORDER_STATUS, ORDER_CREATED_AT) = range(8)
+
+
+class MemoryFishingDB:
+    """纯内存存储引擎
+
+    与 FishingDB 接口相同，所有数据保存在字典和列表中，一把锁保证每个操作的原子性，
+    命令处理不产生任何磁盘I/O。后台线程在数据有变化时定期把全部数据序列化为marshal快照，
+    写入临时文件后原子替换，启动时从快照恢复；进程异常退出会丢失最后一次快照之后的变更。
+    金币流水同样保存在内存中，已对账的流水只保留最近的 ledger_keep 条。
+    """
+
+    INITIAL_COINS = 100  # 新用户的初始金币
+
+    def __init__(self, snapshot_path: str, config: Optional[Dict] = None):
+        """初始化内存存储
+        Args:
+            snapshot_path: 快照文件路径
+            config: 插件配置，快照配置位于 config['storage']
+        """
+        storage = (config or {}).get('storage', {})
+        self.db_path = snapshot_path
+        self.snapshot_interval = storage.get('snapshot_interval', 60)  # 快照间隔(秒)，0表示只在关闭时保存
+        self.ledger_keep = storage.get('ledger_keep', 100000)  # 保留的已对账流水条数
+        self.max_specimens = MAX_SPECIMENS
+        self.lock_stats = LockStats()
+        self.LOG = logging.getLogger("FishingMemoryDB")
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()  # 快照在锁外写盘，保存之间仍需串行，避免旧快照覆盖新快照
+        self.dirty = False
+
+        self.users: Dict[str, list] = {}
+        self.fish_config: Dict[int, tuple] = {}    # 鱼ID -> (id, name, rarity, base_value, min_weight, max_weight, habitat)
+        self.catalog_digest = ''
+        self.ponds: Dict[str, Dict[int, list]] = {}  # 用户 -> 鱼ID -> [数量, 禁售截止时间, 禁售数量]
+        self.catches: Dict[str, Dict[int, CatchSet]] = {}
+        # 上次快照时打包好的捕获记录行，保存快照时只重新打包期间变化过的 (用户, 鱼ID)
+        self.catch_rows: Dict[str, Dict[int, tuple]] = {}
+        self.changed_catches: set = set()
+        self.baits: Dict[str, Dict[str, int]] = {}
+        self.check_in_bits: Dict[Tuple[str, int], bytes] = {}
+        self.orders: Dict[int, list] = {}
+        self.escrow: Dict[int, tuple] = {}  # 卖单ID -> 托管的鱼的捕获记录行
+        self.next_order_id = 1
+        self.fill_count = 0
+        self.stats: Dict[str, Dict[str, Tuple[str, int]]] = {}
+        self.awards: Dict[str, Dict[Tuple[str, str, str], float]] = {}
+        self.species: Dict[str, set] = {}
+        self.profiles: Dict[str, Tuple[str, float]] = {}
+        self.ledger: List[tuple] = []  # (id, user_id, delta, reason, created_at)
+        self.next_ledger_id = 1
+        self.ledger_totals: Dict[str, int] = {}  # 用户所有流水之和
+        self.checkpoints: Dict[str, Tuple[int, int, int]] = {}  # 用户 -> (余额, 流水ID, 当时的流水之和)
+        self.reconciled_id = 0
+        # 全服统计，对应SQLite引擎中由触发器维护的 global_stats 和 fish_totals，不写入快照
+        self.total_coins = 0
+        self.auto_fishers = 0
+        self.fish_totals: Dict[int, list] = {}  # 鱼ID -> [总数, 持有人数]
+
+        snapshot_dir = os.path.dirname(snapshot_path)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        self._load_snapshot()
+        self._rebuild_global_stats()
+
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        if self.snapshot_interval > 0:
+            self.thread = threading.Thread(target=self._snapshot_loop, daemon=True)
+            self.thread.start()
+
+    @contextmanager
+    def _write(self, op: str):
+        """持有全局锁执行一个写操作，统计等锁时间"""
+        started = time.perf_counter()
+        with self.lock:
+            self.lock_stats.record(op, time.perf_counter() - started, 0)
+            self.dirty = True
+            yield
+
+    def _ensure_user_exists(self, user_id: str) -> list:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = [self.INITIAL_COINS, None, None, None, 0, 0.0]
+            self.total_coins += self.INITIAL_COINS
+            self._log_coins([(user_id, self.INITIAL_COINS, 'initial')])
+        return user
+
+    def _log_coins(self, entries: List[tuple]) -> None:
+        """记录金币流水，调用方持有锁，流水与余额总是同时变化"""
+        now = time.time()
+        for user_id, delta, reason in entries:
+            if not delta:
+                continue
+            self.ledger.append((self.next_ledger_id, user_id, delta, reason, now))
+            self.next_ledger_id += 1
+            self.ledger_totals[user_id] = self.ledger_totals.get(user_id, 0) + delta
+
+    # 用户与金币
+
+    def get_user_coins(self, user_id: str) -> int:
+        """获取用户金币数量，如果用户不存在则创建"""
+        user = self.users.get(user_id)
+        if user is not None:
+            return user[COINS]
+        with self._write('get_user_coins'):
+            return self._ensure_user_exists(user_id)[COINS]
+
+    def update_user_coins(self, user_id: str, amount: int, reason: str = 'unknown') -> None:
+        """更新用户金币，用户不存在时不做修改"""
+        with self._write('update_user_coins'):
+            user = self.users.get(user_id)
+            if user is not None:
+                user[COINS] += amount
+                self.total_coins += amount
+                self._log_coins([(user_id, amount, reason)])
+
+    def get_top_users_by_coins(self, limit: int = 10) -> List[Dict]:
+        """获取金币最多的用户"""
+        with self.lock:
+            top = heapq.nlargest(limit, self.users.items(), key=lambda item: item[1][COINS])
+        return [{'user_id': user_id, 'coins': user[COINS]} for user_id, user in top]
+
+    def get_last_fishing_time(self, user_id: str) -> float:
+        user = self.users.get(user_id)
+        return float(user[LAST_FISHING_TIME] or 0) if user else 0
+
+    def update_last_fishing_time(self, user_id: str) -> None:
+        with self._write('update_last_fishing_time'):
+            user = self.users.get(user_id)
+            if user is not None:
+                user[LAST_FISHING_TIME] = time.time()
+
+    def get_auto_fishing_status(self, user_id: str) -> bool:
+        user = self.users.get(user_id)
+        return bool(user[AUTO_FISHING]) if user else False
+
+    def set_auto_fishing_status(self, user_id: str, status: bool) -> bool:
+        with self._write('set_auto_fishing_status'):
+            user = self._ensure_user_exists(user_id)
+            self.auto_fishers += (1 if status else 0) - (1 if user[AUTO_FISHING] == 1 else 0)
+            user[AUTO_FISHING] = 1 if status else 0
+        return True
+
+    def get_auto_fishing_schedule(self) -> List[Tuple[str, float]]:
+        with self.lock:
+            return [(user_id, float(user[LAST_FISHING_TIME] or 0))
+                    for user_id, user in self.users.items() if user[AUTO_FISHING]]
+
+    # 鱼类图鉴
+
+    def initialize_fish_types(self, rows: List[Tuple], digest: str = ''):
+        """插入或更新鱼类数据，图鉴中删除的鱼保留，玩家鱼塘里的鱼仍可显示和出售"""
+        with self._write('initialize_fish_types'):
+            if digest and digest == self.catalog_digest:
+                return f"鱼类数据已是最新({len(rows)}种)"
+            for row in rows:
+                self.fish_config[row[0]] = tuple(row)
+            self.catalog_digest = digest
+        return f"成功初始化/更新了 {len(rows)} 种鱼类数据"
+
+    def get_fish_by_name(self, name: str) -> Optional[Dict]:
+        with self.lock:
+            for row in self.fish_config.values():
+                if row[1] == name:
+                    return {'id': row[0], 'name': row[1], 'rarity': row[2], 'base_value': row[3]}
+        return None
+
+    def get_fish_names(self) -> Dict[int, str]:
+        with self.lock:
+            return {fish_id: row[1] for fish_id, row in self.fish_config.items()}
+
+    @staticmethod
+    def _rank_key(row: tuple) -> Tuple[int, int, int]:
+        """分页键 (稀有度, 价值, ID)"""
+        return row[2], row[3], row[0]
+
+    def _fish_types_after(self, rarity: Optional[int], after: Optional[Tuple]) -> List[tuple]:
+        rows = [row for row in self.fish_config.values()
+                if (rarity is None or row[2] == rarity) and (after is None or self._rank_key(row) < tuple(after))]
+        rows.sort(key=self._rank_key, reverse=True)
+        return rows
+
+    def iter_fish_types_page(self, rarity: Optional[int] = None, after: Optional[Tuple] = None,
+                             limit: int = 20) -> Iterator[Dict]:
+        """按 稀有度、价值、ID 降序返回图鉴的一页"""
+        with self.lock:
+            rows = self._fish_types_after(rarity, after)[:limit]
+        for row in rows:
+            yield {'id': row[0], 'name': row[1], 'rarity': row[2], 'base_value': row[3], 'habitat': row[6]}
+
+    def seek_fish_types(self, rarity: Optional[int], after: Optional[Tuple], rows: int) -> Optional[Tuple]:
+        with self.lock:
+            found = self._fish_types_after(rarity, after)
+        return self._rank_key(found[rows - 1]) if len(found) >= rows else None
+
+    # 鱼塘
+
+    def add_fish_to_pond(self, user_id: str, fish_id: int, weight: Optional[int] = None,
+                         catch_time: Optional[float] = None) -> None:
+        with self._write('add_fish_to_pond'):
+            self._credit_fish(user_id, fish_id, 1)
+            if weight is not None:
+                self._update_catches(user_id, fish_id).add(weight, catch_time or time.time(), self.max_specimens)
+
+    def _update_catches(self, user_id: str, fish_id: int) -> CatchSet:
+        """取出需要修改的捕获记录，不存在时创建，并标记为下次快照需要重新打包"""
+        self.changed_catches.add((user_id, fish_id))
+        return self.catches.setdefault(user_id, {}).setdefault(fish_id, CatchSet())
+
+    def _credit_fish(self, user_id: str, fish_id: int, amount: int) -> list:
+        entry = self.ponds.setdefault(user_id, {}).get(fish_id)
+        if entry is None:
+            entry = self.ponds[user_id][fish_id] = [amount, 0, 0]
+            self._count_fish(fish_id, 0, amount)
+        else:
+            self._count_fish(fish_id, entry[QUANTITY], entry[QUANTITY] + amount)
+            entry[QUANTITY] += amount
+        return entry
+
+    @staticmethod
+    def _locked(entry: list, now: int) -> int:
+        """禁售中的条数，禁售期到期后为0"""
+        return min(entry[LOCKED], entry[QUANTITY]) if (entry[NO_SELL_UNTIL] or 0) > now else 0
+
+    def _count_fish(self, fish_id: int, before: int, after: int) -> None:
+        """鱼塘数量变化时更新全服各鱼种的总数和持有人数"""
+        totals = self.fish_totals.get(fish_id)
+        if totals is None:
+            totals = self.fish_totals[fish_id] = [0, 0]
+        totals[0] += after - before
+        totals[1] += (after > 0) - (before > 0)
+
+    def _take_catches(self, user_id: str, fish_id: int, amount: int) -> CatchSet:
+        """在已扣减鱼塘数量后取出对应的捕获记录"""
+        entry = self.ponds.get(user_id, {}).get(fish_id)
+        quantity = (entry[QUANTITY] if entry else 0) + amount
+        user_catches = self.catches.get(user_id, {})
+        catches = user_catches.get(fish_id)
+        if catches is None:
+            return CatchSet(unknown=amount)
+        self.changed_catches.add((user_id, fish_id))
+        taken = catches.take(amount, quantity)
+        if not catches.weights and not catches.bulk_count:
+            del user_catches[fish_id]
+        return taken
+
+    def remove_fish_from_pond(self, user_id: str, fish_id: int, amount: int) -> Optional[CatchSet]:
+        """从鱼塘中移除鱼，返回被移除的鱼的捕获记录；数量不足时不做修改并返回None"""
+        with self._write('remove_fish_from_pond'):
+            entry = self.ponds.get(user_id, {}).get(fish_id)
+            if entry is None or entry[QUANTITY] - self._locked(entry, int(time.time())) < amount:
+                return None
+            self._count_fish(fish_id, entry[QUANTITY], entry[QUANTITY] - amount)
+            entry[QUANTITY] -= amount
+            return self._take_catches(user_id, fish_id, amount)
+
+    def _lock_time(self, entry: list, now: int) -> int:
+        no_sell_until = entry[NO_SELL_UNTIL] or 0
+        return no_sell_until - now if no_sell_until > now and entry[LOCKED] > 0 else 0
+
+    def _pond_rows(self, user_id: str, after: Optional[Tuple] = None,
+                   min_rarity: int = 0) -> List[Tuple[tuple, list]]:
+        """用户鱼塘中数量大于0的鱼，按 稀有度、价值、ID 降序"""
+        rows = []
+        for fish_id, entry in self.ponds.get(user_id, {}).items():
+            fish = self.fish_config.get(fish_id)
+            if fish is None or entry[QUANTITY] <= 0 or fish[2] < min_rarity:
+                continue
+            if after is not None and self._rank_key(fish) >= tuple(after):
+                continue
+            rows.append((fish, entry))
+        rows.sort(key=lambda item: self._rank_key(item[0]), reverse=True)
+        return rows
+
+    def _pond_dict(self, fish: tuple, entry: list, now: int) -> Dict:
+        return {
+            'id': fish[0],
+            'name': fish[1],
+            'rarity': fish[2],
+            'quantity': entry[QUANTITY],
+            'base_value': fish[3],
+            'lock_time': self._lock_time(entry, now),
+            'locked': self._locked(entry, now)
+        }
+
+    def get_user_fish(self, user_id: str) -> List[Dict]:
+        now = int(time.time())
+        with self.lock:
+            return [self._pond_dict(fish, entry, now) for fish, entry in self._pond_rows(user_id)]
+
+    def get_user_fish_quantity(self, user_id: str, fish_id: int) -> int:
+        entry = self.ponds.get(user_id, {}).get(fish_id)
+        return entry[QUANTITY] if entry else 0
+
+    def get_fish_lock_time(self, user_id: str, fish_id: int) -> int:
+        entry = self.ponds.get(user_id, {}).get(fish_id)
+        return self._lock_time(entry, int(time.time())) if entry else 0
+
+    def get_user_catches(self, user_id: str, fish_id: int) -> CatchSet:
+        with self.lock:
+            stored = self.catches.get(user_id, {}).get(fish_id)
+            catches = CatchSet()
+            if stored is not None:
+                catches.merge(stored, len(stored.weights))
+            catches.unknown = max(self.get_user_fish_quantity(user_id, fish_id)
+                                  - len(catches.weights) - catches.bulk_count, 0)
+            return catches
+
+    def iter_user_fish_page(self, user_id: str, after: Optional[Tuple] = None,
+                            limit: int = 20) -> Iterator[Dict]:
+        now = int(time.time())
+        with self.lock:
+            rows = []
+            for fish, entry in self._pond_rows(user_id, after)[:limit]:
+                row = self._pond_dict(fish, entry, now)
+                catches = self.catches.get(user_id, {}).get(fish[0])
+                row['heaviest'] = catches.heaviest if catches else None
+                rows.append(row)
+        yield from rows
+
+    def seek_user_fish(self, user_id: str, after: Optional[Tuple], rows: int) -> Optional[Tuple]:
+        with self.lock:
+            found = self._pond_rows(user_id, after)
+        return self._rank_key(found[rows - 1][0]) if len(found) >= rows else None
+
+    # 鱼饵
+
+    def add_user_bait(self, user_id: str, bait_name: str) -> None:
+        with self._write('add_user_bait'):
+            baits = self.baits.setdefault(user_id, {})
+            baits[bait_name] = baits.get(bait_name, 0) + 1
+
+    def show_my_baits(self, user_id: str) -> List[Dict]:
+        with self.lock:
+            return [{"bait_id": bait_id, "quantity": quantity}
+                    for bait_id, quantity in self.baits.get(user_id, {}).items() if quantity > 0]
+
+    def get_bait_info(self, user_id: str) -> Optional[Dict]:
+        user = self.users.get(user_id)
+        if user and user[CURRENT_BAIT]:
+            return {'name': user[CURRENT_BAIT], 'start_time': user[BAIT_START_TIME]}
+        return None
+
+    def set_current_bait(self, user_id: str, bait_name: Optional[str]) -> None:
+        with self._write('set_current_bait'):
+            user = self._ensure_user_exists(user_id)
+            user[CURRENT_BAIT] = bait_name
+            user[BAIT_START_TIME] = int(time.time()) if bait_name is not None else None
+
+    def use_bait(self, user_id: str, bait_name: str, current_time: float) -> None:
+        """使用鱼饵(消耗一个鱼饵并设置为当前使用的鱼饵)"""
+        with self._write('use_bait'):
+            baits = self.baits.get(user_id, {})
+            if baits.get(bait_name, 0) > 0:
+                baits[bait_name] -= 1
+            user = self.users.get(user_id)
+            if user is not None:
+                user[CURRENT_BAIT] = bait_name
+                user[BAIT_START_TIME] = current_time
+
+    # 签到
+
+    def get_check_in_bits(self, user_id: str, year: int) -> Optional[bytes]:
+        return self.check_in_bits.get((user_id, year))
+
+    def set_check_in_bit(self, user_id: str, year: int, day_index: int) -> Optional[bytes]:
+        """设置签到位，该位已设置时返回None，否则返回新的位图"""
+        with self._write('set_check_in_bit'):
+            value = int.from_bytes(self.check_in_bits.get((user_id, year), bytes(46)), 'little')
+            if value >> day_index & 1:
+                return None
+            bits = (value | (1 << day_index)).to_bytes(46, 'little')
+            self.check_in_bits[(user_id, year)] = bits
+            return bits
+
+    # 偷鱼
+
+    def get_stealable_weights(self, user_id: Optional[str] = None, min_rarity: int = 3) -> List[Dict]:
+        """统计用户可被偷的鱼的总价值以及最早解除禁售的时间"""
+        now = int(time.time())
+        result = []
+        with self.lock:
+            user_ids = [user_id] if user_id is not None else list(self.ponds)
+            for uid in user_ids:
+                rows = self._pond_rows(uid, min_rarity=min_rarity)
+                if not rows:
+                    continue
+                weight = 0
+                unlock_time = None
+                for fish, entry in rows:
+                    weight += (entry[QUANTITY] - self._locked(entry, now)) * fish[3]
+                    lock_time = self._lock_time(entry, now)
+                    if lock_time and (unlock_time is None or now + lock_time < unlock_time):
+                        unlock_time = now + lock_time
+                result.append({'user_id': uid, 'weight': weight, 'unlock_time': unlock_time})
+        return result
+
+    def steal_fish(self, thief_id: str, victim_id: str, r: float, now: float,
+                   cooldown: int, lock_duration: int, min_rarity: int = 3) -> Dict:
+        """偷鱼，检查冷却、挑选鱼、转移鱼在同一把锁内完成"""
+        now_int = int(now)
+        with self._write('steal_fish'):
+            thief = self._ensure_user_exists(thief_id)
+            last_steal_time = thief[LAST_STEAL_TIME]
+            if last_steal_time is not None and last_steal_time > now_int - cooldown:
+                return {'status': 'cooldown', 'last_steal_time': last_steal_time}
+
+            # 只能偷走可出售的鱼，禁售中的鱼(受害者偷来的)不计入
+            candidates = [(fish, entry, entry[QUANTITY] - self._locked(entry, now_int))
+                          for fish, entry in self._pond_rows(victim_id, min_rarity=min_rarity)]
+            candidates = [candidate for candidate in candidates if candidate[2] > 0]
+            if not candidates:
+                return {'status': 'empty'}
+            thief[LAST_STEAL_TIME] = now_int
+
+            # 按价值加权挑选一条鱼，顺序与SQLite实现一致(按鱼ID)
+            candidates.sort(key=lambda item: item[0][0])
+            target = r * sum(fish[3] * sellable for fish, entry, sellable in candidates)
+            for fish, entry, sellable in candidates:
+                target -= fish[3] * sellable
+                if target < 0:
+                    break
+
+            fish_id = fish[0]
+            self._count_fish(fish_id, entry[QUANTITY], entry[QUANTITY] - 1)
+            entry[QUANTITY] -= 1
+            stolen = self._take_catches(victim_id, fish_id, 1)
+            # 与SQLite实现一致: 只锁住偷来的鱼，仍在禁售期内的偷来的鱼随之延长
+            held = self._credit_fish(thief_id, fish_id, 1)
+            held[LOCKED] = self._locked(held, now_int) + 1
+            held[NO_SELL_UNTIL] = max(held[NO_SELL_UNTIL] or 0, now_int + lock_duration)
+            locked = lock_duration > 0
+            if stolen.weights or stolen.bulk_count:
+                self._update_catches(thief_id, fish_id).merge(stolen, self.max_specimens)
+            return {'status': 'ok', 'id': fish_id, 'name': fish[1], 'rarity': fish[2], 'base_value': fish[3],
+                    'catch': stolen, 'locked': locked}
+
+    # 市场
+
+    def create_market_order(self, user_id: str, fish_id: int, side: str, price: int,
+                            quantity: int, created_at: float) -> Optional[int]:
+        """创建市场挂单并托管资产(卖单托管鱼，买单托管金币)，资产不足时返回None"""
+        with self._write('create_market_order'):
+            if side == 'sell':
+                entry = self.ponds.get(user_id, {}).get(fish_id)
+                if entry is None or entry[QUANTITY] - self._locked(entry, int(created_at)) < quantity:
+                    return None
+                self._count_fish(fish_id, entry[QUANTITY], entry[QUANTITY] - quantity)
+                entry[QUANTITY] -= quantity
+                # 市场按挂单价成交，托管的鱼的重量记录随挂单保存，撤单时退还
+                taken = self._take_catches(user_id, fish_id, quantity)
+            else:
+                user = self._ensure_user_exists(user_id)
+                if user[COINS] < price * quantity:
+                    return None
+                user[COINS] -= price * quantity
+                self.total_coins -= price * quantity
+                self._log_coins([(user_id, -price * quantity, 'market_escrow')])
+
+            order_id = self.next_order_id
+            self.next_order_id += 1
+            self.orders[order_id] = [user_id, fish_id, side, price, quantity, quantity, 'open', created_at]
+            if side == 'sell' and (taken.weights or taken.bulk_count):
+                self.escrow[order_id] = taken.to_row()
+            return order_id
+
+    def get_open_market_orders(self) -> List[Dict]:
+        with self.lock:
+            return [{
+                'id': order_id,
+                'user_id': order[ORDER_USER],
+                'fish_id': order[ORDER_FISH],
+                'side': order[ORDER_SIDE],
+                'price': order[ORDER_PRICE],
+                'remaining': order[ORDER_REMAINING],
+                'created_at': order[ORDER_CREATED_AT]
+            } for order_id, order in sorted(self.orders.items())
+                if order[ORDER_STATUS] == 'open' and order[ORDER_REMAINING] > 0]
+
+    def settle_market_fills(self, fills: List[tuple], order_updates: List[tuple],
+                            coin_credits: Dict[str, int], fish_credits: Dict[tuple, int]) -> None:
+        """批量结算成交，已结束的挂单从内存中移除"""
+        with self._write('settle_market_fills'):
+            self.fill_count += len(fills)
+            for remaining, status, order_id in order_updates:
+                order = self.orders.get(order_id)
+                if order is None:
+                    continue
+                order[ORDER_REMAINING], order[ORDER_STATUS] = remaining, status
+                if status != 'open':
+                    del self.orders[order_id]
+                    self.escrow.pop(order_id, None)
+            for user_id, amount in coin_credits.items():
+                user = self.users.get(user_id)
+                if user is not None:
+                    user[COINS] += amount
+                    self.total_coins += amount
+            for (user_id, fish_id), amount in fish_credits.items():
+                self._credit_fish(user_id, fish_id, amount)
+            self._log_coins([(user_id, amount, 'market_settle') for user_id, amount in coin_credits.items()])
+
+    def cancel_market_order(self, order_id: int, user_id: str) -> Optional[Dict]:
+        """撤销挂单并退还托管的资产，返回被撤销的挂单信息"""
+        with self._write('cancel_market_order'):
+            order = self.orders.get(order_id)
+            if order is None or order[ORDER_USER] != user_id or order[ORDER_STATUS] != 'open':
+                return None
+            del self.orders[order_id]
+            fish_id, side, price, remaining = order[ORDER_FISH], order[ORDER_SIDE], order[ORDER_PRICE], order[ORDER_REMAINING]
+            if side == 'sell':
+                self._credit_fish(user_id, fish_id, remaining)
+                escrow = self.escrow.pop(order_id, None)
+                if escrow:
+                    # 已成交的部分和上架时一样先从最轻的取出，较重的标本退还给卖家
+                    refund = CatchSet.from_row(escrow)
+                    refund.take(order[ORDER_QUANTITY] - remaining, order[ORDER_QUANTITY])
+                    catches = self._update_catches(user_id, fish_id)
+                    catches.merge(refund, self.max_specimens)
+                    if not catches.weights and not catches.bulk_count:
+                        del self.catches[user_id][fish_id]
+            else:
+                user = self.users.get(user_id)
+                if user is not None:
+                    user[COINS] += price * remaining
+                    self.total_coins += price * remaining
+                self._log_coins([(user_id, price * remaining, 'market_refund')])
+            return {'fish_id': fish_id, 'side': side, 'price': price, 'remaining': remaining}
+
+    # 成就
+
+    def get_achievement_state(self, user_id: str, today: str) -> Dict:
+        with self.lock:
+            awards = {(kind, rule_key) for kind, rule_key, day in self.awards.get(user_id, {})
+                      if day in ('', today)}
+            return {
+                'stats': dict(self.stats.get(user_id, {})),
+                'awards': awards,
+                'species': set(self.species.get(user_id, ())),
+            }
+
+    def save_achievement_progress(self, user_id: str, stats: List[tuple], awards: List[tuple],
+                                  new_species: Optional[int] = None) -> None:
+        with self._write('save_achievement_progress'):
+            user_stats = self.stats.setdefault(user_id, {})
+            for metric, day, value in stats:
+                old = user_stats.get(metric)
+                if old is not None and old[0] == day:
+                    value = max(old[1], value)
+                user_stats[metric] = (day, value)
+            user_awards = self.awards.setdefault(user_id, {})
+            for kind, rule_key, day, achieved_at in awards:
+                user_awards.setdefault((kind, rule_key, day), achieved_at)
+            if new_species is not None:
+                self.species.setdefault(user_id, set()).add(new_species)
+
+    # 昵称
+
+    def get_nicknames(self, user_ids: List[str]) -> Dict[str, str]:
+        with self.lock:
+            return {user_id: self.profiles[user_id][0] for user_id in user_ids
+                    if user_id in self.profiles and self.profiles[user_id][0]}
+
+    def save_nicknames(self, nicknames: List[tuple]) -> None:
+        now = time.time()
+        with self._write('save_nicknames'):
+            for user_id, nickname in nicknames:
+                self.profiles[user_id] = (nickname, now)
+
+    # 金币流水
+
+    def reconcile_coins(self, batch_size: int = 5000) -> Dict:
+        """从上次对账位置开始核对余额，逻辑与 FishingDB.reconcile_coins 相同"""
+        with self._write('reconcile_coins'):
+            start = self._ledger_index(self.reconciled_id + 1)
+            rows = self.ledger[start:start + batch_size]
+            if not rows:
+                return {'users': 0, 'mismatches': [], 'reconciled_id': self.reconciled_id, 'done': True}
+            end_id = rows[-1][0]
+            user_ids = list(dict.fromkeys(row[1] for row in rows))
+
+            mismatches = []
+            for user_id in user_ids:
+                user = self.users.get(user_id)
+                if user is None:
+                    continue
+                balance, _, total = self.checkpoints.get(user_id, (0, 0, 0))
+                expected = balance + self.ledger_totals.get(user_id, 0) - total
+                if expected != user[COINS]:
+                    delta = user[COINS] - expected
+                    self._log_coins([(user_id, delta, 'reconcile')])
+                    mismatches.append((user_id, delta))
+                    logging.warning(f"金币对账不一致: 用户 {user_id} 流水推算 {expected}，实际 {user[COINS]}")
+                self.checkpoints[user_id] = (user[COINS], self.next_ledger_id - 1, self.ledger_totals.get(user_id, 0))
+            self.reconciled_id = end_id
+            self._trim_ledger()
+            return {
+                'users': len(user_ids),
+                'mismatches': mismatches,
+                'reconciled_id': end_id,
+                'done': len(rows) < batch_size,
+            }
+
+    def _ledger_index(self, ledger_id: int) -> int:
+        """流水ID在列表中的位置，ID连续递增，裁剪后列表从第一条保留的流水开始"""
+        if not self.ledger:
+            return 0
+        return max(ledger_id - self.ledger[0][0], 0)
+
+    def _trim_ledger(self) -> None:
+        """只保留最近的 ledger_keep 条已对账流水"""
+        reconciled = self._ledger_index(self.reconciled_id + 1)
+        excess = reconciled - self.ledger_keep
+        if excess > 0:
+            del self.ledger[:excess]
+
+    # 全服统计
+
+    def get_global_stats(self) -> Dict:
+        with self.lock:
+            return {
+                'users': len(self.users),
+                'coins': self.total_coins,
+                'auto_fishers': self.auto_fishers,
+                'fish': {fish_id: {'quantity': quantity, 'holders': holders}
+                         for fish_id, (quantity, holders) in self.fish_totals.items() if quantity or holders},
+            }
+
+    def rebuild_global_stats(self) -> Dict:
+        with self.lock:
+            self._rebuild_global_stats()
+        return self.get_global_stats()
+
+    def _rebuild_global_stats(self) -> None:
+        self.total_coins = sum(user[COINS] for user in self.users.values())
+        self.auto_fishers = sum(1 for user in self.users.values() if user[AUTO_FISHING] == 1)
+        self.fish_totals = {}
+        for pond in self.ponds.values():
+            for fish_id, entry in pond.items():
+                self._count_fish(fish_id, 0, entry[QUANTITY])
+
+    # 持久化
+
+    def backup_to(self, target: str, pages_per_step: int = 64, step_sleep: float = 0) -> Dict:
+        """写出一份快照，页数按4KB折算"""
+        data = self._dump()
+        with open(target, 'wb') as fp:
+            fp.write(data)
+        return {'pages': (len(data) + 4095) // 4096, 'steps': 1}
+
+    def save_snapshot(self) -> None:
+        """把全部数据写入快照文件
+
+        锁内只做序列化(捕获记录只重新打包变化过的)，写盘在锁外进行。先写临时文件并fsync再替换，断电时保留的是完整的旧快照或新快照。
+        """
+        with self.save_lock:
+            with self.lock:
+                data = self._dump()
+                self.dirty = False
+            temp_path = self.db_path + '.tmp'
+            try:
+                with open(temp_path, 'wb') as fp:
+                    fp.write(data)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                os.replace(temp_path, self.db_path)
+            except OSError:
+                self.dirty = True
+                raise
+            self._fsync_directory()
+
+    def _fsync_directory(self) -> None:
+        """替换后同步所在目录，确保文件名的变更落盘；Windows不支持打开目录，跳过"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.db_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        """停止快照线程并保存最终快照"""
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(10)
+        self.save_snapshot()
+
+    def _snapshot_loop(self) -> None:
+        while not self.stop_event.wait(self.snapshot_interval):
+            if not self.dirty:
+                continue
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                self.LOG.error(f"保存内存存储快照失败: {e}", exc_info=True)
+
+    def _dump(self) -> bytes:
+        """在锁内序列化全部数据，得到一致的快照"""
+        with self.lock:
+            for user_id, fish_id in self.changed_catches:
+                catches = self.catches.get(user_id, {}).get(fish_id)
+                if catches is None:
+                    self.catch_rows.get(user_id, {}).pop(fish_id, None)
+                else:
+                    self.catch_rows.setdefault(user_id, {})[fish_id] = catches.to_row()
+            self.changed_catches.clear()
+            return marshal.dumps({
+                'version': SNAPSHOT_VERSION,
+                'users': self.users,
+                'fish_config': self.fish_config,
+                'catalog_digest': self.catalog_digest,
+                'ponds': self.ponds,
+                'catches': self.catch_rows,
+                'baits': self.baits,
+                'check_in_bits': self.check_in_bits,
+                'orders': self.orders,
+                'escrow': self.escrow,
+                'next_order_id': self.next_order_id,
+                'fill_count': self.fill_count,
+                'stats': self.stats,
+                'awards': self.awards,
+                'species': self.species,
+                'profiles': self.profiles,
+                'ledger': self.ledger,
+                'next_ledger_id': self.next_ledger_id,
+                'ledger_totals': self.ledger_totals,
+                'checkpoints': self.checkpoints,
+                'reconciled_id': self.reconciled_id,
+            })
+
+    def _load_snapshot(self) -> None:
+        if not os.path.exists(self.db_path):
+            return
+        try:
+            with open(self.db_path, 'rb') as fp:
+                state = marshal.load(fp)
+        except (EOFError, ValueError, TypeError, OSError) as e:
+            raise RuntimeError(f"内存存储快照 {self.db_path} 无法读取: {e}") from e
+        if state.get('version') != SNAPSHOT_VERSION:
+            raise RuntimeError(f"内存存储快照版本不符: {state.get('version')}")
+        for key in ('users', 'fish_config', 'catalog_digest', 'ponds', 'baits', 'check_in_bits', 'orders',
+                    'next_order_id', 'fill_count', 'stats', 'awards', 'species', 'profiles', 'ledger',
+                    'next_ledger_id', 'ledger_totals', 'checkpoints', 'reconciled_id'):
+            setattr(self, key, state[key])
+        # 早期快照的禁售期作用于整行，仍在禁售期内的整行数量记为禁售数量
+        now = int(time.time())
+        for pond in self.ponds.values():
+            for entry in pond.values():
+                if len(entry) == 2:
+                    entry.append(entry[QUANTITY] if (entry[NO_SELL_UNTIL] or 0) > now else 0)
+        # 早期快照没有卖单托管的重量记录
+        self.escrow = state.get('escrow', {})
+        self.catch_rows = state['catches']
+        self.catches = {user_id: {fish_id: CatchSet.from_row(row) for fish_id, row in user_catches.items()}
+                        for user_id, user_catches in self.catch_rows.items()}
+        self.LOG.info(f"已从快照恢复内存存储: {len(self.users)}个用户")
@@ -0,0 +1,271 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 延迟直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 自动钓鱼延迟直方图的桶上限(秒)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+# 标签为 ((名称, 值), ...) 元组，直接作为字典键
+Labels = Tuple[Tuple[str, str], ...]
+
+# 指标说明，写入Prometheus文本的 HELP 行
+HELP = {
+    'fishing_command_seconds': "命令耗时(含排队，也包括被准入控制拒绝的请求)",
+    'fishing_command_transactions_total': "命令执行期间的写事务数，后台任务计入 command=\"background\"",
+    'fishing_db_calls_total': "存储接口各方法的调用次数",
+    'fishing_db_seconds_total': "存储接口各方法的累计耗时",
+    'fishing_auto_tick_seconds': "一轮自动钓鱼调度的耗时",
+    'fishing_auto_tick_lag_seconds': "一轮自动钓鱼中最早到期的用户被处理时已推迟的时间",
+    'fishing_auto_tick_users_total': "自动钓鱼处理的到期用户数",
+    'fishing_cache_hits_total': "缓存命中次数",
+    'fishing_cache_misses_total': "缓存未命中次数",
+    'fishing_admission_admitted_total': "准入控制放行的命令数",
+    'fishing_admission_rejections_total': "准入控制拒绝的命令数",
+    'fishing_db_lock_wait_seconds_total': "写事务的累计等锁时间",
+    'fishing_db_lock_retries_total': "写事务的加锁重试次数",
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数，返回所在桶的上限，落在最后一个桶时返回最大桶上限"""
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts[:-1]):
+            seen += count
+            if seen >= target:
+                return self.buckets[index]
+        return self.buckets[-1]
+
+
+class Metrics:
+    """进程内指标: 计数器、延迟直方图，以及导出时才读取的外部统计
+
+    未启用时各处只检查 enabled，不包装存储接口、不计时；启用后定时把全部指标写成
+    Prometheus文本格式的文件(node_exporter textfile 或任何能读取文本指标的采集器)，
+    管理员也可以用 /钓鱼状态 查看摘要。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """初始化指标
+        Args:
+            config: 插件配置，指标配置位于 config['metrics']
+        """
+        metrics = (config or {}).get('metrics', {})
+        self.enabled = metrics.get('enabled', False)
+        self.dump_path = metrics.get('dump_path')
+        self.dump_interval = metrics.get('dump_interval', 60)
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.collectors: List[Callable[[], Iterable[Tuple[str, Labels, float]]]] = []
+        self.local = threading.local()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.LOG = logging.getLogger("FishingMetrics")
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float,
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, Labels, float]]]) -> None:
+        """注册导出时调用的统计函数，返回 (指标名, 标签, 值)，用于已有的缓存、准入和等锁统计"""
+        self.collectors.append(collector)
+
+    def current_command(self) -> str:
+        return getattr(self.local, 'command', None) or 'background'
+
+    def run_command(self, command: str, func: Callable, *args):
+        """在当前线程标记正在执行的命令后调用func，期间的写事务计入该命令"""
+        previous = getattr(self.local, 'command', None)
+        self.local.command = command
+        try:
+            return func(*args)
+        finally:
+            self.local.command = previous
+
+    def instrument_storage(self, db, shard: str, methods: Iterable[str]) -> None:
+        """包装存储实例的方法，统计调用次数、耗时和每条命令的写事务数，只在启用时调用"""
+        for name in methods:
+            method = getattr(db, name, None)
+            if callable(method):
+                setattr(db, name, self._timed_method(method, (('method', name), ('shard', shard))))
+
+        record = db.lock_stats.record
+
+        def record_transaction(op: str, wait: float, retries: int, failed: bool = False) -> None:
+            self.inc('fishing_command_transactions_total', (('command', self.current_command()),))
+            record(op, wait, retries, failed)
+        db.lock_stats.record = record_transaction
+
+    def _timed_method(self, method: Callable, labels: Labels) -> Callable:
+        @wraps(method)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.inc('fishing_db_calls_total', labels)
+                self.inc('fishing_db_seconds_total', labels, time.perf_counter() - started)
+        return timed
+
+    def collect(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], Histogram]]:
+        """当前全部计数器(含外部统计)和直方图的副本"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {}
+            for key, histogram in self.histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+                histograms[key] = copy
+        for collector in self.collectors:
+            try:
+                for name, labels, value in collector():
+                    counters[(name, labels)] = counters.get((name, labels), 0) + value
+            except Exception as e:
+                self.LOG.error(f"读取统计失败: {e}")
+        return counters, histograms
+
+    def render_prometheus(self) -> str:
+        """Prometheus文本格式"""
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> None:
+        """写入指标文件，先写临时文件再替换，采集器不会读到写了一半的文件"""
+        if not self.dump_path:
+            return
+        os.makedirs(os.path.dirname(self.dump_path) or '.', exist_ok=True)
+        temp_path = f"{self.dump_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, self.dump_path)
+
+    def start(self) -> None:
+        """启用且配置了文件路径时启动定时写文件线程"""
+        if not self.enabled or not self.dump_path or self.dump_interval <= 0:
+            return
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._dump_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(5)
+        if self.enabled:
+            try:
+                self.dump()
+            except OSError as e:
+                self.LOG.error(f"写入指标文件失败: {e}")
+
+    def _dump_loop(self) -> None:
+        while not self.stop_event.wait(self.dump_interval):
+            try:
+                self.dump()
+            except Exception as e:
+                self.LOG.error(f"写入指标文件失败: {e}")
+
+    def format_status(self) -> List[str]:
+        """/钓鱼状态 的指标部分: 各命令耗时分位、写事务数、最耗时的存储方法和自动钓鱼调度"""
+        counters, histograms = self.collect()
+        lines = []
+        commands = sorted(((dict(labels).get('command', ''), histogram)
+                           for (name, labels), histogram in histograms.items()
+                           if name == 'fishing_command_seconds'), key=lambda item: -item[1].count)
+        if commands:
+            lines.append("⏱️ 命令耗时(桶上限估算):")
+            for command, histogram in commands:
+                transactions = counters.get(('fishing_command_transactions_total', (('command', command),)), 0)
+                lines.append(f"  {command}: {histogram.count}次 平均{histogram.sum / histogram.count * 1000:.1f}ms "
+                             f"p50≤{histogram.quantile(0.5) * 1000:g}ms p99≤{histogram.quantile(0.99) * 1000:g}ms "
+                             f"写事务{transactions / histogram.count:.2f}/次")
+
+        methods: Dict[str, List[float]] = {}
+        for (name, labels), value in counters.items():
+            if name in ('fishing_db_calls_total', 'fishing_db_seconds_total'):
+                entry = methods.setdefault(dict(labels)['method'], [0, 0.0])
+                entry[0 if name == 'fishing_db_calls_total' else 1] += value
+        if methods:
+            lines.append("🗄️ 存储方法耗时前5:")
+            for method, (calls, seconds) in sorted(methods.items(), key=lambda item: -item[1][1])[:5]:
+                lines.append(f"  {method}: {calls:.0f}次 共{seconds * 1000:.0f}ms 平均{seconds / calls * 1000:.2f}ms")
+
+        ticks = [histogram for (name, _), histogram in histograms.items() if name == 'fishing_auto_tick_seconds']
+        lags = [histogram for (name, _), histogram in histograms.items() if name == 'fishing_auto_tick_lag_seconds']
+        if ticks:
+            count = sum(histogram.count for histogram in ticks)
+            total = sum(histogram.sum for histogram in ticks)
+            users = sum(value for (name, _), value in counters.items() if name == 'fishing_auto_tick_users_total')
+            lag = max(histogram.quantile(0.99) for histogram in lags) if lags else 0
+            lines.append(f"🤖 自动钓鱼: {count}轮 {users:.0f}人次 每轮平均{total / count * 1000:.1f}ms "
+                         f"延迟p99≤{lag:g}s")
+        return lines
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def cache_collector(name: str, stats: Callable[[], Dict]) -> Callable[[], List[Tuple[str, Labels, float]]]:
+    """把 get_stats() 返回的 hits/misses 转换为缓存命中指标"""
+    def collect() -> List[Tuple[str, Labels, float]]:
+        current = stats()
+        labels = (('cache', name),)
+        return [('fishing_cache_hits_total', labels, current['hits']),
+                ('fishing_cache_misses_total', labels, current['misses'])]
+    return collect
@@ -0,0 +1,123 @@
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 可选依赖，未安装时不支持拼音查找
+    lazy_pinyin = None
+
+# 前缀树每个节点保存的候选数量上限，超过后只提示前几个
+MAX_PREFIX_CANDIDATES = 16
+# 模糊匹配最多打分的候选数量
+MAX_FUZZY_CANDIDATES = 256
+
+
+def normalize(text: str) -> str:
+    """统一全角/半角和大小写，去掉空白"""
+    return ''.join(unicodedata.normalize('NFKC', text).lower().split())
+
+
+def ngrams(text: str) -> Set[str]:
+    """单字和字符二元组，短查询和错字较多时仍能靠单字匹配到候选"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class FishNameIndex:
+    """鱼名索引
+
+    构建时预先计算精确名称表、前缀树和单字/二元组倒排索引(安装了pypinyin时还有全拼和首字母)，
+    查询只需一次字典查找或一次前缀树遍历，模糊匹配只对共享二元组的候选打分，与图鉴大小基本无关。
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names: List[str] = []
+        self.keys: List[str] = []                 # 名称编号 -> 规范化名称
+        self.exact: Dict[str, List[int]] = {}     # 规范化名称/拼音 -> 名称编号，拼音首字母常有多个名称相同
+        self.trie: Dict[str, Dict] = {}           # 字符 -> 子节点，节点的 '' 键保存候选编号
+        self.grams: Dict[str, List[int]] = {}     # 单字/二元组 -> 名称编号
+        self.name_grams: List[Set[str]] = []
+        for name in names:
+            self._add(name)
+
+    def lookup(self, query: str, limit: int = 5) -> Tuple[Optional[str], List[str], bool]:
+        """查找鱼名
+        Returns:
+            (唯一匹配的名称, 候选名称, 是否有歧义)；
+            精确匹配或唯一前缀匹配时返回名称，否则名称为None，候选为同拼音、前缀匹配或相似的名称
+        """
+        key = normalize(query)
+        if not key:
+            return None, [], False
+        matches = self.exact.get(key)
+        if matches:
+            # 完整名称优先于其他鱼的拼音，例如 "jy" 同时是剑鱼和鲸鱼的首字母，只能列出候选
+            named = [index for index in matches if self.keys[index] == key]
+            if len(named) == 1 or len(matches) == 1:
+                return self.names[(named or matches)[0]], [], False
+            return None, [self.names[index] for index in matches[:limit]], True
+
+        prefixed = self._prefix(key)
+        if len(prefixed) == 1:
+            return self.names[prefixed[0]], [], False
+        if prefixed:
+            return None, [self.names[i] for i in prefixed[:limit]], True
+        return None, self._similar(key, limit), False
+
+    def _add(self, name: str) -> None:
+        index = len(self.names)
+        self.names.append(name)
+        key = normalize(name)
+        self.keys.append(key)
+        keys = [key]
+        if lazy_pinyin is not None:
+            syllables = lazy_pinyin(name)
+            keys.append(''.join(syllables))
+            keys.append(''.join(syllable[0] for syllable in syllables if syllable))
+        for k in dict.fromkeys(keys):
+            self.exact.setdefault(k, []).append(index)
+            self._insert_prefix(k, index)
+        grams = ngrams(key)
+        self.name_grams.append(grams)
+        for gram in grams:
+            self.grams.setdefault(gram, []).append(index)
+
+    def _insert_prefix(self, key: str, index: int) -> None:
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+            candidates = node.setdefault('', [])
+            if len(candidates) < MAX_PREFIX_CANDIDATES and index not in candidates:
+                candidates.append(index)
+
+    def _prefix(self, key: str) -> List[int]:
+        node = self.trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])
+
+    def _similar(self, key: str, limit: int) -> List[str]:
+        """按单字/二元组的Dice系数排序的相似名称
+
+        从最稀有的字/二元组开始收集候选，候选数达到上限后停止，
+        像"鱼"这样几乎每个名称都有的字不会让打分遍历整个图鉴。
+        """
+        query_grams = ngrams(key)
+        postings = sorted((self.grams.get(gram, ()) for gram in query_grams), key=len)
+        candidates: Set[int] = set()
+        for posting in postings:
+            if len(candidates) >= MAX_FUZZY_CANDIDATES:
+                break
+            for index in posting:
+                candidates.add(index)
+                if len(candidates) >= MAX_FUZZY_CANDIDATES:
+                    break
+        scored = []
+        for index in candidates:
+            name_grams = self.name_grams[index]
+            score = 2 * len(query_grams & name_grams) / (len(query_grams) + len(name_grams))
+            if score >= 0.3:
+                scored.append((score, index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.names[index] for _, index in scored[:limit]]
@@ -0,0 +1,155 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class NicknameService:
+    """用户昵称服务
+
+    昵称缓存带过期时间和LRU淘汰，查不到的用户也会缓存一段较短的时间(负缓存)。
+    resolve_many 把所有未命中的用户合并为一次批量查询，渲染排行榜前调用一次即可。
+    从消息事件中观察到的昵称先写入缓存，变化的昵称攒批后再持久化。
+    """
+
+    def __init__(self, resolver: Callable[[List[str]], Dict[str, str]],
+                 saver: Optional[Callable[[List[Tuple[str, str]]], None]] = None,
+                 ttl: float = 3600, negative_ttl: float = 300, max_size: int = 10000,
+                 save_batch_size: int = 50, save_interval: float = 30):
+        """初始化昵称服务
+        Args:
+            resolver: 批量查询昵称的函数，参数为用户ID列表，返回 用户ID -> 昵称
+            saver: 批量保存观察到的昵称的函数，参数为 (用户ID, 昵称) 列表
+            ttl: 昵称缓存时间(秒)
+            negative_ttl: 查不到昵称时的缓存时间(秒)
+            max_size: 缓存的用户数量上限
+            save_batch_size: 累计多少个变化的昵称后保存
+            save_interval: 距离上次保存超过多少秒后保存
+        """
+        self.resolver = resolver
+        self.saver = saver
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.save_batch_size = save_batch_size
+        self.save_interval = save_interval
+        self.LOG = logging.getLogger("FishingNickname")
+
+        self.lock = threading.Lock()
+        self.cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()  # 用户ID -> (昵称, 过期时间)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.pending: Dict[str, str] = {}  # 待保存的昵称
+        self.last_save = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> str:
+        """同步获取昵称，未缓存时单独查询一次，查不到时返回用户ID"""
+        found, nickname = self._lookup(user_id)
+        if not found:
+            nickname = self._store(self._resolve([user_id]), [user_id]).get(user_id)
+        return nickname or user_id
+
+    async def resolve_many(self, user_ids: Iterable[str]) -> Dict[str, str]:
+        """批量获取昵称，所有未命中的用户只触发一次批量查询
+        Returns:
+            用户ID -> 昵称，查不到的用户返回用户ID
+        """
+        result: Dict[str, str] = {}
+        missing: List[str] = []
+        waiting: Dict[str, asyncio.Future] = {}
+        for user_id in dict.fromkeys(user_ids):
+            found, nickname = self._lookup(user_id)
+            if found:
+                result[user_id] = nickname or user_id
+            elif user_id in self.inflight:
+                waiting[user_id] = self.inflight[user_id]
+            else:
+                missing.append(user_id)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, self._resolve, missing)
+            for user_id in missing:
+                self.inflight[user_id] = future
+            try:
+                resolved = self._store(await future, missing)
+            finally:
+                for user_id in missing:
+                    self.inflight.pop(user_id, None)
+            for user_id in missing:
+                result[user_id] = resolved.get(user_id) or user_id
+
+        for user_id, future in waiting.items():
+            resolved = await asyncio.shield(future)
+            result[user_id] = resolved.get(user_id) or user_id
+        return result
+
+    def remember(self, user_id: str, nickname: Optional[str]) -> None:
+        """记录从消息事件中观察到的昵称"""
+        if not nickname:
+            return
+        with self.lock:
+            cached = self.cache.get(user_id)
+            self._put(user_id, nickname)
+            if cached is not None and cached[0] == nickname:
+                return
+            self.pending[user_id] = nickname
+            due = (len(self.pending) >= self.save_batch_size
+                   or time.monotonic() - self.last_save >= self.save_interval)
+        if due:
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self.flush)
+            except RuntimeError:
+                self.flush()
+
+    def flush(self) -> None:
+        """保存累计的昵称变化"""
+        with self.lock:
+            pending = list(self.pending.items())
+            self.pending.clear()
+            self.last_save = time.monotonic()
+        if pending and self.saver:
+            try:
+                self.saver(pending)
+            except Exception as e:
+                self.LOG.error(f"保存昵称失败: {e}")
+
+    def get_stats(self) -> Dict:
+        """缓存统计"""
+        with self.lock:
+            return {'size': len(self.cache), 'hits': self.hits, 'misses': self.misses}
+
+    def _lookup(self, user_id: str) -> Tuple[bool, Optional[str]]:
+        """查询缓存，返回 (是否命中, 昵称)"""
+        with self.lock:
+            entry = self.cache.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self.cache.move_to_end(user_id)
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def _resolve(self, user_ids: List[str]) -> Dict[str, str]:
+        try:
+            return self.resolver(user_ids)
+        except Exception as e:
+            self.LOG.error(f"批量获取昵称出错: {e}")
+            return {}
+
+    def _store(self, resolved: Dict[str, str], requested: Optional[List[str]] = None) -> Dict[str, str]:
+        """写入查询结果，查不到的用户写入负缓存"""
+        with self.lock:
+            for user_id in requested or resolved.keys():
+                self._put(user_id, resolved.get(user_id))
+        return resolved
+
+    def _put(self, user_id: str, nickname: Optional[str]) -> None:
+        ttl = self.ttl if nickname else self.negative_ttl
+        self.cache[user_id] = (nickname, time.monotonic() + ttl)
+        self.cache.move_to_end(user_id)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
@@ -0,0 +1,78 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+# 稀有度名称
+RARITY_NAMES = {1: "垃圾", 2: "普通", 3: "稀有", 4: "史诗", 5: "传说"}
+RARITY_BY_NAME = {name: rarity for rarity, name in RARITY_NAMES.items()}
+
+# 分页键: (稀有度, 基础价值, 鱼ID)，按降序排列
+PageKey = Tuple[int, int, int]
+
+
+class PageCursorCache:
+    """分页边界缓存
+
+    键集分页每一页从上一页最后一行的键之后开始查询。这里按 (用户, 视图) 缓存每一页的起始键，
+    翻到下一页直接复用；跳页时从最近的已知边界出发，只在索引上定位一次新的边界。
+    分页键只依赖鱼的稀有度、价值和ID，鱼塘内容变化后旧边界仍然有效，只是各页内容会有少量平移。
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[Hashable, Tuple[float, Dict[int, Optional[PageKey]]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_start(self, view: Hashable, page: int,
+                  seek: Callable[[Optional[PageKey], int], Optional[PageKey]]) -> Optional[PageKey]:
+        """获取第page页(从1开始)的起始键
+        Args:
+            view: 视图标识，例如 ('pond', user_id)
+            page: 页码
+            seek: seek(起始键, 页数) -> 从起始键之后跳过这些页，最后一行的键；行数不够时返回None
+        Returns:
+            起始键(第一页为None)；页码超出范围时抛出 IndexError
+        """
+        if page <= 1:
+            return None
+        with self.lock:
+            starts = self._starts(view)
+            known_page = max(p for p in starts if p <= page)
+            known_key = starts[known_page]
+            if known_page == page:
+                self.hits += 1
+                return known_key
+            self.misses += 1
+
+        # 从最近的已知边界跳到目标页，只需要在索引上定位一次
+        key = seek(known_key, page - known_page)
+        if key is None:
+            raise IndexError(page)
+        self.remember(view, page, key)
+        return key
+
+    def get_stats(self) -> Dict:
+        """缓存统计，只统计第2页及以后"""
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+    def remember(self, view: Hashable, page: int, start: Optional[PageKey]) -> None:
+        """记录第page页的起始键"""
+        with self.lock:
+            self._starts(view)[page] = start
+
+    def _starts(self, view: Hashable) -> Dict[int, Optional[PageKey]]:
+        """视图的 页码 -> 起始键，过期后重新开始"""
+        now = time.time()
+        entry = self.entries.get(view)
+        if entry is None or now - entry[0] > self.ttl:
+            entry = self.entries[view] = (now, {1: None})
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(view)
+        return entry[1]
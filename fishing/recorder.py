@@ -0,0 +1,127 @@
+import os
+import hmac
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class TrafficRecorder:
+    """记录命令流量，供离线回放重现线上的命令组合和峰值
+
+    每条命令一行: 时间戳、匿名用户、命令、参数，以制表符分隔。
+    用户ID用保存在日志旁 .salt 文件中的密钥做HMAC后截断，同一用户在各个文件中的匿名ID相同；
+    回放时持有密钥可以把匿名ID对应回数据库副本中的用户，没有密钥则全部视为新用户。
+    文件超过 max_bytes 后像日志一样轮转为 .1、.2 ...，最多保留 backups 个旧文件。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 8 * 1024 * 1024, backups: int = 5):
+        """初始化记录器
+        Args:
+            path: 记录文件路径
+            max_bytes: 单个文件的大小上限
+            backups: 保留的轮转文件数量
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.LOG = logging.getLogger("TrafficRecorder")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.salt = load_salt(path, create=True)
+        self.file = open(path, 'a', encoding='utf-8', buffering=64 * 1024)
+        self.size = self.file.tell()
+        self.recorded = 0
+
+    def anonymize(self, user_id: str) -> str:
+        return anonymize(self.salt, user_id)
+
+    def record(self, user_id: str, message: str) -> None:
+        """记录一条命令，message为消息文本(命令名和参数)"""
+        parts = message.split(None, 1)
+        if not parts:
+            return
+        command = parts[0].lstrip('/')
+        args = ' '.join(parts[1].split()) if len(parts) > 1 else ''
+        line = f"{time.time():.3f}\t{self.anonymize(user_id)}\t{command}\t{args}\n"
+        with self.lock:
+            if self.file is None:
+                return
+            try:
+                self.file.write(line)
+                self.size += len(line.encode('utf-8'))
+                self.recorded += 1
+                if self.size >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                self.LOG.error(f"写入命令记录失败: {e}")
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _rotate(self) -> None:
+        """当前文件改名为 .1，已有的旧文件依次后移，超出数量的删除"""
+        self.file.close()
+        for index in range(self.backups, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if self.backups <= 0:
+            os.remove(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8', buffering=64 * 1024)
+        self.size = 0
+
+
+def anonymize(salt: bytes, user_id: str) -> str:
+    return hmac.new(salt, user_id.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def load_salt(path: str, create: bool = False) -> Optional[bytes]:
+    """读取记录文件旁的匿名化密钥，create为True时不存在则生成"""
+    salt_path = f"{path}.salt"
+    try:
+        with open(salt_path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        if not create:
+            return None
+    salt = os.urandom(32)
+    with open(salt_path, 'wb') as f:
+        f.write(salt)
+    return salt
+
+
+def recorded_files(path: str) -> List[str]:
+    """记录文件及其轮转文件，按时间从旧到新排列"""
+    rotated = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated.append(f"{path}.{index}")
+        index += 1
+    files = rotated[::-1]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_records(path: str) -> Iterator[Tuple[float, str, str, str]]:
+    """按时间顺序逐行读取 (时间戳, 匿名用户, 命令, 参数)，跳过损坏的行"""
+    for file_path in recorded_files(path):
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 4:
+                    continue
+                try:
+                    yield float(fields[0]), fields[1], fields[2], fields[3]
+                except ValueError:
+                    continue
+
+
+def deanonymize_map(salt: bytes, user_ids: List[str]) -> Dict[str, str]:
+    """匿名ID -> 用户ID，用于把记录中的用户对应回数据库副本"""
+    return {anonymize(salt, user_id): user_id for user_id in user_ids}
@@ -0,0 +1,139 @@
+import os
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+# 每次哈希产生的均匀随机数个数(64字节摘要 = 8个uint64)
+BLOCK_SIZE = 8
+_BLOCK = struct.Struct('<8Q')
+_SCALE = 2.0 ** -53
+# 被淘汰后重新创建的流从 淘汰次数 << EVICTION_SHIFT 块开始，每一代最多使用 2**24 块，互不重叠
+EVICTION_SHIFT = 24
+
+
+class RandomStream:
+    """一条独立的随机数流
+
+    第n块随机数由 blake2b(种子, 流名, n) 生成，流的全部状态只是一个计数器：
+    同样的种子和流名总是产生同样的序列，不同流之间互不影响，
+    一次哈希得到8个均匀随机数，多次抽取时可以一次取出N个，不必调用N次。
+    """
+
+    __slots__ = ('key', 'counter', 'buffer', 'position', 'lock')
+
+    def __init__(self, key: bytes, counter: int = 0):
+        self.key = key
+        self.counter = counter
+        self.buffer: List[float] = []
+        self.position = 0  # buffer中下一个未使用的随机数
+        self.lock = threading.Lock()
+
+    def _block(self, index: int) -> List[float]:
+        digest = hashlib.blake2b(index.to_bytes(8, 'little'), key=self.key).digest()
+        return [(value >> 11) * _SCALE for value in _BLOCK.unpack(digest)]
+
+    def uniforms(self, n: int) -> List[float]:
+        """一次取出n个 [0, 1) 的均匀随机数"""
+        with self.lock:
+            end = self.position + n
+            if end > len(self.buffer):
+                buffer = self.buffer[self.position:]
+                while len(buffer) < n:
+                    buffer.extend(self._block(self.counter))
+                    self.counter += 1
+                self.buffer, self.position, end = buffer, 0, n
+            values = self.buffer[self.position:end]
+            self.position = end
+        return values
+
+    def random(self) -> float:
+        return self.uniforms(1)[0]
+
+    def uniform(self, a: float, b: float, u: Optional[float] = None) -> float:
+        """[a, b) 的均匀随机数，u为预先取出的均匀随机数"""
+        return a + (b - a) * (self.random() if u is None else u)
+
+    def randint(self, a: int, b: int, u: Optional[float] = None) -> int:
+        """[a, b] 的随机整数"""
+        return a + int((b - a + 1) * (self.random() if u is None else u))
+
+    def choice(self, seq: Sequence, u: Optional[float] = None):
+        return seq[int(len(seq) * (self.random() if u is None else u))]
+
+
+class RandomStreams:
+    """按用户或分片发放独立、可设定种子的随机数流
+
+    不使用全局 random 模块：其他插件共用全局状态，钓鱼结果无法复现。
+    设定 config['rng']['seed'] 后，同一用户的钓鱼、签到、偷鱼结果在压测和回放中可以完全复现；
+    未设定时每次启动随机生成种子。
+
+    用户流最多保留 max_streams 条，超出时淘汰最久未使用的。淘汰后重新创建的流从更靠后的块开始，
+    同一次运行中不会重复已经用过的随机数。设定种子时每次启动递增数据库旁 .rng 文件中的启动序号并混入流名，
+    重启后不会重放上一次运行的序列；在新目录中运行的压测和回放序号从0开始，结果仍可复现。
+    """
+
+    def __init__(self, config: Optional[Dict] = None, namespace: str = ''):
+        """初始化随机数服务
+        Args:
+            config: 插件配置，随机数配置位于 config['rng']
+            namespace: 命名空间，不同分片使用各自的数据库名，相同用户在不同分片中的流互相独立
+        """
+        rng = (config or {}).get('rng', {})
+        seed = rng.get('seed')
+        self.seed = os.urandom(16) if seed is None else str(seed).encode()
+        self.scope = rng.get('scope', 'user')  # user: 每个用户一条流；shard: 整个分片共用一条流
+        self.max_streams = max(1, rng.get('max_streams', 10000))
+        self.namespace = namespace
+        self.LOG = logging.getLogger("RandomStreams")
+        self.epoch = 0
+        if seed is not None and (config or {}).get('database'):
+            self.epoch = self._next_epoch(os.path.splitext(config['database'])[0] + '.rng')
+        self.streams: 'OrderedDict[Optional[str], RandomStream]' = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _next_epoch(self, path: str) -> int:
+        """读取并递增启动序号，文件不存在时为0，无法写入时沿用读到的序号"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                epoch = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            epoch = 0
+        except (OSError, ValueError) as e:
+            self.LOG.warning(f"随机数启动序号 {path} 无法读取，从0开始: {e}")
+            epoch = 0
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(str(epoch + 1))
+        except OSError as e:
+            self.LOG.warning(f"随机数启动序号 {path} 无法写入，下次启动会重放本次的序列: {e}")
+        return epoch
+
+    def stream(self, user_id: Optional[str] = None) -> RandomStream:
+        """获取用户的随机数流，user_id为None时返回分片的公共流(天气等)"""
+        key = user_id if self.scope == 'user' else None
+        stream = self.streams.get(key)
+        if stream is not None:
+            # OrderedDict的单次操作在GIL下是原子的，命中时不加锁；期间被淘汰的流仍可继续使用
+            try:
+                self.streams.move_to_end(key)
+            except KeyError:
+                pass
+            return stream
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is not None:
+                return stream
+            name = f"{self.namespace}\0{'' if key is None else key}"
+            if self.epoch:
+                name += f"\0{self.epoch}"
+            digest = hashlib.blake2b(name.encode(), key=self.seed[:64], digest_size=32).digest()
+            stream = self.streams[key] = RandomStream(digest, self.evictions << EVICTION_SHIFT)
+            if len(self.streams) > self.max_streams:
+                self.streams.popitem(last=False)
+                self.evictions += 1
+        return stream
@@ -0,0 +1,67 @@
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class AutoFishingScheduler:
+    """自动钓鱼调度堆
+
+    按下一次自动钓鱼的时间维护小顶堆，调度线程只处理到期的用户，
+    不再每分钟扫描全部开启自动钓鱼的用户。
+    重新调度或取消时不从堆中删除旧条目，弹出时与 due 字典比对后丢弃过期条目。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap: List[Tuple[float, str]] = []
+        self.due: Dict[str, float] = {}  # 用户ID -> 当前有效的到期时间
+
+    def __len__(self) -> int:
+        return len(self.due)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self.due
+
+    def schedule(self, user_id: str, due_time: float) -> None:
+        """设置用户下一次自动钓鱼的时间"""
+        with self.lock:
+            self.due[user_id] = due_time
+            heapq.heappush(self.heap, (due_time, user_id))
+            self._compact()
+
+    def cancel(self, user_id: str) -> None:
+        """取消用户的自动钓鱼"""
+        with self.lock:
+            self.due.pop(user_id, None)
+
+    def next_due(self) -> Optional[float]:
+        """最早的到期时间，没有任何调度时返回None"""
+        with self.lock:
+            self._discard_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> List[str]:
+        """取出所有已到期的用户，取出后需要调用方重新调度"""
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due_time, user_id = heapq.heappop(self.heap)
+                if self.due.get(user_id) == due_time:
+                    del self.due[user_id]
+                    expired.append(user_id)
+        return expired
+
+    def entries(self) -> List[Tuple[float, str]]:
+        """导出当前有效的调度，用于快照"""
+        with self.lock:
+            return [(due_time, user_id) for user_id, due_time in self.due.items()]
+
+    def _discard_stale(self) -> None:
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def _compact(self) -> None:
+        """过期条目过多时重建堆"""
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.heap = [(due_time, user_id) for user_id, due_time in self.due.items()]
+            heapq.heapify(self.heap)
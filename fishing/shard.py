@@ -0,0 +1,241 @@
+import os
+import re
+import heapq
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .fishing import FishingSystem
+from .metrics import Metrics
+from .slow_profiler import SlowCommandProfiler
+from .storage import storage_path
+from .paging import RARITY_NAMES
+
+
+class ShardRouter:
+    """数据库分片路由
+
+    按平台或群组把用户路由到独立的数据库文件，每个分片拥有独立的
+    存储引擎和自动钓鱼线程，写入锁互不影响。未开启分片时所有请求都落在默认分片。
+    """
+
+    DEFAULT_SHARD = 'default'
+
+    def __init__(self, config: Dict, get_nickname_func, metrics: Optional[Metrics] = None,
+                 profiler: Optional[SlowCommandProfiler] = None):
+        """初始化分片路由
+        Args:
+            config: 插件配置，分片配置位于 config['sharding']
+            get_nickname_func: 获取用户昵称的函数
+            metrics: 各分片共用的指标
+            profiler: 各分片共用的慢命令剖析
+        """
+        self.config = config
+        self.get_nickname = get_nickname_func
+        self.metrics = metrics
+        self.profiler = profiler
+        self.LOG = logging.getLogger("FishingShard")
+
+        sharding = config.get('sharding', {})
+        self.enabled = sharding.get('enabled', False)
+        self.mode = sharding.get('mode', 'platform')  # platform: 按平台分片; group: 按群组分片
+        if self.mode not in ('platform', 'group'):
+            self.LOG.warning(f"未知的分片模式 {self.mode}，已回退为按平台分片")
+            self.mode = 'platform'
+
+        self.systems: Dict[str, FishingSystem] = {}
+        self.lock = threading.Lock()
+
+        # 默认分片使用原数据库文件，保证未开启分片时行为不变
+        self.default = FishingSystem(config, get_nickname_func, metrics, profiler)
+        self.systems[self.DEFAULT_SHARD] = self.default
+
+        # 恢复已存在的分片，使其自动钓鱼任务在重启后继续运行
+        if self.enabled:
+            for shard_key in self._discover_shards():
+                self.get_system(shard_key)
+            self.LOG.info(f"分片模式已启用({self.mode})，当前分片数: {len(self.systems)}")
+
+    def shard_key(self, platform: Optional[str], group_id: Optional[str] = None) -> str:
+        """根据平台和群组计算分片键"""
+        if not self.enabled:
+            return self.DEFAULT_SHARD
+
+        platform = platform or 'unknown'
+        if self.mode == 'group':
+            # 私聊消息统一落在该平台的private分片
+            return f"{platform}_{group_id}" if group_id else f"{platform}_private"
+        return platform
+
+    def get_system(self, shard_key: Optional[str]) -> FishingSystem:
+        """获取分片对应的钓鱼系统，不存在时创建"""
+        if not self.enabled or not shard_key:
+            return self.default
+
+        shard_key = self._sanitize(shard_key)
+        system = self.systems.get(shard_key)
+        if system is not None:
+            return system
+
+        with self.lock:
+            system = self.systems.get(shard_key)
+            if system is None:
+                shard_config = dict(self.config)
+                shard_config['database'] = self._shard_path(shard_key)
+                system = FishingSystem(shard_config, self.get_nickname, self.metrics, self.profiler)
+                self.systems[shard_key] = system
+                self.LOG.info(f"已创建数据库分片: {shard_key}")
+        return system
+
+    def all_systems(self) -> List[Tuple[str, FishingSystem]]:
+        """获取所有分片"""
+        with self.lock:
+            return list(self.systems.items())
+
+    def get_global_coin_ranking(self, limit: int = 10) -> List[Dict]:
+        """跨分片的金币排行榜，每个分片只取前limit名后归并"""
+        entries = []
+        for shard_key, system in self.all_systems():
+            for row in system.get_top_users(limit):
+                entries.append(dict(row, shard=shard_key))
+        return heapq.nlargest(limit, entries, key=lambda row: row['coins'])
+
+    def show_global_ranking(self, limit: int = 10) -> str:
+        """显示全服金币排行榜"""
+        return self.format_ranking(self.get_global_coin_ranking(limit))
+
+    def format_ranking(self, ranking: List[Dict]) -> str:
+        """渲染排行榜，昵称应提前批量解析到缓存中"""
+        if not ranking:
+            return "🏆 暂无排行数据，快去钓鱼吧！"
+
+        result = ["🏆 全服金币排行榜"]
+        result.append("-" * 20)
+        for index, row in enumerate(ranking, 1):
+            shard_info = f" [{row['shard']}]" if self.enabled else ""
+            result.append(f"{index}. {self.get_nickname(row['user_id'])}{shard_info} 💰{row['coins']}金币")
+        return "\n".join(result)
+
+    def backup_all(self) -> str:
+        """立即备份所有分片"""
+        result = ["💾 数据库备份"]
+        result.append("-" * 20)
+        for shard_key, system in self.all_systems():
+            try:
+                backup = system.backup.backup_now()
+                result.append(f"• {shard_key}: {backup['pages']}页/{backup['steps']}批，"
+                              f"耗时{backup['duration']:.2f}秒")
+                result.append(f"  {os.path.basename(backup['path'])}")
+            except Exception as e:
+                self.LOG.error(f"分片 {shard_key} 备份失败: {e}", exc_info=True)
+                result.append(f"• {shard_key}: ❌ 备份失败: {e}")
+        return "\n".join(result)
+
+    def reconcile_all(self) -> str:
+        """立即对所有分片执行金币对账"""
+        result = ["📒 金币对账"]
+        result.append("-" * 20)
+        for shard_key, system in self.all_systems():
+            try:
+                summary = system.ledger.reconcile()
+                result.append(f"• {shard_key}: 核对{summary['users']}个用户，"
+                              f"不一致{len(summary['mismatches'])}个，耗时{summary['duration']:.2f}秒")
+                for user_id, delta in summary['mismatches'][:5]:
+                    result.append(f"  ⚠️ {self.get_nickname(user_id)} 调整{delta:+d}金币")
+            except Exception as e:
+                self.LOG.error(f"分片 {shard_key} 对账失败: {e}", exc_info=True)
+                result.append(f"• {shard_key}: ❌ 对账失败: {e}")
+        return "\n".join(result)
+
+    def economy_report(self, rebuild: bool = False) -> str:
+        """全服经济概况，读取各分片由触发器维护的统计；rebuild为True时先扫描全表重建并报告偏差"""
+        result = ["💹 经济概况"]
+        result.append("-" * 20)
+        totals = {'users': 0, 'coins': 0, 'auto_fishers': 0}
+        fish: Dict[int, List[int]] = {}  # 鱼ID -> [总数, 持有人数]
+        for shard_key, system in self.all_systems():
+            try:
+                if rebuild:
+                    before = system.db.get_global_stats()
+                    stats = system.db.rebuild_global_stats()
+                    drift = _stats_drift(before, stats)
+                    result.append(f"• {shard_key}: 已重建，" + ("、".join(drift) if drift else "与维护的统计一致"))
+                else:
+                    stats = system.db.get_global_stats()
+            except Exception as e:
+                self.LOG.error(f"分片 {shard_key} 读取全服统计失败: {e}", exc_info=True)
+                result.append(f"• {shard_key}: ❌ 读取统计失败: {e}")
+                continue
+            for key in totals:
+                totals[key] += stats[key]
+            for fish_id, entry in stats['fish'].items():
+                total = fish.setdefault(fish_id, [0, 0])
+                total[0] += entry['quantity']
+                total[1] += entry['holders']
+        
+        users = totals['users']
+        result.append(f"👥 玩家{users}人，自动钓鱼{totals['auto_fishers']}人")
+        result.append(f"💰 流通金币{totals['coins']}，人均{totals['coins'] // users if users else 0}")
+        
+        species = self.default.catalog.by_id
+        by_rarity: Dict[int, List[int]] = {}  # 稀有度 -> [条数, 种类数, 基础估值]
+        for fish_id, (quantity, _) in fish.items():
+            info = species.get(fish_id)
+            if info is None or quantity <= 0:
+                continue
+            total = by_rarity.setdefault(info['rarity'], [0, 0, 0])
+            total[0] += quantity
+            total[1] += 1
+            total[2] += quantity * info['base_value']
+        if not by_rarity:
+            result.append("🐟 鱼塘里还没有鱼")
+            return "\n".join(result)
+        result.append(f"🐟 鱼塘存量{sum(total[0] for total in by_rarity.values())}条，"
+                      f"基础估值{sum(total[2] for total in by_rarity.values())}金币")
+        for rarity in sorted(by_rarity, reverse=True):
+            quantity, kinds, value = by_rarity[rarity]
+            result.append(f"  {RARITY_NAMES.get(rarity, rarity)}: {quantity}条 {kinds}种 估值{value}")
+        top = heapq.nlargest(5, ((quantity, holders, fish_id) for fish_id, (quantity, holders) in fish.items()
+                                 if fish_id in species))
+        result.append("🏅 存量最多的鱼:")
+        for quantity, holders, fish_id in top:
+            result.append(f"  {species[fish_id]['name']}: {quantity}条，{holders}人持有")
+        return "\n".join(result)
+    
+    def _shard_path(self, shard_key: str) -> str:
+        """分片数据库文件路径，例如 data/fishing.db -> data/fishing_qqofficial.db"""
+        base, ext = os.path.splitext(self.config['database'])
+        return f"{base}_{shard_key}{ext or '.db'}"
+
+    def _discover_shards(self) -> List[str]:
+        """扫描数据目录中已存在的分片文件(内存引擎为分片的快照文件)"""
+        base, _ = os.path.splitext(self.config['database'])
+        ext = os.path.splitext(storage_path(self.config))[1] or '.db'
+        db_dir = os.path.dirname(base) or '.'
+        prefix = os.path.basename(base) + '_'
+        if not os.path.isdir(db_dir):
+            return []
+
+        shard_keys = []
+        for filename in sorted(os.listdir(db_dir)):
+            if filename.startswith(prefix) and filename.endswith(ext):
+                shard_key = filename[len(prefix):-len(ext)]
+                if shard_key and shard_key != self.DEFAULT_SHARD:
+                    shard_keys.append(shard_key)
+        return shard_keys
+
+    @staticmethod
+    def _sanitize(shard_key: str) -> str:
+        """将分片键转换为安全的文件名片段"""
+        return re.sub(r'[^\w\-]', '_', str(shard_key))
+
+
+def _stats_drift(before: Dict, after: Dict) -> List[str]:
+    """重建前后全服统计的差异"""
+    names = {'users': '玩家', 'coins': '金币', 'auto_fishers': '自动钓鱼'}
+    drift = [f"{name}{after[key] - before[key]:+d}" for key, name in names.items() if after[key] != before[key]]
+    changed = sum(1 for fish_id in set(before['fish']) | set(after['fish'])
+                  if before['fish'].get(fish_id) != after['fish'].get(fish_id))
+    if changed:
+        drift.append(f"{changed}种鱼的数量有偏差")
+    return drift
@@ -0,0 +1,213 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 每个栈最多保留的帧数(从栈顶算起)
+MAX_DEPTH = 64
+
+_UNSAFE = re.compile(r'[^\w\-]')
+
+Frame = Tuple[str, str, int]  # (文件, 函数, 行号)
+
+
+class _Capture:
+    """一次命令或自动钓鱼调度执行期间的栈采样"""
+
+    __slots__ = ('command', 'users', 'concurrent', 'started', 'memory', 'samples', 'count')
+
+    def __init__(self, command: str, users: int, concurrent: int):
+        self.command = command
+        self.users = users
+        self.concurrent = concurrent
+        self.started = time.time()
+        self.memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.samples: Counter = Counter()  # 从栈底到栈顶的帧元组 -> 次数
+        self.count = 0
+
+
+class SlowCommandProfiler:
+    """低频栈采样，命令或一轮自动钓鱼超过阈值时把执行期间的采样写入 data/ 下的文件
+
+    慢命令无法提前预知，对每条命令运行cProfile的开销又太大，所以只在命令执行期间登记所在线程，
+    后台线程每隔 interval 秒用 sys._current_frames() 采集这些线程的调用栈；命令结束时超过阈值
+    才写出采样，否则直接丢弃。同一时刻没有命令在执行时采样线程不做任何事。
+    只有在线程池或调度线程中执行的同步函数会被采样，协程命令与事件循环上的其他任务无法区分。
+    文件保留最近 keep 份，开启 tracemalloc 时附带执行前后的内存变化和当前占用最多的代码行。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """初始化慢命令剖析
+        Args:
+            config: 插件配置，剖析配置位于 config['slow_profiler']
+        """
+        profiler = (config or {}).get('slow_profiler', {})
+        self.enabled = profiler.get('enabled', False)
+        self.threshold = profiler.get('threshold', 1.0)
+        self.interval = profiler.get('interval', 0.02)
+        self.directory = profiler.get('directory', os.path.join('data', 'slow_profiles'))
+        self.keep = profiler.get('keep', 20)
+        self.max_samples = profiler.get('max_samples', 5000)
+        self.trace_memory = profiler.get('tracemalloc', False)
+        self.lock = threading.Lock()
+        self.active: Dict[int, _Capture] = {}  # 线程ID -> 正在执行的命令
+        self.saved = 0
+        self.last_saved: Optional[str] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.LOG = logging.getLogger("SlowProfiler")
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(5)
+
+    def run(self, command: str, func: Callable, *args, users: int = 1):
+        """在当前线程执行func，期间采样调用栈，超过阈值时保存
+        Args:
+            command: 命令名，写入文件名和文件头
+            func: 同步函数
+            users: 本次处理的用户数，自动钓鱼为这一轮到期的用户数
+        """
+        if not self.enabled:
+            return func(*args)
+        ident = threading.get_ident()
+        with self.lock:
+            previous = self.active.get(ident)
+            capture = self.active[ident] = _Capture(command, users, len(self.active))
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                if previous is None:
+                    self.active.pop(ident, None)
+                else:
+                    self.active[ident] = previous
+            if elapsed >= self.threshold:
+                try:
+                    self._save(capture, elapsed)
+                except OSError as e:
+                    self.LOG.error(f"保存慢命令采样失败: {e}")
+
+    def _sample_loop(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident, capture in active:
+                frame = frames.get(ident)
+                if frame is not None and capture.count < self.max_samples:
+                    stacks.append((capture, _stack(frame)))
+            frame = None
+            del frames
+            # 命令结束时会在另一个线程中读取采样，计数在锁内更新
+            with self.lock:
+                for capture, stack in stacks:
+                    if capture.count < self.max_samples:
+                        capture.samples[stack] += 1
+                        capture.count += 1
+
+    def _save(self, capture: _Capture, elapsed: float) -> None:
+        """写出采样并删除超出数量的旧文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(capture.started))
+        with self.lock:
+            self.saved += 1
+            sequence = self.saved
+            samples, count = Counter(capture.samples), capture.count
+        path = os.path.join(self.directory,
+                            f"{stamp}-{sequence:04d}-{_UNSAFE.sub('_', capture.command)}-{elapsed * 1000:.0f}ms.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(self._report(capture, elapsed, samples, count)) + "\n")
+        self.last_saved = path
+        self.LOG.warning(f"慢命令 {capture.command} 耗时{elapsed:.2f}s，采样已保存到 {path}")
+        self._prune()
+
+    def _report(self, capture: _Capture, elapsed: float, samples: Counter, count: int) -> List[str]:
+        """文件头、栈顶函数排行和折叠栈，折叠栈以外的行都以#开头
+        Args:
+            samples: 在锁内取出的采样副本
+            count: 同时取出的采样次数
+        """
+        lines = [
+            f"# 命令: {capture.command}",
+            f"# 开始: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(capture.started))}",
+            f"# 耗时: {elapsed:.3f}s (阈值{self.threshold:g}s)",
+            f"# 用户数: {capture.users}，开始时其他执行中的命令: {capture.concurrent}",
+            f"# 采样: {count}次，间隔{self.interval * 1000:g}ms",
+        ]
+        if capture.memory is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"# 内存: 执行期间变化{(current - capture.memory) / 1024:+.0f}KB，"
+                         f"当前{current / 1024 / 1024:.1f}MB，峰值{peak / 1024 / 1024:.1f}MB(含并发执行的命令)")
+            lines.append("# 当前占用内存最多的代码行:")
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:10]:
+                frame = stat.traceback[0]
+                lines.append(f"#   {stat.size / 1024:.0f}KB {stat.count}块 {_short_path(frame.filename)}:{frame.lineno}")
+
+        leaves: Counter = Counter()
+        for stack, hits in samples.items():
+            if stack:
+                leaves[stack[-1]] += hits
+        if leaves:
+            lines.append("# 栈顶函数(自身耗时):")
+            for (filename, name, lineno), hits in leaves.most_common(15):
+                lines.append(f"#   {hits / count:6.1%} {hits:>5} {name} ({filename}:{lineno})")
+        lines.append("# 折叠栈，去掉#开头的行后可用 flamegraph.pl 或 speedscope 查看:")
+        for stack, hits in samples.most_common():
+            lines.append(";".join(f"{name} ({filename}:{lineno})" for filename, name, lineno in stack) + f" {hits}")
+        return lines
+
+    def _prune(self) -> None:
+        files = sorted((entry for entry in os.scandir(self.directory)
+                        if entry.is_file() and entry.name.endswith('.txt')),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:max(len(files) - self.keep, 0)]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                self.LOG.warning(f"删除旧采样 {entry.name} 失败: {e}")
+
+    def format_status(self) -> str:
+        """/钓鱼状态 中的一行"""
+        if not self.enabled:
+            return "💡 开启 slow_profiler.enabled 后超过阈值的命令会保存调用栈采样"
+        latest = f"，最近 {os.path.basename(self.last_saved)}" if self.last_saved else ""
+        return f"🐢 慢命令采样: 阈值{self.threshold:g}s，本次运行已保存{self.saved}份{latest}"
+
+
+def _short_path(filename: str) -> str:
+    """只保留最后两级路径"""
+    parts = filename.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append((_short_path(code.co_filename), code.co_name, frame.f_lineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
@@ -0,0 +1,214 @@
+import re
+import time
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+_BLOB = re.compile(r"\b[xX]'[0-9a-fA-F]*'")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+# 会触发触发器的写语句
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# 语句种类超过上限后，新出现的语句合并计入这一项
+OTHER_SHAPE = '(其他语句)'
+
+
+@lru_cache(maxsize=4096)
+def normalize(sql: str) -> str:
+    """把语句中的字面量替换为 ?、IN 列表合并为 (?...)、空白合并为一个空格，得到语句形状
+
+    SQLite的trace回调收到的是代入参数后的语句，同一条语句不同参数的执行归为同一形状。
+    """
+    shape = _BLOB.sub('?', sql)
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def is_trigger_trace(previous: Optional[str], sql: str) -> bool:
+    """判断trace回调是否来自正在执行的写语句中的触发器
+
+    SQLite在每个触发器子程序开始时也会调用trace回调，Python传入的是外层语句的文本，
+    因此紧接着重复出现的同一条写语句视为触发器，不计为一次新的执行。重复的查询语句照常计数。
+
+    已知偏差: 回调中拿不到触发器子程序的 "-- 触发器名" 文本(Python使用 sqlite3_trace_v2，
+    只传入外层语句代入参数后的文本)，无法与外层语句的下一次执行区分。executemany 中参数完全相同的
+    相邻几行、或连续两次参数相同的同一条写语句，会合并计为一次执行，耗时和写入行数仍全部计入。
+    """
+    return sql == previous and sql.lstrip()[:7].upper().startswith(_WRITE_PREFIXES)
+
+
+class SqlProfiler:
+    """按语句形状统计SQLite语句的执行次数、耗时、虚拟机步数和写入行数
+
+    启用时在每个连接上安装trace回调(语句开始执行)和progress回调(每执行 progress_steps 条虚拟机指令)。
+    一条语句的耗时为从开始执行到最后一次progress回调，不包括语句之间Python代码的时间，
+    也不包括提交时写盘这类在单条指令内完成的工作(写事务的耗时见 /钓鱼状态 的写事务统计)；
+    不足 progress_steps 条指令的语句耗时记为0，只计次数。写入行数取连接 total_changes 的增量，
+    触发器执行的时间和写入的行都计入触发它的语句。
+    一条语句在同一连接执行下一条语句时才结算，统计最多滞后每个连接的最后一条语句。
+
+    运行中可以随时开启或关闭: 每次切换递增 generation，各线程的连接在下次使用时按它安装或移除回调。
+    """
+
+    def __init__(self, config: Optional[Dict] = None, shard: str = ''):
+        """初始化语句统计
+        Args:
+            config: 插件配置，语句统计配置位于 config['sql_profiler']
+            shard: 分片名，写入慢语句日志
+        """
+        profiler = (config or {}).get('sql_profiler', {})
+        self.enabled = profiler.get('enabled', False)
+        self.slow_ms = profiler.get('slow_ms', 50)
+        self.slow_log = profiler.get('slow_log')
+        self.progress_steps = max(1, profiler.get('progress_steps', 100))
+        self.max_shapes = profiler.get('max_shapes', 500)
+        self.shard = shard
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.shapes: Dict[str, Dict] = {}
+        self.slow_count = 0
+        self.LOG = logging.getLogger("SqlProfiler")
+
+    def set_enabled(self, enabled: bool) -> None:
+        """开启或关闭，已有连接在所属线程下次取用时生效"""
+        with self.lock:
+            if self.enabled != enabled:
+                self.enabled = enabled
+                self.generation += 1
+
+    def sync(self, conn) -> None:
+        """按当前开关在连接上安装或移除回调，只能在使用该连接的线程中调用"""
+        if self.enabled:
+            trace = _ConnectionTrace(self, conn)
+            conn.set_trace_callback(trace.trace)
+            conn.set_progress_handler(trace.progress, self.progress_steps)
+        else:
+            conn.set_trace_callback(None)
+            conn.set_progress_handler(None, 0)
+
+    def record(self, sql: str, seconds: float, steps: int, rows: int) -> None:
+        """记录一条执行完的语句
+        Args:
+            sql: 代入参数后的语句
+            seconds: 执行耗时(秒)
+            steps: 虚拟机指令数(按progress回调次数估算)
+            rows: 写入行数
+        """
+        shape = normalize(sql)
+        slow = seconds * 1000 >= self.slow_ms
+        with self.lock:
+            stats = self.shapes.get(shape)
+            if stats is None:
+                if len(self.shapes) >= self.max_shapes:
+                    shape = OTHER_SHAPE
+                stats = self.shapes.setdefault(shape, {
+                    'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'steps': 0, 'rows': 0, 'slow': 0,
+                })
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['steps'] += steps
+            stats['rows'] += rows
+            if slow:
+                stats['slow'] += 1
+                self.slow_count += 1
+        if slow:
+            self._log_slow(normalize(sql), seconds, steps, rows)
+
+    def _log_slow(self, shape: str, seconds: float, steps: int, rows: int) -> None:
+        """慢语句写入日志文件(未配置时写入插件日志)
+
+        只写语句形状，代入的参数(用户ID、金币数等)替换为 ?，日志中不留玩家数据；EXPLAIN 时需要自行补上参数。
+        """
+        statement = shape[:2000]
+        if not self.slow_log:
+            self.LOG.warning(f"慢语句 {seconds * 1000:.1f}ms 步数{steps} 写入{rows}行 [{self.shard}]: {statement}")
+            return
+        line = (f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{self.shard}\t{seconds * 1000:.1f}ms\t"
+                f"{steps}\t{rows}\t{statement}\n")
+        try:
+            with self.lock, open(self.slow_log, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            self.LOG.error(f"写入慢语句日志失败: {e}")
+
+    def reset(self) -> None:
+        with self.lock:
+            self.shapes.clear()
+            self.slow_count = 0
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """当前统计的副本"""
+        with self.lock:
+            return {shape: dict(stats) for shape, stats in self.shapes.items()}
+
+    @staticmethod
+    def merge(snapshots: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+        """合并多个分片的统计"""
+        merged: Dict[str, Dict] = {}
+        for snapshot in snapshots:
+            for shape, stats in snapshot.items():
+                target = merged.get(shape)
+                if target is None:
+                    merged[shape] = dict(stats)
+                    continue
+                for key in ('count', 'seconds', 'steps', 'rows', 'slow'):
+                    target[key] += stats[key]
+                target['max_seconds'] = max(target['max_seconds'], stats['max_seconds'])
+        return merged
+
+    @staticmethod
+    def format(snapshot: Dict[str, Dict], limit: int = 10, width: int = 120) -> List[str]:
+        """按累计耗时排序，每种语句一行: 次数、累计/平均/最大耗时、平均步数、写入行数和语句形状"""
+        lines = []
+        ordered = sorted(snapshot.items(), key=lambda item: (-item[1]['seconds'], -item[1]['count']))
+        for shape, stats in ordered[:limit]:
+            count = stats['count']
+            # 长语句保留开头和结尾，同一查询的不同变体通常只在结尾的条件和排序上不同
+            text = shape if len(shape) <= width else f"{shape[:width // 2]} ... {shape[-(width // 2):]}"
+            lines.append(f"{count}次 共{stats['seconds'] * 1000:.1f}ms 平均{stats['seconds'] / count * 1000:.2f}ms "
+                         f"最大{stats['max_seconds'] * 1000:.1f}ms 步数{stats['steps'] / count:.0f}/次 "
+                         f"写入{stats['rows']}行" + (f" 慢{stats['slow']}" if stats['slow'] else ""))
+            lines.append(f"  {text}")
+        return lines
+
+
+class _ConnectionTrace:
+    """单个连接上正在执行的语句，回调只在使用该连接的线程中调用"""
+
+    __slots__ = ('profiler', 'conn', 'steps_per_call', 'sql', 'started', 'last_step', 'calls', 'changes')
+
+    def __init__(self, profiler: SqlProfiler, conn):
+        self.profiler = profiler
+        self.conn = conn
+        self.steps_per_call = profiler.progress_steps
+        self.sql: Optional[str] = None
+        self.started = 0.0
+        self.last_step = 0.0
+        self.calls = 0
+        self.changes = 0
+
+    def trace(self, sql: str) -> None:
+        if is_trigger_trace(self.sql, sql):
+            return
+        now = time.perf_counter()
+        changes = self.conn.total_changes
+        if self.sql is not None:
+            self.profiler.record(self.sql, self.last_step - self.started, self.calls * self.steps_per_call,
+                                 changes - self.changes)
+        self.sql = sql
+        self.started = self.last_step = now
+        self.calls = 0
+        self.changes = changes
+
+    def progress(self) -> int:
+        self.last_step = time.perf_counter()
+        self.calls += 1
+        return 0  # 非0会中断语句
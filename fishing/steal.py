@@ -0,0 +1,155 @@
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class StealIndex:
+    """偷鱼候选索引
+
+    记录每个用户鱼塘中可偷(稀有度达标且不在禁售期)的鱼的总价值，
+    用Fenwick树维护前缀和，按价值加权抽取受害者和更新权重都是O(log n)。
+    禁售期到期时间放入小顶堆，到期后由调用方刷新对应用户的权重。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.capacity = 0
+        self.tree: List[int] = [0]      # Fenwick树，下标从1开始
+        self.weights: List[int] = [0]   # 槽位 -> 权重
+        self.users: List[Optional[str]] = [None]  # 槽位 -> 用户ID
+        self.slots: Dict[str, int] = {}  # 用户ID -> 槽位
+        self.free_slots: List[int] = []
+        self.unlock_heap: List[Tuple[float, str]] = []
+        self.unlock_times: Dict[str, float] = {}  # 用户ID -> 已登记的解禁时间，避免重复入堆
+
+    @property
+    def total(self) -> int:
+        """所有候选的总权重"""
+        return self._prefix_sum(self.capacity)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def update(self, user_id: str, weight: int, unlock_time: Optional[float] = None) -> None:
+        """设置用户的权重
+        Args:
+            user_id: 用户ID
+            weight: 可偷鱼的总价值，为0时移出候选
+            unlock_time: 最早解除禁售的时间，到期后需要重新计算权重
+        """
+        with self.lock:
+            if unlock_time and self.unlock_times.get(user_id) != unlock_time:
+                self.unlock_times[user_id] = unlock_time
+                heapq.heappush(self.unlock_heap, (unlock_time, user_id))
+
+            slot = self.slots.get(user_id)
+            if slot is None:
+                if weight <= 0:
+                    return
+                slot = self._allocate(user_id)
+            self._set_weight(slot, max(weight, 0))
+
+            if weight <= 0:
+                del self.slots[user_id]
+                self.users[slot] = None
+                self.free_slots.append(slot)
+
+    def export_state(self) -> Tuple[List[Tuple[str, int]], Dict[str, float]]:
+        """导出所有候选的权重和已登记的解禁时间，用于热启动快照"""
+        with self.lock:
+            weights = [(user_id, self.weights[slot]) for user_id, slot in self.slots.items()]
+            return weights, dict(self.unlock_times)
+
+    def load_state(self, weights: List[Tuple[str, int]], unlock_times: Dict[str, float]) -> None:
+        """从热启动快照恢复索引"""
+        for user_id, weight in weights:
+            self.update(user_id, weight)
+        for user_id, unlock_time in unlock_times.items():
+            self.update(user_id, self.weight_of(user_id), unlock_time)
+
+    def weight_of(self, user_id: str) -> int:
+        with self.lock:
+            slot = self.slots.get(user_id)
+            return self.weights[slot] if slot else 0
+
+    def pop_unlocked(self, now: float) -> List[str]:
+        """取出禁售期已到期、需要刷新权重的用户"""
+        expired = []
+        with self.lock:
+            while self.unlock_heap and self.unlock_heap[0][0] <= now:
+                unlock_time, user_id = heapq.heappop(self.unlock_heap)
+                if self.unlock_times.get(user_id) == unlock_time:
+                    del self.unlock_times[user_id]
+                expired.append(user_id)
+        return expired
+
+    def sample(self, r: float, exclude: Optional[str] = None) -> Optional[str]:
+        """按权重抽取一个用户
+        Args:
+            r: [0, 1) 之间的随机数
+            exclude: 不参与抽取的用户(偷鱼者自己)
+        """
+        with self.lock:
+            excluded_slot = self.slots.get(exclude) if exclude is not None else None
+            excluded_weight = self.weights[excluded_slot] if excluded_slot else 0
+            if excluded_weight:
+                self._set_weight(excluded_slot, 0)
+            try:
+                total = self._prefix_sum(self.capacity)
+                if total <= 0:
+                    return None
+                return self.users[self._find(int(r * total))]
+            finally:
+                if excluded_weight:
+                    self._set_weight(excluded_slot, excluded_weight)
+
+    def _allocate(self, user_id: str) -> int:
+        if not self.free_slots:
+            self._grow()
+        slot = self.free_slots.pop()
+        self.slots[user_id] = slot
+        self.users[slot] = user_id
+        return slot
+
+    def _grow(self) -> None:
+        """容量翻倍并重建Fenwick树"""
+        old_capacity = self.capacity
+        self.capacity = max(16, old_capacity * 2)
+        self.weights.extend([0] * (self.capacity - old_capacity))
+        self.users.extend([None] * (self.capacity - old_capacity))
+        self.tree = [0] + self.weights[1:]
+        for i in range(1, self.capacity + 1):
+            parent = i + (i & -i)
+            if parent <= self.capacity:
+                self.tree[parent] += self.tree[i]
+        # 倒序压入，优先复用较小的槽位
+        self.free_slots.extend(range(self.capacity, old_capacity, -1))
+
+    def _set_weight(self, slot: int, weight: int) -> None:
+        delta = weight - self.weights[slot]
+        if not delta:
+            return
+        self.weights[slot] = weight
+        i = slot
+        while i <= self.capacity:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix_sum(self, i: int) -> int:
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def _find(self, target: int) -> int:
+        """找到前缀和第一次超过target的槽位"""
+        pos = 0
+        step = 1 << (self.capacity.bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos + 1
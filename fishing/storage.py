@@ -0,0 +1,122 @@
+import os
+from typing import Dict, Iterator, List, Optional, Protocol, Tuple
+
+from .catches import CatchSet
+from .contention import LockStats
+from .db import FishingDB
+from .memory_db import MemoryFishingDB
+
+# 可选的存储引擎
+ENGINES = ('sqlite', 'memory')
+
+
+class FishingStorage(Protocol):
+    """钓鱼系统使用的存储接口
+
+    FishingSystem 及其组件(市场、成就、签到、流水、偷鱼)只通过这些方法访问数据，
+    SQLite实现为 FishingDB，纯内存实现为 MemoryFishingDB，由 config['storage']['engine'] 选择。
+    """
+
+    INITIAL_COINS: int
+    db_path: str          # 持久化文件路径，备份、热启动快照和图鉴缓存放在同一目录
+    max_specimens: int    # 每个用户每种鱼单独保存重量的条数
+    lock_stats: LockStats
+
+    # 用户与金币
+    def get_user_coins(self, user_id: str) -> int: ...
+    def update_user_coins(self, user_id: str, amount: int, reason: str = 'unknown') -> None: ...
+    def get_top_users_by_coins(self, limit: int = 10) -> List[Dict]: ...
+    def get_last_fishing_time(self, user_id: str) -> float: ...
+    def update_last_fishing_time(self, user_id: str) -> None: ...
+    def get_auto_fishing_status(self, user_id: str) -> bool: ...
+    def set_auto_fishing_status(self, user_id: str, status: bool) -> bool: ...
+    def get_auto_fishing_schedule(self) -> List[Tuple[str, float]]: ...
+
+    # 鱼类图鉴
+    def initialize_fish_types(self, rows: List[Tuple], digest: str = ''): ...
+    def get_fish_by_name(self, name: str) -> Optional[Dict]: ...
+    def get_fish_names(self) -> Dict[int, str]: ...
+    def iter_fish_types_page(self, rarity: Optional[int] = None, after: Optional[Tuple] = None,
+                             limit: int = 20) -> Iterator[Dict]: ...
+    def seek_fish_types(self, rarity: Optional[int], after: Optional[Tuple], rows: int) -> Optional[Tuple]: ...
+
+    # 鱼塘
+    def add_fish_to_pond(self, user_id: str, fish_id: int, weight: Optional[int] = None,
+                         catch_time: Optional[float] = None) -> None: ...
+    def remove_fish_from_pond(self, user_id: str, fish_id: int, amount: int) -> Optional[CatchSet]: ...
+    def get_user_fish(self, user_id: str) -> List[Dict]: ...
+    def get_user_fish_quantity(self, user_id: str, fish_id: int) -> int: ...
+    def get_fish_lock_time(self, user_id: str, fish_id: int) -> int: ...
+    def get_user_catches(self, user_id: str, fish_id: int) -> CatchSet: ...
+    def iter_user_fish_page(self, user_id: str, after: Optional[Tuple] = None,
+                            limit: int = 20) -> Iterator[Dict]: ...
+    def seek_user_fish(self, user_id: str, after: Optional[Tuple], rows: int) -> Optional[Tuple]: ...
+
+    # 鱼饵
+    def add_user_bait(self, user_id: str, bait_name: str) -> None: ...
+    def show_my_baits(self, user_id: str) -> List[Dict]: ...
+    def get_bait_info(self, user_id: str) -> Optional[Dict]: ...
+    def set_current_bait(self, user_id: str, bait_name: Optional[str]) -> None: ...
+    def use_bait(self, user_id: str, bait_name: str, current_time: float) -> None: ...
+
+    # 签到
+    def get_check_in_bits(self, user_id: str, year: int) -> Optional[bytes]: ...
+    def set_check_in_bit(self, user_id: str, year: int, day_index: int) -> Optional[bytes]: ...
+
+    # 偷鱼
+    def get_stealable_weights(self, user_id: Optional[str] = None, min_rarity: int = 3) -> List[Dict]: ...
+    def steal_fish(self, thief_id: str, victim_id: str, r: float, now: float,
+                   cooldown: int, lock_duration: int, min_rarity: int = 3) -> Dict: ...
+
+    # 市场
+    def create_market_order(self, user_id: str, fish_id: int, side: str, price: int,
+                            quantity: int, created_at: float) -> Optional[int]: ...
+    def get_open_market_orders(self) -> List[Dict]: ...
+    def settle_market_fills(self, fills: List[tuple], order_updates: List[tuple],
+                            coin_credits: Dict[str, int], fish_credits: Dict[tuple, int]) -> None: ...
+    def cancel_market_order(self, order_id: int, user_id: str) -> Optional[Dict]: ...
+
+    # 成就
+    def get_achievement_state(self, user_id: str, today: str) -> Dict: ...
+    def save_achievement_progress(self, user_id: str, stats: List[tuple], awards: List[tuple],
+                                  new_species: Optional[int] = None) -> None: ...
+
+    # 昵称
+    def get_nicknames(self, user_ids: List[str]) -> Dict[str, str]: ...
+    def save_nicknames(self, nicknames: List[tuple]) -> None: ...
+
+    # 金币流水
+    def reconcile_coins(self, batch_size: int = 5000) -> Dict: ...
+
+    # 全服统计(SQLite引擎由触发器维护，读取不扫描用户表)
+    def get_global_stats(self) -> Dict: ...
+    def rebuild_global_stats(self) -> Dict: ...
+
+    # 持久化
+    def backup_to(self, target: str, pages_per_step: int = 64, step_sleep: float = 0) -> Dict: ...
+    def close(self) -> None: ...
+
+
+# 存储接口的全部方法名，启用指标时逐个包装统计调用次数和耗时
+STORAGE_METHODS = tuple(name for name, value in vars(FishingStorage).items()
+                        if callable(value) and not name.startswith('_'))
+
+
+def storage_path(config: Dict) -> str:
+    """存储引擎实际读写的文件，内存引擎的快照与数据库文件同名，扩展名为 .snapshot"""
+    if config.get('storage', {}).get('engine', 'sqlite') == 'memory':
+        return os.path.splitext(config['database'])[0] + '.snapshot'
+    return config['database']
+
+
+def create_storage(config: Dict) -> FishingStorage:
+    """按 config['storage']['engine'] 创建存储引擎
+    Raises:
+        ValueError: 未知的存储引擎
+    """
+    engine = config.get('storage', {}).get('engine', 'sqlite')
+    if engine == 'sqlite':
+        return FishingDB(config['database'], config)
+    if engine == 'memory':
+        return MemoryFishingDB(storage_path(config), config)
+    raise ValueError(f"未知的存储引擎: {engine}，可选 {'/'.join(ENGINES)}")
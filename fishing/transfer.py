@@ -0,0 +1,255 @@
+"""玩家数据的流式导出/导入工具
+
+导出文件由若干帧组成，每帧为 1字节类型 + 4字节长度 + marshal编码的数据：
+    T: 表头 (表名, 列名元组)
+    R: 一批数据行 (元组列表)
+    E: 表结束 (表名, 行数)
+文件名以 .gz 结尾时使用gzip压缩。导出按rowid分批读取，每批之间释放读锁，
+内存占用与数据库大小无关；如需一致的时间点快照，请对 /钓鱼备份 生成的快照执行导出。
+导入在一个事务中完成，中途出错时目标库保持导入前的状态。
+
+用法:
+    python -m fishing.transfer export data/fishing.db players.fdump.gz
+    python -m fishing.transfer import players.fdump.gz data/fishing.db
+"""
+import gzip
+import time
+import struct
+import marshal
+import sqlite3
+import logging
+import argparse
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .db import FishingDB, GLOBAL_STATS_TRIGGERS
+
+MAGIC = b'FISHDUMP1\n'
+FRAME_HEADER = struct.Struct('<cI')
+
+# 需要迁移的玩家数据表
+EXPORT_TABLES = (
+    'user_fishing',
+    'user_fish',
+    'user_catches',
+    'user_bait',
+    'check_ins',
+    'check_in_bits',
+    'fishing_records',
+    'market_orders',
+    'market_escrow',
+    'market_fills',
+    'user_stats',
+    'user_achievements',
+    'user_species',
+    'user_profile',
+    'coin_ledger',
+    'coin_checkpoints',
+    'coin_ledger_state',
+)
+
+LOG = logging.getLogger("FishingTransfer")
+
+
+def _open(path: str, mode: str):
+    """按扩展名打开普通文件或gzip文件"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+
+def _write_frame(fp, kind: bytes, payload) -> None:
+    data = marshal.dumps(payload)
+    fp.write(FRAME_HEADER.pack(kind, len(data)))
+    fp.write(data)
+
+
+def _read_frames(fp) -> Iterator[Tuple[bytes, object]]:
+    while True:
+        header = fp.read(FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise ValueError("导出文件已损坏: 帧头不完整")
+        kind, length = FRAME_HEADER.unpack(header)
+        data = fp.read(length)
+        if len(data) < length:
+            raise ValueError("导出文件已损坏: 帧数据不完整")
+        yield kind, marshal.loads(data)
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def iter_table_rows(conn: sqlite3.Connection, table: str, columns: Sequence[str],
+                    chunk_size: int = 10000) -> Iterator[List[tuple]]:
+    """按rowid分批读取表数据，每次只在内存中保留一批"""
+    column_sql = ', '.join(columns)
+    last_rowid = None
+    while True:
+        if last_rowid is None:
+            cursor = conn.execute(
+                f"SELECT rowid, {column_sql} FROM {table} ORDER BY rowid LIMIT ?", (chunk_size,)
+            )
+        else:
+            cursor = conn.execute(
+                f"SELECT rowid, {column_sql} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, chunk_size)
+            )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+
+def export_data(db_path: str, output_path: str, tables: Sequence[str] = EXPORT_TABLES,
+                chunk_size: int = 10000) -> Dict[str, int]:
+    """导出玩家数据
+    Args:
+        db_path: 数据库文件路径
+        output_path: 导出文件路径，以 .gz 结尾时压缩
+        tables: 需要导出的表
+        chunk_size: 每批读取的行数
+    Returns:
+        每张表导出的行数
+    """
+    counts = {}
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        with _open(output_path, 'wb') as fp:
+            fp.write(MAGIC)
+            for table in tables:
+                columns = _table_columns(conn, table)
+                if not columns:
+                    LOG.warning(f"表 {table} 不存在，已跳过")
+                    continue
+                _write_frame(fp, b'T', (table, tuple(columns)))
+                count = 0
+                for rows in iter_table_rows(conn, table, columns, chunk_size):
+                    _write_frame(fp, b'R', rows)
+                    count += len(rows)
+                _write_frame(fp, b'E', (table, count))
+                counts[table] = count
+    finally:
+        conn.close()
+    LOG.info(f"导出完成: {sum(counts.values())}行，耗时{time.perf_counter() - start:.2f}秒")
+    return counts
+
+
+def import_data(input_path: str, db_path: str, truncate: bool = True) -> Dict[str, int]:
+    """导入玩家数据
+    Args:
+        input_path: 导出文件路径
+        db_path: 目标数据库文件路径，不存在时自动创建表结构
+        truncate: 导入前是否清空目标表
+    Returns:
+        每张表导入的行数
+    """
+    target = FishingDB(db_path)  # 确保目标库的表结构是最新的
+
+    counts = {}
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        with _open(input_path, 'rb') as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{input_path} 不是钓鱼数据导出文件")
+
+            # 清空、写入、重建索引和统计都在同一个事务中，SQLite的表结构变更也随事务回滚
+            conn.execute("BEGIN")
+            # 逐行维护全服统计会拖慢导入，INSERT OR REPLACE 替换行时也不会触发删除触发器；
+            # 导入期间去掉触发器，数据写完后在提交前重建
+            for trigger in GLOBAL_STATS_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            deferred_indexes: List[Tuple[str, str]] = []
+            insert_sql: Optional[str] = None
+            keep: List[int] = []
+            project = False
+            table = None
+            for kind, payload in _read_frames(fp):
+                if kind == b'T':
+                    table, columns = payload
+                    target_columns = set(_table_columns(conn, table))
+                    if not target_columns:
+                        raise ValueError(f"目标库中不存在表 {table}")
+                    # 仅导入目标库中存在的列，兼容表结构的变化
+                    keep = [i for i, column in enumerate(columns) if column in target_columns]
+                    kept_columns = [columns[i] for i in keep]
+                    project = len(keep) != len(columns)
+                    placeholders = ', '.join('?' * len(kept_columns))
+                    insert_sql = (f"INSERT OR REPLACE INTO {table} ({', '.join(kept_columns)}) "
+                                  f"VALUES ({placeholders})")
+                    deferred_indexes.extend(_drop_indexes(conn, table))
+                    if truncate:
+                        conn.execute(f"DELETE FROM {table}")
+                    counts[table] = 0
+                elif kind == b'R':
+                    rows = payload
+                    if project:
+                        rows = [tuple(row[i] for i in keep) for row in rows]
+                    conn.executemany(insert_sql, rows)
+                    counts[table] += len(rows)
+                elif kind == b'E':
+                    table, expected = payload
+                    if counts.get(table) != expected:
+                        raise ValueError(f"表 {table} 行数不符: 期望{expected}，实际{counts.get(table)}")
+
+            # 所有数据写入后再统一重建索引
+            for _, sql in deferred_indexes:
+                conn.execute(sql)
+            for sql in GLOBAL_STATS_TRIGGERS.values():
+                conn.execute(sql)
+            target._rebuild_global_stats(conn.cursor())
+            conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+        target.close()
+    LOG.info(f"导入完成: {sum(counts.values())}行，耗时{time.perf_counter() - start:.2f}秒")
+    return counts
+
+
+def _drop_indexes(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str]]:
+    """删除表上的二级索引，返回索引名和重建索引的SQL"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    return indexes
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="钓鱼插件玩家数据导出/导入")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    export_parser = subparsers.add_parser('export', help="导出玩家数据")
+    export_parser.add_argument('database')
+    export_parser.add_argument('output')
+    export_parser.add_argument('--chunk-size', type=int, default=10000)
+
+    import_parser = subparsers.add_parser('import', help="导入玩家数据")
+    import_parser.add_argument('input')
+    import_parser.add_argument('database')
+    import_parser.add_argument('--append', action='store_true', help="保留目标表中已有的数据")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.action == 'export':
+        counts = export_data(args.database, args.output, chunk_size=args.chunk_size)
+    else:
+        counts = import_data(args.input, args.database, truncate=not args.append)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+
+
+if __name__ == '__main__':
+    main()
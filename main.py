@@ -1,9 +1,19 @@
 import os
+import asyncio
 import logging
-from astrbot.api.event import filter, AstrMessageEvent
+from typing import Dict
+from astrbot.api.event import filter, AstrMessageEvent, MessageChain
 from astrbot.api.star import Context, Star, register
 from .fishing.fishing import FishingSystem
-from .fishing.db import FishingDB
+from .fishing.shard import ShardRouter
+from .fishing.admission import AdmissionController
+from .fishing.nickname import NicknameService
+from .fishing.recorder import TrafficRecorder
+from .fishing.metrics import Metrics, cache_collector
+from .fishing.contention import LockStats
+from .fishing.sql_profiler import SqlProfiler
+from .fishing.slow_profiler import SlowCommandProfiler
+from .fishing.paging import RARITY_BY_NAME
 
 @register("fishing", "Your Name", "一个功能齐全的钓鱼系统插件", "1.0.0", "https://github.com/yourusername/astrbot_plugin_fishing")
 class FishingPlugin(Star):
@@ -17,13 +27,148 @@ class FishingPlugin(Star):
         os.makedirs(self.data_dir, exist_ok=True)
         
         # 初始化数据库和钓鱼系统
+        self.config = self.load_config()
+        self.metrics = Metrics(self.config)
+        self.profiler = SlowCommandProfiler(self.config)
+        self.shards = ShardRouter(self.config, self.get_user_nickname, self.metrics, self.profiler)
+        self.fishing_system = self.shards.default
+        # 昵称保存在默认分片的存储中，与其共用连接(内存引擎共用同一份数据和快照)
+        self.db = self.fishing_system.db
+        self.nicknames = NicknameService(self.db.get_nicknames, self.db.save_nicknames,
+                                         **self.config['nickname'])
+        self.admission = AdmissionController(self.config, self.metrics, self.profiler)
+        self.metrics.add_collector(cache_collector('nickname', self.nicknames.get_stats))
+        self.metrics.start()
+        self.profiler.start()
+        self.digest_task = None
+        recorder = self.config['recorder']
+        self.recorder = TrafficRecorder(recorder['path'], recorder['max_bytes'], recorder['backups']) \
+            if recorder['enabled'] else None
+        
+        self.logger.info("钓鱼插件初始化完成")
+    
+    def load_config(self) -> Dict:
+        """插件配置"""
         db_path = os.path.join(self.data_dir, "fishing.db")
-        self.config = {
+        return {
             'database': db_path,
             'auto_fishing_enabled': True,
             'base_cost': 50,
             'weather_update_interval': 3600,
             'initialize_fish_types': True,
+            'catalog': {
+                'path': None,             # 鱼类图鉴YAML，None表示使用插件自带的 fishing/fish_catalog.yaml
+                'cache': os.path.join(self.data_dir, 'fish_catalog.cache'),
+                'reload_interval': 5,     # 检查图鉴文件变化的间隔(秒)
+            },
+            'admission': {
+                'enabled': True,
+                'max_concurrency': 16,  # 同时执行的命令上限
+                'global_rate': 200,     # 全局每秒补充的令牌数
+                'global_burst': 400,
+                'user_rate': 0.5,       # 每个用户每秒补充的令牌数
+                'user_burst': 3,
+                'commands': {
+                    '钓鱼': {'rate': 0.1, 'burst': 2},
+                    '钓鱼签到': {'rate': 0.05, 'burst': 1},
+                },
+            },
+            'storage': {
+                'engine': 'sqlite',        # sqlite: SQLite数据库; memory: 纯内存，定期保存快照
+                'snapshot_interval': 60,   # 内存引擎保存快照的间隔(秒)
+                'ledger_keep': 100000,     # 内存引擎保留的已对账金币流水条数
+            },
+            'rng': {
+                'seed': None,              # 随机数种子，设定后钓鱼、签到、偷鱼结果可复现；None为每次启动随机
+                'scope': 'user',           # user: 每个用户独立的随机数流; shard: 每个分片共用一条流
+                'max_streams': 10000,      # 保留的用户随机数流上限，超出时淘汰最久未使用的
+            },
+            'db_retry': {
+                'max_attempts': 10,     # 写事务加锁的最多尝试次数
+                'base_delay': 0.005,    # 第一次退避的上限(秒)，之后指数增长并随机抖动
+                'max_delay': 0.5,       # 单次退避的上限(秒)
+                'busy_timeout': 0.05,   # 每次尝试时SQLite自身的忙等待时间(秒)
+            },
+            'market': {
+                'batch_size': 500,         # 累计多少笔成交后立即落盘
+                'flush_interval': 1.0,     # 成交定时落盘间隔(秒)
+                'max_orders_per_user': 20,
+                'max_quantity': 10000,     # 单笔挂单的数量上限
+                'max_price': 10 ** 9,      # 单价上限
+                'max_amount': 10 ** 12,    # 单笔挂单的总额(单价x数量)上限
+            },
+            'check_in': {
+                'streak_bonus': 10,       # 连续签到每天额外奖励的金币
+                'max_streak_bonus': 100,  # 连续签到额外奖励上限
+            },
+            'steal': {
+                'cooldown': 3600,       # 偷鱼冷却(秒)
+                'lock_duration': 1800,  # 偷来的鱼禁售时长(秒)
+                'min_rarity': 3,        # 可被偷的最低稀有度
+            },
+            'backup': {
+                'enabled': True,
+                'interval': 6 * 3600,  # 定时备份间隔(秒)
+                'pages_per_step': 64,  # 每批复制的页数
+                'step_sleep': 0.01,    # 每批之间休眠的秒数
+                'keep': 5,             # 保留的快照数量
+            },
+            'nickname': {
+                'ttl': 3600,          # 昵称缓存有效期(秒)
+                'negative_ttl': 300,  # 查无昵称的用户缓存时长(秒)
+                'max_size': 10000,    # 昵称缓存容量
+            },
+            'metrics': {
+                'enabled': False,          # 统计命令耗时、存储方法耗时和每条命令的写事务数
+                'dump_path': os.path.join(self.data_dir, 'metrics.prom'),  # Prometheus文本格式的指标文件
+                'dump_interval': 60,       # 写入指标文件的间隔(秒)
+            },
+            'sql_profiler': {
+                'enabled': False,          # 按语句形状统计SQL的次数、耗时和写入行数，可用 /SQL统计 开启 临时开启
+                'slow_ms': 50,             # 慢语句阈值(毫秒)，超过的语句形状(参数替换为?)写入慢语句日志
+                'slow_log': os.path.join(self.data_dir, 'slow_sql.log'),  # 为空时写入插件日志
+                'progress_steps': 100,     # 每执行多少条虚拟机指令回调一次，越小耗时越精确、开销越大
+                'max_shapes': 500,         # 统计的语句形状上限，超出后计入"其他语句"
+            },
+            'slow_profiler': {
+                'enabled': False,          # 命令或一轮自动钓鱼超过阈值时保存执行期间的调用栈采样
+                'threshold': 1.0,          # 慢命令阈值(秒)
+                'interval': 0.02,          # 采样间隔(秒)，只在有命令执行时采样
+                'directory': os.path.join(self.data_dir, 'slow_profiles'),
+                'keep': 20,                # 保留最近的采样文件数
+                'max_samples': 5000,       # 单条命令最多保留的采样次数
+                'tracemalloc': False,      # 同时跟踪内存分配，采样文件中附带内存变化，开销较大
+            },
+            'recorder': {
+                'enabled': False,          # 记录命令流量(时间、匿名用户、命令、参数)，用于离线回放
+                'path': os.path.join(self.data_dir, 'traffic', 'traffic.log'),
+                'max_bytes': 8 * 1024 * 1024,  # 单个记录文件的大小上限，超出后轮转
+                'backups': 5,              # 保留的轮转文件数量
+            },
+            'auto_fishing_digest': {
+                'max_species': 20,     # 汇总中单独列出的鱼种上限，其余计入"其他"
+                'push_interval': 0,    # 定时推送汇总的间隔(秒)，0表示只在用户下次互动时附带
+            },
+            'ledger': {
+                'reconcile_interval': 600,  # 增量对账间隔(秒)，0表示只在管理员命令时对账
+                'reconcile_batch': 5000,    # 每批对账处理的流水条数
+            },
+            'catches': {
+                'max_specimens': 64,  # 每个用户每种鱼单独保存重量的条数，更轻的鱼合并记录
+            },
+            'pagination': {
+                'page_size': 20,   # 鱼塘和图鉴每页显示的鱼种数
+                'cache_ttl': 300,  # 分页边界缓存时间(秒)
+            },
+            'leaderboard_ttl': 60,  # 排行榜缓存时间(秒)
+            'warm_start': {
+                'enabled': True,
+                'max_age': 600,  # 热启动快照有效期(秒)，超时或数据库被改动过则从数据库重建
+            },
+            'sharding': {
+                'enabled': False,
+                'mode': 'platform',  # platform: 按平台分片; group: 按群组分片
+            },
             'baits': [
                 {
                     'name': '普通鱼饵',
@@ -45,35 +190,168 @@ class FishingPlugin(Star):
                 }
             ]
         }
-        self.db = FishingDB(db_path)
-        self.fishing_system = FishingSystem(self.config, self.get_user_nickname)
-        
-        self.logger.info("钓鱼插件初始化完成")
     
     def get_user_nickname(self, user_id: str) -> str:
         """获取用户昵称"""
-        # 可以通过AstrBot API获取用户昵称
         try:
-            # 尝试从AstrBot获取用户信息
-            # 这里仅作示例，实际实现需要根据AstrBot的API
-            return user_id  # 如果无法获取，则返回用户ID
+            # 昵称来自消息事件，缓存未命中时回落到数据库，都没有则返回用户ID
+            return self.nicknames.get(user_id) or user_id
         except Exception as e:
             self.logger.error(f"获取用户昵称出错: {e}")
             return user_id
     
+    def observe_event(self, event: AstrMessageEvent):
+        """记录消息事件中携带的发送者昵称和消息来源"""
+        user_id = event.get_sender_id()
+        nickname = event.get_sender_name()
+        self.record_command(event)
+        if nickname:
+            self.nicknames.remember(user_id, nickname)
+        self.resolve_system(event).digests.remember_origin(user_id, event.unified_msg_origin)
+        self.ensure_digest_task()
+    
+    def record_command(self, event: AstrMessageEvent):
+        """启用命令记录时记录这条命令"""
+        if self.recorder:
+            self.recorder.record(event.get_sender_id(), event.message_str)
+    
+    def with_digest(self, event: AstrMessageEvent, result: str) -> str:
+        """在命令结果后附带用户的自动钓鱼汇总"""
+        digest = self.resolve_system(event).take_auto_fishing_digest(event.get_sender_id())
+        if not digest:
+            return result
+        return f"{result}\n\n{digest}"
+    
+    def ensure_digest_task(self):
+        """按需启动定时推送自动钓鱼汇总的任务"""
+        interval = self.config['auto_fishing_digest']['push_interval']
+        if interval > 0 and self.digest_task is None:
+            self.digest_task = asyncio.create_task(self._push_digests_loop(interval))
+    
+    async def _push_digests_loop(self, interval: float):
+        """定时把自动钓鱼汇总推送到用户最近发消息的会话"""
+        while True:
+            await asyncio.sleep(interval)
+            for _, system in self.shards.all_systems():
+                for user_id in system.digests.pending_users():
+                    origin = system.digests.origins.get(user_id)
+                    if not origin:
+                        continue  # 重启后还没互动过的用户，等下次互动时再附带
+                    digest = system.take_auto_fishing_digest(user_id)
+                    if not digest:
+                        continue
+                    try:
+                        await self.context.send_message(origin, MessageChain().message(digest))
+                    except Exception as e:
+                        self.logger.error(f"推送自动钓鱼汇总失败: {e}")
+    
+    async def render_ranking(self) -> str:
+        """渲染排行榜：先查询排名，再一次性批量解析所有昵称"""
+        loop = asyncio.get_running_loop()
+        ranking = await loop.run_in_executor(None, self.shards.get_global_coin_ranking)
+        await self.nicknames.resolve_many([row['user_id'] for row in ranking])
+        return self.shards.format_ranking(ranking)
+    
+    def render_status(self) -> str:
+        """汇总准入、缓存命中、写事务等锁和指标，供 /钓鱼状态 使用"""
+        lines = ["📊 钓鱼状态"]
+        admission = self.admission.get_stats()
+        lines.append(f"🚦 准入: 执行中{admission['active']} 放行{sum(admission['admitted'].values())} "
+                     f"合并{sum(admission['coalesced'].values())} 拒绝{sum(admission['rejections'].values())}")
+        
+        caches = {'昵称': self.nicknames.get_stats()}
+        names = {'bait': '鱼饵', 'leaderboard': '排行榜', 'page_cursor': '分页'}
+        systems = self.shards.all_systems()
+        for _, system in systems:
+            for name, stats in system.get_cache_stats().items():
+                total = caches.setdefault(names.get(name, name), {'hits': 0, 'misses': 0})
+                total['hits'] += stats['hits']
+                total['misses'] += stats['misses']
+        rates = []
+        for name, stats in caches.items():
+            requests = stats['hits'] + stats['misses']
+            if requests:
+                rates.append(f"{name}{stats['hits'] / requests:.0%}({requests}次)")
+        lines.append("💾 缓存命中: " + ("、".join(rates) if rates else "暂无访问"))
+        
+        lock_stats = LockStats.merge([system.db.lock_stats.snapshot() for _, system in systems])
+        if lock_stats:
+            lines.append("🔒 写事务等锁:")
+            lines.extend(f"  {line}" for line in LockStats.format(lock_stats)[:5])
+        
+        if self.metrics.enabled:
+            lines.extend(self.metrics.format_status())
+        else:
+            lines.append("💡 开启 metrics.enabled 后可查看各命令耗时和存储方法统计")
+        lines.append(self.profiler.format_status())
+        return "\n".join(lines)
+    
+    def render_sql_profile(self, action: str = '') -> str:
+        """/SQL统计: 开启、关闭、重置语句统计，或按累计耗时列出最热的语句"""
+        profilers = [system.db.sql_profiler for _, system in self.shards.all_systems()
+                     if getattr(system.db, 'sql_profiler', None) is not None]
+        if not profilers:
+            return "❌ 当前存储引擎不执行SQL，没有语句可统计"
+        if action in ('开启', '关闭'):
+            # 分片配置与插件配置共用 sql_profiler 字典，之后创建的分片按同样的开关启动
+            self.config.setdefault('sql_profiler', {})['enabled'] = action == '开启'
+            for profiler in profilers:
+                profiler.set_enabled(action == '开启')
+            return f"✅ SQL语句统计已{action}" + ("，各连接在下次使用时生效" if action == '开启' else "")
+        if action == '重置':
+            for profiler in profilers:
+                profiler.reset()
+            return "✅ SQL语句统计已清空"
+        if action:
+            return "格式: /SQL统计 [开启|关闭|重置]，不带参数查看统计"
+        
+        enabled = any(profiler.enabled for profiler in profilers)
+        snapshot = SqlProfiler.merge([profiler.snapshot() for profiler in profilers])
+        lines = [f"🧾 SQL语句统计({'已开启' if enabled else '已关闭'}，"
+                 f"慢语句阈值{profilers[0].slow_ms}ms，共{sum(profiler.slow_count for profiler in profilers)}条慢语句)"]
+        if not snapshot:
+            lines.append("暂无统计" + ("" if enabled else "，使用 /SQL统计 开启 开始统计"))
+            return "\n".join(lines)
+        count = sum(stats['count'] for stats in snapshot.values())
+        seconds = sum(stats['seconds'] for stats in snapshot.values())
+        lines.append(f"{len(snapshot)}种语句 {count}次 共{seconds * 1000:.0f}ms，累计耗时前10:")
+        lines.extend(SqlProfiler.format(snapshot, 10))
+        return "\n".join(lines)
+    
+    def get_fishing_system(self, event: AstrMessageEvent) -> FishingSystem:
+        """根据消息来源获取对应分片的钓鱼系统"""
+        self.observe_event(event)
+        return self.resolve_system(event)
+    
+    def resolve_system(self, event: AstrMessageEvent) -> FishingSystem:
+        """根据消息来源定位分片"""
+        if not self.shards.enabled:
+            return self.fishing_system
+        shard_key = self.shards.shard_key(event.get_platform_name(), event.get_group_id())
+        return self.shards.get_system(shard_key)
+    
     @filter.command("钓鱼")
     async def fishing(self, event: AstrMessageEvent):
         '''开始钓鱼'''
         user_id = event.get_sender_id()
-        result = self.fishing_system.fish(user_id)
-        yield event.plain_result(result)
+        result = await self.admission.run(user_id, "钓鱼", self.get_fishing_system(event).fish, user_id)
+        yield event.plain_result(self.with_digest(event, result))
     
     @filter.command("鱼塘")
     async def fish_pond(self, event: AstrMessageEvent):
         '''查看自己的鱼塘'''
         user_id = event.get_sender_id()
-        result = self.fishing_system.get_user_fish_pond(user_id)
-        yield event.plain_result(result)
+        parts = event.message_str.split()
+        page = 1
+        if len(parts) >= 2:
+            if not parts[1].isdigit() or int(parts[1]) < 1:
+                yield event.plain_result("格式: /鱼塘 [页码]")
+                return
+            page = int(parts[1])
+        system = self.get_fishing_system(event)
+        result = await self.admission.run(user_id, "鱼塘", system.get_user_fish_pond, user_id, page,
+                                          coalesce_key=("鱼塘", id(system), user_id, page))
+        yield event.plain_result(self.with_digest(event, result))
     
     @filter.command("卖鱼")
     async def sell_fish(self, event: AstrMessageEvent):
@@ -86,10 +364,12 @@ class FishingPlugin(Star):
             fish_name = parts[1]
             try:
                 amount = int(parts[2])
-                result = self.fishing_system.sell_fish(user_id, fish_name, amount)
-                yield event.plain_result(result)
             except ValueError:
                 yield event.plain_result("❌ 请输入正确的数量")
+                return
+            result = await self.admission.run(user_id, "卖鱼", self.get_fishing_system(event).sell_fish,
+                                              user_id, fish_name, amount)
+            yield event.plain_result(self.with_digest(event, result))
         else:
             yield event.plain_result("格式: /卖鱼 [鱼名] [数量]")
     
@@ -97,39 +377,55 @@ class FishingPlugin(Star):
     async def sell_all_fish(self, event: AstrMessageEvent):
         '''卖出所有鱼获得金币'''
         user_id = event.get_sender_id()
-        result = self.fishing_system.sell_all_fish(user_id)
-        yield event.plain_result(result)
+        result = await self.admission.run(user_id, "全部卖出", self.get_fishing_system(event).sell_all_fish, user_id)
+        yield event.plain_result(self.with_digest(event, result))
     
     @filter.command("自动钓鱼")
     async def auto_fishing(self, event: AstrMessageEvent):
         '''开启/关闭自动钓鱼'''
         user_id = event.get_sender_id()
-        result = self.fishing_system.toggle_auto_fishing(user_id)
-        yield event.plain_result(result)
+        result = await self.admission.run(user_id, "自动钓鱼", self.get_fishing_system(event).toggle_auto_fishing, user_id)
+        yield event.plain_result(self.with_digest(event, result))
     
     @filter.command("钓鱼帮助")
     async def fishing_help(self, event: AstrMessageEvent):
         '''显示钓鱼帮助信息'''
-        result = self.fishing_system.show_help()
+        self.record_command(event)
+        result = await self.admission.run(event.get_sender_id(), "钓鱼帮助", self.fishing_system.show_help,
+                                          coalesce_key=("钓鱼帮助",))
         yield event.plain_result(result)
     
     @filter.command("鱼类图鉴")
     async def fish_guide(self, event: AstrMessageEvent):
         '''查看鱼类图鉴'''
-        result = self.db.get_all_fish_types()
+        self.record_command(event)
+        rarity = None
+        page = 1
+        for arg in event.message_str.split()[1:]:
+            if arg in RARITY_BY_NAME:
+                rarity = RARITY_BY_NAME[arg]
+            elif arg.isdigit() and int(arg) >= 1:
+                page = int(arg)
+            else:
+                yield event.plain_result(f"格式: /鱼类图鉴 [{'/'.join(RARITY_BY_NAME)}] [页码]")
+                return
+        result = await self.admission.run(event.get_sender_id(), "鱼类图鉴", self.fishing_system.show_fish_guide,
+                                          rarity, page, coalesce_key=("鱼类图鉴", rarity, page))
         yield event.plain_result(result)
     
     @filter.command("钓鱼签到")
     async def daily_check_in(self, event: AstrMessageEvent):
         '''每日钓鱼签到'''
         user_id = event.get_sender_id()
-        result = self.fishing_system.daily_check_in(user_id)
-        yield event.plain_result(result)
+        result = await self.admission.run(user_id, "钓鱼签到", self.get_fishing_system(event).daily_check_in, user_id)
+        yield event.plain_result(self.with_digest(event, result))
     
     @filter.command("鱼饵商城")
     async def bait_shop(self, event: AstrMessageEvent):
         '''查看鱼饵商城'''
-        result = self.fishing_system.show_bait_shop()
+        self.record_command(event)
+        result = await self.admission.run(event.get_sender_id(), "鱼饵商城", self.fishing_system.show_bait_shop,
+                                          coalesce_key=("鱼饵商城",))
         yield event.plain_result(result)
     
     @filter.command("购买鱼饵")
@@ -141,8 +437,9 @@ class FishingPlugin(Star):
         parts = message.split()
         if len(parts) >= 2:
             bait_name = parts[1]
-            result = self.fishing_system.buy_bait(user_id, bait_name)
-            yield event.plain_result(result)
+            result = await self.admission.run(user_id, "购买鱼饵", self.get_fishing_system(event).buy_bait,
+                                              user_id, bait_name)
+            yield event.plain_result(self.with_digest(event, result))
         else:
             yield event.plain_result("格式: /购买鱼饵 [鱼饵名称]")
     
@@ -155,8 +452,9 @@ class FishingPlugin(Star):
         parts = message.split()
         if len(parts) >= 2:
             bait_name = parts[1]
-            result = self.fishing_system.use_bait(user_id, bait_name)
-            yield event.plain_result(result)
+            result = await self.admission.run(user_id, "使用鱼饵", self.get_fishing_system(event).use_bait,
+                                              user_id, bait_name)
+            yield event.plain_result(self.with_digest(event, result))
         else:
             yield event.plain_result("格式: /使用鱼饵 [鱼饵名称]")
     
@@ -164,17 +462,153 @@ class FishingPlugin(Star):
     async def my_baits(self, event: AstrMessageEvent):
         '''查看我的鱼饵'''
         user_id = event.get_sender_id()
-        result = self.fishing_system.show_my_baits(user_id)
+        result = await self.admission.run(user_id, "我的鱼饵", self.get_fishing_system(event).show_my_baits, user_id)
+        yield event.plain_result(self.with_digest(event, result))
+    
+    @filter.command("偷鱼")
+    async def steal_fish(self, event: AstrMessageEvent):
+        '''偷别人鱼塘里的稀有鱼'''
+        user_id = event.get_sender_id()
+        result = await self.admission.run(user_id, "偷鱼", self.get_fishing_system(event).steal_fish, user_id)
+        yield event.plain_result(self.with_digest(event, result))
+    
+    @filter.command("挂单")
+    async def market_sell(self, event: AstrMessageEvent):
+        '''在市场挂卖单'''
+        async for result in self._place_market_order(event, 'sell', "格式: /挂单 [鱼名] [数量] [单价]"):
+            yield result
+    
+    @filter.command("购买")
+    async def market_buy(self, event: AstrMessageEvent):
+        '''在市场挂买单'''
+        async for result in self._place_market_order(event, 'buy', "格式: /购买 [鱼名] [数量] [单价]"):
+            yield result
+    
+    async def _place_market_order(self, event: AstrMessageEvent, side: str, usage: str):
+        """解析挂单参数并提交到市场"""
+        user_id = event.get_sender_id()
+        parts = event.message_str.split()
+        if len(parts) < 4:
+            yield event.plain_result(usage)
+            return
+        try:
+            quantity = int(parts[2])
+            price = int(parts[3])
+        except ValueError:
+            yield event.plain_result("❌ 请输入正确的数量和单价")
+            return
+        result = await self.admission.run(user_id, "挂单", self.get_fishing_system(event).place_market_order,
+                                          user_id, side, parts[1], quantity, price)
+        yield event.plain_result(self.with_digest(event, result))
+    
+    @filter.command("市场")
+    async def market(self, event: AstrMessageEvent):
+        '''查看市场行情'''
+        user_id = event.get_sender_id()
+        parts = event.message_str.split()
+        fish_name = parts[1] if len(parts) >= 2 else None
+        result = await self.admission.run(user_id, "市场", self.get_fishing_system(event).show_market,
+                                          user_id, fish_name)
+        yield event.plain_result(self.with_digest(event, result))
+    
+    @filter.command("撤单")
+    async def market_cancel(self, event: AstrMessageEvent):
+        '''撤销市场挂单'''
+        user_id = event.get_sender_id()
+        parts = event.message_str.split()
+        if len(parts) < 2:
+            yield event.plain_result("格式: /撤单 [订单号]")
+            return
+        try:
+            order_id = int(parts[1].lstrip('#'))
+        except ValueError:
+            yield event.plain_result("❌ 请输入正确的订单号")
+            return
+        result = await self.admission.run(user_id, "撤单", self.get_fishing_system(event).cancel_market_order,
+                                          user_id, order_id)
+        yield event.plain_result(self.with_digest(event, result))
+    
+    @filter.command("我的成就")
+    async def my_achievements(self, event: AstrMessageEvent):
+        '''查看称号、成就和每日任务'''
+        user_id = event.get_sender_id()
+        result = await self.admission.run(user_id, "我的成就", self.get_fishing_system(event).show_achievements,
+                                          user_id)
+        yield event.plain_result(self.with_digest(event, result))
+    
+    @filter.command("钓鱼排行")
+    async def fishing_ranking(self, event: AstrMessageEvent):
+        '''查看全服金币排行榜'''
+        self.observe_event(event)
+        result = await self.admission.run(event.get_sender_id(), "钓鱼排行", self.render_ranking,
+                                          coalesce_key=("钓鱼排行",))
+        yield event.plain_result(result)
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("钓鱼备份")
+    async def backup(self, event: AstrMessageEvent):
+        '''立即备份钓鱼数据库（管理员）'''
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.shards.backup_all)
+        yield event.plain_result(result)
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("金币对账")
+    async def reconcile(self, event: AstrMessageEvent):
+        '''立即核对金币流水与余额（管理员）'''
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.shards.reconcile_all)
+        yield event.plain_result(result)
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("经济概况")
+    async def economy(self, event: AstrMessageEvent):
+        '''查看全服玩家、金币和鱼塘存量，加"重建"参数时先全表重新统计（管理员）'''
+        parts = event.message_str.split()
+        rebuild = len(parts) > 1 and parts[1] == '重建'
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.shards.economy_report, rebuild)
+        yield event.plain_result(result)
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("钓鱼状态")
+    async def status(self, event: AstrMessageEvent):
+        '''查看命令耗时、缓存命中和数据库等锁统计（管理员）'''
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.render_status)
+        yield event.plain_result(result)
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("SQL统计")
+    async def sql_profile(self, event: AstrMessageEvent):
+        '''开启/关闭/重置/查看SQL语句统计（管理员）'''
+        parts = event.message_str.split()
+        action = parts[1] if len(parts) > 1 else ''
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.render_sql_profile, action)
         yield event.plain_result(result)
     
     @filter.command("天气")
     async def weather(self, event: AstrMessageEvent):
         '''查看钓鱼天气'''
-        result = self.fishing_system.get_weather_info()
-        yield event.plain_result(result)
+        user_id = event.get_sender_id()
+        system = self.get_fishing_system(event)
+        result = await self.admission.run(user_id, "天气", system.get_weather_info,
+                                          coalesce_key=("天气", id(system)))
+        yield event.plain_result(self.with_digest(event, result))
     
     async def terminate(self):
         '''插件被卸载/停用时调用'''
         self.logger.info("钓鱼插件正在终止...")
-        # 结束自动钓鱼线程等清理工作
-        # 关闭数据库连接等
+        if self.digest_task:
+            self.digest_task.cancel()
+        # 先写入尚未持久化的昵称，再停止各分片并保存热启动快照
+        self.nicknames.flush()
+        if self.recorder:
+            self.recorder.close()
+        loop = asyncio.get_running_loop()
+        for shard_key, system in self.shards.all_systems():
+            await loop.run_in_executor(None, system.shutdown)
+        self.metrics.stop()
+        self.profiler.stop()
+        self.logger.info("钓鱼插件已停止")
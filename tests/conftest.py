@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# 插件目录不是可安装的包，测试直接从仓库根目录导入 fishing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fishing.db import FishingDB  # noqa: E402
+from fishing.memory_db import MemoryFishingDB  # noqa: E402
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def db(request, tmp_path):
+    """SQLite和内存两种存储引擎"""
+    if request.param == 'sqlite':
+        storage = FishingDB(str(tmp_path / 'fishing.db'))
+    else:
+        storage = MemoryFishingDB(str(tmp_path / 'fishing.snapshot'))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def system(request, tmp_path):
+    """使用自带图鉴的钓鱼系统，两种存储引擎"""
+    from fishing.fishing import FishingSystem
+    config = {'database': str(tmp_path / 'fishing.db'), 'storage': {'engine': request.param}}
+    fishing_system = FishingSystem(config, lambda user_id: user_id)
+    yield fishing_system
+    fishing_system.shutdown()
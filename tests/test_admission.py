@@ -0,0 +1,93 @@
+"""命令准入控制: 拒绝原因、令牌扣除和同一用户的执行顺序"""
+import time
+import asyncio
+import threading
+
+from fishing.admission import AdmissionController
+
+
+def controller(**admission) -> AdmissionController:
+    admission.setdefault('user_rate', 0)
+    admission.setdefault('global_rate', 0)
+    return AdmissionController({'admission': admission})
+
+
+def command(result: str = 'ok'):
+    return lambda: result
+
+
+def run(admission: AdmissionController, *calls):
+    """依次发起 (用户, 命令, 函数) 请求并等待全部完成"""
+    async def main():
+        return await asyncio.gather(*(admission.run(user_id, name, func) for user_id, name, func in calls))
+    return asyncio.run(main())
+
+
+def test_rejection_reasons():
+    admission = controller(user_burst=2, global_burst=3, commands={'钓鱼': {'burst': 1, 'rate': 0}})
+    results = run(admission, ('a', '钓鱼', command()), ('a', '钓鱼', command()),
+                  ('a', '鱼塘', command()), ('a', '鱼塘', command()),
+                  ('b', '鱼塘', command()), ('c', '鱼塘', command()))
+    assert [result[0] for result in results] == ['o', '⏳', 'o', '⏳', 'o', '🚧']
+    assert admission.get_stats()['rejections'] == {'钓鱼:command': 1, '鱼塘:user': 1, '鱼塘:global': 1}
+
+
+def test_rejected_request_keeps_other_tokens():
+    admission = controller(user_burst=1, global_burst=10, commands={'钓鱼': {'burst': 5, 'rate': 0}})
+    run(admission, ('a', '鱼塘', command()))
+    # 用户桶已空，之后的钓鱼被按用户拒绝，不应扣除钓鱼命令桶和全局桶的令牌
+    run(admission, ('a', '钓鱼', command()), ('a', '钓鱼', command()))
+    assert admission.get_stats()['rejections'] == {'钓鱼:user': 2}
+    assert admission.buckets[('a', '钓鱼')].tokens == 5
+    assert admission.global_bucket.tokens == 9
+
+
+def test_concurrency_rejection_keeps_tokens():
+    admission = controller(user_burst=5, global_burst=10, max_concurrency=1)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'slow'
+
+    async def main():
+        first = asyncio.ensure_future(admission.run('a', '钓鱼', slow))
+        await asyncio.sleep(0)
+        second = await admission.run('b', '钓鱼', command())
+        release.set()
+        return await first, second
+
+    first, second = asyncio.run(main())
+    assert first == 'slow' and second.startswith('🚧')
+    assert admission.get_stats()['rejections'] == {'钓鱼:concurrency': 1}
+    assert admission.buckets[('b', None)].tokens == 5
+    assert admission.global_bucket.tokens == 9
+
+
+def test_same_user_commands_run_in_arrival_order():
+    admission = controller(user_burst=10, global_burst=10)
+    events = []
+    lock = threading.Lock()
+
+    def step(name: str, delay: float):
+        def func():
+            with lock:
+                events.append(('start', name))
+            time.sleep(delay)
+            with lock:
+                events.append(('end', name))
+            return name
+        return func
+
+    results = run(admission, ('a', '钓鱼', step('first', 0.05)), ('a', '钓鱼', step('second', 0)),
+                  ('a', '卖鱼', step('third', 0)))
+    assert results == ['first', 'second', 'third']
+    assert events == [('start', 'first'), ('end', 'first'), ('start', 'second'), ('end', 'second'),
+                      ('start', 'third'), ('end', 'third')]
+    assert admission.user_tails == {}
+
+
+def test_disabled_controller_runs_directly():
+    admission = controller(enabled=False, user_burst=0)
+    assert run(admission, ('a', '钓鱼', command('done'))) == ['done']
+    assert admission.get_stats()['rejections'] == {}
@@ -0,0 +1,54 @@
+"""全服统计的增量维护与全表重新统计一致，SQLite和内存两种存储引擎各运行一遍"""
+from fishing.market import FishMarket
+
+CARP, TUNA = 1, 7
+NOW = 1_700_000_000
+
+
+def give_coins(db, user_id: str, amount: int) -> None:
+    db.get_user_coins(user_id)  # 首次查询时创建用户
+    db.update_user_coins(user_id, amount)
+
+
+def test_incremental_stats_match_rebuild(db):
+    db.initialize_fish_types([(CARP, '鲤鱼', 2, 20, 500, 3000, 'fresh'),
+                              (TUNA, '金枪鱼', 4, 300, 1000, 5000, 'sea')])
+    for user_id in ('alice', 'bob', 'carol'):
+        give_coins(db, user_id, 1000)
+    db.set_auto_fishing_status('alice', True)
+    db.set_auto_fishing_status('bob', True)
+    db.set_auto_fishing_status('bob', False)
+
+    # 钓鱼
+    for _ in range(5):
+        db.add_fish_to_pond('alice', CARP)
+    for weight in (1200, 3400, 2600):
+        db.add_fish_to_pond('alice', TUNA, weight)
+    db.add_fish_to_pond('bob', CARP)
+
+    # 卖鱼: 卖光bob的鲤鱼后不再计入持有人数
+    db.remove_fish_from_pond('alice', CARP, 2)
+    db.update_user_coins('alice', 40, 'sell')
+    db.remove_fish_from_pond('bob', CARP, 1)
+    db.update_user_coins('bob', 20, 'sell')
+
+    # 偷鱼
+    result = db.steal_fish('carol', 'alice', 0.5, NOW, cooldown=0, lock_duration=1800, min_rarity=3)
+    assert result['status'] == 'ok'
+
+    # 市场: 部分成交、撤单退还，以及一笔挂着的买单(托管金币)
+    market = FishMarket(db, {'market': {'flush_interval': 3600}})
+    try:
+        order = market.place_order('alice', CARP, 'sell', 30, 3)
+        market.place_order('bob', CARP, 'buy', 30, 2)
+        market.flush()
+        market.cancel_order('alice', order['order_id'])
+        market.place_order('carol', TUNA, 'buy', 100, 1)
+        market.flush()
+    finally:
+        market.stop()
+
+    stats = db.get_global_stats()
+    assert stats['users'] == 3 and stats['auto_fishers'] == 1
+    assert stats['fish'][TUNA] == {'quantity': 3, 'holders': 2}
+    assert db.rebuild_global_stats() == stats
@@ -0,0 +1,27 @@
+"""金币流水与对账"""
+from fishing.db import FishingDB
+
+
+def test_reconcile_after_coin_changes(db):
+    db.get_user_coins('alice')
+    db.update_user_coins('alice', 30, 'test')
+    db.update_user_coins('alice', -10, 'test')
+    result = db.reconcile_coins()
+    assert result['mismatches'] == []
+    assert result['users'] == 1
+
+
+def test_reconcile_sees_changes_from_another_connection(tmp_path):
+    path = str(tmp_path / 'fishing.db')
+    setup = FishingDB(path)
+    setup.get_user_coins('alice')
+    setup.close()
+
+    writer, reconciler = FishingDB(path), FishingDB(path)
+    # 另一个连接(或进程)提交的余额变动，对账时它的流水必须已经可见
+    writer.update_user_coins('alice', 30, 'test')
+    assert reconciler.reconcile_coins()['mismatches'] == []
+    writer.update_user_coins('alice', -5, 'test')
+    assert reconciler.reconcile_coins()['mismatches'] == []
+    writer.close()
+    reconciler.close()
@@ -0,0 +1,147 @@
+"""市场订单簿与托管资产的测试，SQLite和内存两种存储引擎各运行一遍"""
+import pytest
+
+from fishing.market import FishMarket, Order, OrderBook
+
+FISH_ID = 1
+CONFIG = {'market': {'flush_interval': 3600}}
+
+
+@pytest.fixture
+def market(db):
+    market = FishMarket(db, CONFIG)
+    yield market
+    market.stop()
+
+
+def give_coins(db, user_id: str, amount: int) -> None:
+    db.get_user_coins(user_id)  # 首次查询时创建用户
+    db.update_user_coins(user_id, amount)
+
+
+def give_fish(db, user_id: str, quantity: int) -> None:
+    for _ in range(quantity):
+        db.add_fish_to_pond(user_id, FISH_ID)
+
+
+def test_order_book_price_time_priority():
+    book = OrderBook(FISH_ID)
+    book.add(Order(1, 'a', FISH_ID, 'sell', 12, 1, 0))
+    book.add(Order(2, 'b', FISH_ID, 'sell', 10, 1, 0))
+    book.add(Order(3, 'c', FISH_ID, 'sell', 10, 1, 0))
+    fills = book.match(Order(4, 'd', FISH_ID, 'buy', 11, 3, 0))
+    assert [(contra.id, price, quantity) for contra, price, quantity in fills] == [(2, 10, 1), (3, 10, 1)]
+    assert book.depth('sell') == [(12, 1)]
+
+
+def test_fill_settles_both_sides(db, market):
+    give_fish(db, 'seller', 3)
+    give_coins(db, 'buyer', 1000)
+    coins = db.get_user_coins('buyer')
+
+    market.place_order('seller', FISH_ID, 'sell', 50, 3)
+    result = market.place_order('buyer', FISH_ID, 'buy', 60, 3)
+    market.flush()
+
+    assert result['filled'] == 3 and result['amount'] == 150
+    assert db.get_user_fish_quantity('buyer', FISH_ID) == 3
+    assert db.get_user_coins('buyer') == coins - 150  # 按卖单价成交，差价退还
+    assert db.get_open_market_orders() == []
+
+
+def test_cancel_partially_filled_sell_order_returns_remainder(db, market):
+    give_fish(db, 'seller', 5)
+    give_coins(db, 'buyer', 1000)
+    seller_coins = db.get_user_coins('seller')
+
+    order = market.place_order('seller', FISH_ID, 'sell', 50, 5)
+    market.place_order('buyer', FISH_ID, 'buy', 50, 2)
+    # 部分成交尚未落盘时撤单
+    cancelled = market.cancel_order('seller', order['order_id'])
+
+    assert cancelled['remaining'] == 3
+    assert db.get_user_fish_quantity('seller', FISH_ID) == 3
+    assert db.get_user_fish_quantity('buyer', FISH_ID) == 2
+    assert db.get_user_coins('seller') == seller_coins + 100
+    assert db.get_open_market_orders() == []
+    assert market.get_user_orders('seller') == []
+
+
+def test_cancel_sell_order_returns_weight_records(db, market):
+    for weight in (100, 400, 300, 200):
+        db.add_fish_to_pond('seller', FISH_ID, weight)
+    give_coins(db, 'buyer', 1000)
+
+    order = market.place_order('seller', FISH_ID, 'sell', 50, 4)
+    assert db.get_user_catches('seller', FISH_ID).count == 0
+    market.place_order('buyer', FISH_ID, 'buy', 50, 1)
+    market.cancel_order('seller', order['order_id'])
+
+    # 成交的一条按最轻的计算，其余标本连同重量退还
+    catches = db.get_user_catches('seller', FISH_ID)
+    assert list(catches.weights) == [400, 300, 200]
+    assert catches.unknown == 0
+
+
+def test_cancel_partially_filled_buy_order_refunds_remainder(db, market):
+    give_fish(db, 'seller', 2)
+    give_coins(db, 'buyer', 1000)
+    coins = db.get_user_coins('buyer')
+
+    order = market.place_order('buyer', FISH_ID, 'buy', 40, 5)
+    market.place_order('seller', FISH_ID, 'sell', 40, 2)
+    cancelled = market.cancel_order('buyer', order['order_id'])
+
+    assert cancelled['remaining'] == 3
+    assert db.get_user_coins('buyer') == coins - 80
+    assert db.get_user_fish_quantity('buyer', FISH_ID) == 2
+
+
+def test_cancel_after_flush_and_reload(db):
+    give_fish(db, 'seller', 4)
+    give_coins(db, 'buyer', 1000)
+    market = FishMarket(db, CONFIG)
+    order = market.place_order('seller', FISH_ID, 'sell', 30, 4)
+    market.place_order('buyer', FISH_ID, 'buy', 30, 1)
+    market.stop()
+
+    # 重新加载后订单簿从数据库恢复剩余数量
+    market = FishMarket(db, CONFIG)
+    assert [o.remaining for o in market.get_user_orders('seller')] == [3]
+    assert market.cancel_order('seller', order['order_id'])['remaining'] == 3
+    market.stop()
+    assert db.get_user_fish_quantity('seller', FISH_ID) == 3
+
+
+def test_cancel_rejects_other_users_order(db, market):
+    give_fish(db, 'seller', 1)
+    order = market.place_order('seller', FISH_ID, 'sell', 10, 1)
+    assert market.cancel_order('someone', order['order_id']) is None
+    assert market.get_open_order_count('seller') == 1
+
+
+@pytest.mark.parametrize('side, quantity, price', [
+    ('buy', 1, 10 ** 19),
+    ('buy', 2, 2 ** 62),
+    ('sell', 1, 10 ** 19),
+    ('buy', 10 ** 19, 1),
+    ('buy', 0, 10),
+])
+def test_out_of_range_order_is_rejected(system, side, quantity, price):
+    fish = next(iter(system.catalog.by_name.values()))
+    system.db.add_fish_to_pond('u1', fish['id'])
+    assert system.place_market_order('u1', side, fish['name'], quantity, price) == "❌ 请输入正确的数量和单价"
+    assert system.db.get_open_market_orders() == []
+
+
+def test_orders_and_quotes_resolve_partial_names(system):
+    fish = system.catalog.by_name['石斑鱼']
+    system.db.add_fish_to_pond('u1', fish['id'])
+    assert system.place_market_order('u1', 'sell', '石斑', 1, 100).startswith("📋 挂单成功")
+    assert [order['fish_id'] for order in system.db.get_open_market_orders()] == [fish['id']]
+    assert system.show_market('u1', '石斑').startswith("📈 「石斑鱼」盘口")
+
+    # 有歧义或找不到时与卖鱼相同的提示
+    assert system.show_market('u1', '小') == system.resolve_fish_name('小')[1]
+    assert system.place_market_order('u1', 'buy', '小', 1, 10).startswith("❓「小」匹配到多种鱼")
+    assert system.place_market_order('u1', 'buy', 'zzz', 1, 10) == "❌ 没有找到名为「zzz」的鱼"
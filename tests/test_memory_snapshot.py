@@ -0,0 +1,32 @@
+"""内存存储的快照保存与恢复"""
+import os
+
+from fishing.memory_db import MemoryFishingDB
+
+FISH_ID = 1
+
+
+def weights(db, user_id: str):
+    return list(db.get_user_catches(user_id, FISH_ID).weights)
+
+
+def test_snapshot_keeps_catches_changed_after_previous_save(tmp_path):
+    path = str(tmp_path / 'fishing.snapshot')
+    db = MemoryFishingDB(path)
+    for weight in (300, 100, 200):
+        db.add_fish_to_pond('alice', FISH_ID, weight)
+    db.add_fish_to_pond('bob', FISH_ID, 500)
+    db.save_snapshot()
+
+    # 保存之后修改、删除和新增的记录都要写入下一份快照
+    db.remove_fish_from_pond('alice', FISH_ID, 1)
+    db.remove_fish_from_pond('bob', FISH_ID, 1)
+    db.add_fish_to_pond('carol', FISH_ID, 400)
+    db.close()
+    assert not os.path.exists(path + '.tmp')
+
+    db = MemoryFishingDB(path)
+    assert weights(db, 'alice') == [300, 200]
+    assert weights(db, 'bob') == []
+    assert weights(db, 'carol') == [400]
+    db.close()
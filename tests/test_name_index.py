@@ -0,0 +1,36 @@
+"""鱼名索引"""
+from fishing import name_index
+from fishing.name_index import FishNameIndex
+
+# 测试用的拼音表，不依赖是否安装了 pypinyin
+PINYIN = {'剑': 'jian', '鲸': 'jing', '鱼': 'yu', '带': 'dai', '鲷': 'diao', '金': 'jin', '枪': 'qiang'}
+
+
+def fake_pinyin(name):
+    return [PINYIN.get(char, char) for char in name]
+
+
+def test_exact_and_prefix():
+    index = FishNameIndex(['金枪鱼', '金鱼', '鲸鱼'])
+    assert index.lookup('金鱼') == ('金鱼', [], False)
+    assert index.lookup('金枪') == ('金枪鱼', [], False)
+    name, candidates, ambiguous = index.lookup('金')
+    assert name is None and ambiguous and set(candidates) == {'金枪鱼', '金鱼'}
+
+
+def test_pinyin_initials_collision_is_ambiguous(monkeypatch):
+    monkeypatch.setattr(name_index, 'lazy_pinyin', fake_pinyin)
+    index = FishNameIndex(['剑鱼', '鲸鱼', '带鱼', '鲷鱼'])
+    name, candidates, ambiguous = index.lookup('jy')
+    assert name is None and ambiguous and candidates == ['剑鱼', '鲸鱼']
+    name, candidates, ambiguous = index.lookup('dy')
+    assert name is None and ambiguous and candidates == ['带鱼', '鲷鱼']
+    # 全拼不冲突时仍能直接找到
+    assert index.lookup('jingyu')[0] == '鲸鱼'
+    assert index.lookup('diaoyu')[0] == '鲷鱼'
+
+
+def test_full_name_wins_over_other_pinyin(monkeypatch):
+    monkeypatch.setattr(name_index, 'lazy_pinyin', fake_pinyin)
+    index = FishNameIndex(['剑鱼', 'jy'])
+    assert index.lookup('jy')[0] == 'jy'
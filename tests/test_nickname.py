@@ -0,0 +1,125 @@
+"""昵称服务: 缓存过期、批量查询、攒批保存以及插件停止时写入未保存的昵称"""
+import os
+import asyncio
+
+import pytest
+
+from fishing import nickname
+from fishing.db import FishingDB
+from fishing.nickname import NicknameService
+
+
+class Clock:
+    """可手动拨动的 time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Backend:
+    """记录每次批量查询和保存的昵称存储替身"""
+
+    def __init__(self, nicknames=None):
+        self.nicknames = dict(nicknames or {})
+        self.queries = []
+        self.saves = []
+
+    def resolve(self, user_ids):
+        self.queries.append(list(user_ids))
+        return {user_id: self.nicknames[user_id] for user_id in user_ids if user_id in self.nicknames}
+
+    def save(self, pairs):
+        self.saves.append(list(pairs))
+        self.nicknames.update(pairs)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(nickname.time, 'monotonic', clock)
+    return clock
+
+
+def service(backend: Backend, **options) -> NicknameService:
+    return NicknameService(backend.resolve, backend.save, **options)
+
+
+def test_cache_and_negative_cache_expire(clock):
+    backend = Backend({'a': '阿强'})
+    names = service(backend, ttl=60, negative_ttl=10)
+    assert names.get('a') == '阿强'
+    assert names.get('b') == 'b'
+    assert names.get('a') == '阿强' and names.get('b') == 'b'
+    assert backend.queries == [['a'], ['b']]
+
+    # 负缓存先过期，查不到的用户之后有了昵称也能查到
+    backend.nicknames['b'] = '阿宾'
+    clock.now += 11
+    assert names.get('a') == '阿强'
+    assert names.get('b') == '阿宾'
+    assert backend.queries == [['a'], ['b'], ['b']]
+
+    clock.now += 50
+    backend.nicknames['a'] = '强哥'
+    assert names.get('a') == '强哥'
+    assert backend.queries[-1] == ['a']
+
+
+def test_resolve_many_batches_misses(clock):
+    backend = Backend({'a': '阿强', 'c': '小陈'})
+    names = service(backend)
+    names.get('a')
+
+    async def main():
+        return await asyncio.gather(names.resolve_many(['a', 'b', 'c', 'b']), names.resolve_many(['c', 'b']))
+
+    first, second = asyncio.run(main())
+    assert first == {'a': '阿强', 'b': 'b', 'c': '小陈'}
+    assert second == {'c': '小陈', 'b': 'b'}
+    # 第二个请求等待第一个请求中的查询，未命中的用户只查询一次
+    assert backend.queries == [['a'], ['b', 'c']]
+
+
+def test_observed_nicknames_saved_in_batches(clock):
+    backend = Backend()
+    names = service(backend, save_batch_size=3, save_interval=30)
+    names.remember('a', '阿强')
+    names.remember('b', '阿宾')
+    names.remember('a', '阿强')  # 未变化的昵称不再保存
+    assert backend.saves == []
+    names.remember('c', '小陈')
+    assert backend.saves == [[('a', '阿强'), ('b', '阿宾'), ('c', '小陈')]]
+
+    # 距离上次保存超过间隔后，即使不满一批也会保存
+    names.remember('a', '强哥')
+    assert len(backend.saves) == 1
+    clock.now += 31
+    names.remember('d', '大东')
+    assert backend.saves[1:] == [[('a', '强哥'), ('d', '大东')]]
+    assert names.get('a') == '强哥'
+    assert backend.queries == []
+
+
+def test_terminate_flushes_pending_nicknames(tmp_path, monkeypatch):
+    benchmarks = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+    monkeypatch.syspath_prepend(benchmarks)
+    monkeypatch.chdir(tmp_path)
+    harness = pytest.importorskip('harness')
+    from astrbot_stub import AstrMessageEvent
+
+    async def main():
+        plugin = harness.create_plugin({'storage': {'engine': 'sqlite'}})
+        path = plugin.fishing_system.db.db_path
+        async for _ in plugin.weather(AstrMessageEvent('u1', '/天气', nickname='阿强')):
+            pass
+        assert plugin.nicknames.pending == {'u1': '阿强'}
+        await plugin.terminate()
+        return path
+
+    path = asyncio.run(main())
+    db = FishingDB(path)
+    assert db.get_nicknames(['u1']) == {'u1': '阿强'}
+    db.close()
@@ -0,0 +1,35 @@
+"""随机数流的淘汰与启动序号"""
+from fishing.rng import RandomStreams
+
+
+def test_recreated_stream_does_not_replay():
+    streams = RandomStreams({'rng': {'seed': 1, 'max_streams': 2}})
+    first = streams.stream('alice').uniforms(16)
+    streams.stream('bob')
+    streams.stream('carol')  # 淘汰最久未使用的 alice
+    assert 'alice' not in streams.streams
+    assert set(streams.stream('alice').uniforms(16)).isdisjoint(first)
+    assert len(streams.streams) == 2
+
+
+def test_recently_used_stream_is_kept():
+    streams = RandomStreams({'rng': {'seed': 1, 'max_streams': 2}})
+    alice = streams.stream('alice')
+    streams.stream('bob')
+    streams.stream('alice')
+    streams.stream('carol')
+    assert streams.stream('alice') is alice
+    assert 'bob' not in streams.streams
+
+
+def test_seeded_restart_does_not_replay(tmp_path):
+    config = {'database': str(tmp_path / 'fishing.db'), 'rng': {'seed': 1}}
+    first = RandomStreams(config, 'fishing').stream('alice').uniforms(8)
+    second = RandomStreams(config, 'fishing').stream('alice').uniforms(8)
+    assert first != second
+
+    # 新目录中的第一次启动与未记录序号时相同，压测和回放仍可复现
+    fresh = {'database': str(tmp_path / 'other' / 'fishing.db'), 'rng': {'seed': 1}}
+    (tmp_path / 'other').mkdir()
+    assert RandomStreams(fresh, 'fishing').stream('alice').uniforms(8) == first
+    assert RandomStreams({'rng': {'seed': 1}}, 'fishing').stream('alice').uniforms(8) == first
@@ -0,0 +1,31 @@
+"""慢命令栈采样"""
+import time
+
+from fishing.slow_profiler import SlowCommandProfiler
+
+
+def busy(seconds: float) -> str:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+    return 'done'
+
+
+def test_slow_command_samples_are_saved(tmp_path):
+    profiler = SlowCommandProfiler({'slow_profiler': {
+        'enabled': True, 'threshold': 0.05, 'interval': 0.002, 'directory': str(tmp_path)}})
+    profiler.start()
+    try:
+        assert profiler.run('钓鱼', busy, 0.2) == 'done'
+        assert profiler.run('鱼塘', busy, 0) == 'done'
+    finally:
+        profiler.stop()
+
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1 and '钓鱼' in files[0].name
+    lines = files[0].read_text(encoding='utf-8').splitlines()
+    sampled = int(next(line for line in lines if line.startswith('# 采样:')).split(':')[1].split('次')[0])
+    stacks = [line for line in lines if not line.startswith('#')]
+    assert sampled > 0
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in stacks) == sampled
+    assert any('busy' in line for line in stacks)
@@ -0,0 +1,18 @@
+"""SQL语句统计的形状归并与慢语句日志"""
+from fishing.sql_profiler import SqlProfiler, normalize
+
+
+def test_normalize_merges_literals():
+    assert normalize("SELECT coins FROM user_fishing WHERE user_id = 'alice' AND fish_id IN (1, 2, 3)") == \
+        normalize("SELECT  coins FROM user_fishing WHERE user_id = 'bob' AND fish_id IN (4, 5)")
+
+
+def test_slow_log_does_not_contain_parameters(tmp_path):
+    path = tmp_path / 'slow_sql.log'
+    profiler = SqlProfiler({'sql_profiler': {'slow_ms': 0, 'slow_log': str(path)}}, 'fishing')
+    profiler.record("UPDATE user_fishing SET coins = coins + 120 WHERE user_id = 'alice'", 0.1, 500, 1)
+
+    line = path.read_text(encoding='utf-8')
+    assert 'alice' not in line and '120' not in line
+    assert line.rstrip('\n').endswith("UPDATE user_fishing SET coins = coins + ? WHERE user_id = ?")
+    assert profiler.slow_count == 1
@@ -0,0 +1,51 @@
+"""偷鱼的禁售期，SQLite和内存两种存储引擎各运行一遍"""
+import pytest
+
+FISH_ID = 7
+NOW = 1_700_000_000
+LOCK = 1800
+
+
+@pytest.fixture
+def pond(db):
+    db.initialize_fish_types([(FISH_ID, '金枪鱼', 4, 300, 1000, 5000, 'sea')])
+    db.add_fish_to_pond('victim', FISH_ID)
+    db.add_fish_to_pond('victim', FISH_ID)
+    return db
+
+
+def steal(db):
+    return db.steal_fish('thief', 'victim', 0.0, NOW, cooldown=0, lock_duration=LOCK, min_rarity=3)
+
+
+def test_stolen_fish_is_locked_when_thief_has_none(pond):
+    result = steal(pond)
+    assert result['status'] == 'ok' and result['locked']
+    assert pond.get_user_fish_quantity('thief', FISH_ID) == 1
+
+
+def test_stolen_fish_does_not_lock_existing_stock(pond):
+    pond.add_fish_to_pond('thief', FISH_ID)
+    result = steal(pond)
+    assert result['status'] == 'ok' and result['locked']
+    assert pond.get_user_fish_quantity('thief', FISH_ID) == 2
+    # 原有的鱼仍可挂单出售，偷来的鱼在禁售期内不能
+    assert pond.create_market_order('thief', FISH_ID, 'sell', 100, 2, NOW) is None
+    assert pond.create_market_order('thief', FISH_ID, 'sell', 100, 1, NOW) is not None
+    assert pond.create_market_order('thief', FISH_ID, 'sell', 100, 1, NOW + 60) is None
+    assert pond.create_market_order('thief', FISH_ID, 'sell', 100, 1, NOW + LOCK) is not None
+
+
+def test_locked_stolen_fish_cannot_be_stolen_again(pond):
+    steal(pond)
+    # 偷鱼者鱼塘里只有禁售中的鱼，不能被再次偷走
+    result = pond.steal_fish('victim', 'thief', 0.0, NOW + 60, cooldown=0, lock_duration=LOCK, min_rarity=3)
+    assert result['status'] == 'empty'
+
+
+def test_lock_extends_while_stock_is_locked(pond):
+    assert steal(pond)['locked']
+    result = pond.steal_fish('thief', 'victim', 0.0, NOW + 60, cooldown=0, lock_duration=LOCK, min_rarity=3)
+    assert result['status'] == 'ok' and result['locked']
+    assert pond.create_market_order('thief', FISH_ID, 'sell', 100, 1, NOW + LOCK) is None
+    assert pond.create_market_order('thief', FISH_ID, 'sell', 100, 2, NOW + 60 + LOCK) is not None